@@ -1,8 +1,9 @@
 """Main python API."""
+import dataclasses
 import socket
 import tempfile
 from datetime import datetime
-from itertools import product
+from itertools import groupby, product
 from pathlib import Path
 from typing import Iterator, Literal
 
@@ -36,6 +37,8 @@ from cdsobs.ingestion.core import (
     TimeBatch,
     TimeSpaceBatch,
 )
+from cdsobs.ingestion.journal import IngestionJournal, get_batch_id
+from cdsobs.ingestion.melt import GENERATED_OBSERVATION_ID
 from cdsobs.ingestion.notify import notify_to_slack
 from cdsobs.ingestion.partition import get_partitions, save_partitions
 from cdsobs.ingestion.serialize import serialize_partition
@@ -46,11 +49,18 @@ from cdsobs.observation_catalogue.repositories.dataset import CadsDatasetReposit
 from cdsobs.observation_catalogue.repositories.dataset_version import (
     CadsDatasetVersionRepository,
 )
+from cdsobs.observation_catalogue.repositories.ingestion_watermark import (
+    IngestionWatermarkRepository,
+)
+from cdsobs.observation_catalogue.repositories.version_stamp import (
+    VersionStampRepository,
+)
 from cdsobs.retrieve.filter_datasets import between
 from cdsobs.service_definition.api import get_service_definition
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.storage import S3Client
 from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import gather_categorical
 
 logger = get_logger(__name__)
 
@@ -67,6 +77,7 @@ def run_ingestion_pipeline(
     disable_cdm_tag_check: bool = False,
     slack_notify: bool = False,
     service_definition: ServiceDefinition | None = None,
+    incremental: bool = False,
 ):
     """
     Ingest the data to the CADS observation repository.
@@ -101,6 +112,10 @@ def run_ingestion_pipeline(
     slack_notify:
         Notify to slack channel defined by CADSOBS_SLACK_CHANNEL and CADSOBS_SLACK_HOOK
         environment variables.
+    incremental:
+      Only ingest the data not older than the last report_timestamp ingested for
+      this dataset, source and version (the watermark). The new data is appended to
+      the partitions that already exist, which are rewritten.
     """
     hostname = socket.gethostname()
     logger.info("----------------------------------------------------------------")
@@ -110,22 +125,19 @@ def run_ingestion_pipeline(
         service_definition = get_service_definition(config, dataset_name)
     _maybe_check_cdm_tag(config, disable_cdm_tag_check)
     run_params = IngestionRunParams(
-        dataset_name, source, version, config, service_definition
+        dataset_name, source, version, config, service_definition, incremental
     )
 
-    def _run_for_batch(time_space_batch):
+    def _run_for_batch(time_space_batches: list[TimeSpaceBatch]):
+        time_batch = time_space_batches[0].time_batch
         try:
-            _run_ingestion_pipeline_for_batch(
-                run_params,
-                session,
-                time_space_batch,
+            _run_ingestion_pipeline_for_time_batch(
+                run_params, session, time_space_batches
             )
-        except EmptyBatchException:
-            logger.warning(f"Data not found for {time_space_batch=}")
         except (KeyboardInterrupt, MemoryError) as e:
             message = (
                 f"Ingestion pipeline for {run_params} {start_year=} {end_year=} "
-                f"running at {hostname} as been canceled at {time_space_batch}"
+                f"running at {hostname} as been canceled at {time_batch}"
                 f"with {e}"
             )
             logger.error(message)
@@ -135,7 +147,7 @@ def run_ingestion_pipeline(
         except Exception as e:
             message = (
                 f"Ingestion pipeline for {run_params} {start_year=} {end_year=} "
-                f"running at {hostname} as failed {time_space_batch} with {e}"
+                f"running at {hostname} as failed {time_batch} with {e}"
             )
             logger.error(message)
             if slack_notify:
@@ -152,9 +164,10 @@ def run_ingestion_pipeline(
         start_month=start_month,
     )
 
-    for time_space_batch in main_iterator:
-        logger.info(f"Running ingestion pipeline for {time_space_batch}")
-        _run_for_batch(time_space_batch)
+    # The spatial tiles of each time batch are ingested together, as they share the
+    # watermark.
+    for _, time_space_batches in groupby(main_iterator, key=lambda b: b.time_batch):
+        _run_for_batch(list(time_space_batches))
 
     # Run sanity check
     _run_sanity_check(
@@ -165,6 +178,8 @@ def run_ingestion_pipeline(
     _upload_service_definition(
         S3Client.from_config(config.s3config), service_definition, dataset_name
     )
+    # Invalidate the responses of the HTTP API for this dataset
+    VersionStampRepository(session).bump(dataset_name)
 
     # Log successful, taking the warnings into account
     final_message = _print_final_message(
@@ -253,11 +268,16 @@ def _run_sanity_check(
     print(stats)
     assert stats["number of partitions"] >= 1
     assert stats["number of stations"] >= 1
-    # This may fail is the make production is partial, and a variable is missing for
-    # the years that are being read.
-    assert set(stats["available variables"]) == set(
-        service_definition.sources[source].main_variables
-    )
+    # The entries only have the variables with data, so some may be missing if the
+    # make production is partial or the source has no data for them in these years.
+    available_variables = set(stats["available variables"])
+    main_variables = set(service_definition.sources[source].main_variables)
+    assert available_variables.issubset(main_variables)
+    if available_variables != main_variables:
+        logger.warning(
+            f"{sorted(main_variables - available_variables)} have no data in the "
+            f"catalogue entries checked."
+        )
     # Now we will check the metadata in the largest partition uploaded
     largest_entry = max(entries, key=lambda x: x.data_size)
     s3_client = S3Client.from_config(config.s3config)
@@ -360,10 +380,48 @@ def run_make_cdm(
     _print_final_message(dataset_name, source, start_year, end_year, "make cdm")
 
 
+def _run_ingestion_pipeline_for_time_batch(
+    run_params: IngestionRunParams,
+    session: Session,
+    time_space_batches: list[TimeSpaceBatch],
+):
+    """
+    Ingest the spatial tiles of a time batch.
+
+    The watermark is the same for all the spatial tiles of the source, so it is read
+    before the first tile and only moved forward once all of them are saved.
+    Otherwise the first tile would move it to the end of the time batch, and the data
+    of the next tiles would be dropped as older than the watermark.
+    """
+    dataset_name = run_params.dataset_name
+    source = run_params.source
+    version = run_params.version
+    watermark_repo = IngestionWatermarkRepository(session)
+    watermark = None
+    if run_params.incremental:
+        watermark = watermark_repo.get_watermark(dataset_name, source, version)
+        logger.info(f"Ingesting data not older than {watermark=}")
+    last_timestamps: list[datetime] = []
+    for time_space_batch in time_space_batches:
+        logger.info(f"Running ingestion pipeline for {time_space_batch}")
+        try:
+            _run_ingestion_pipeline_for_batch(
+                run_params, session, time_space_batch, watermark, last_timestamps
+            )
+        except EmptyBatchException:
+            logger.warning(f"Data not found for {time_space_batch=}")
+    if len(last_timestamps) > 0:
+        watermark_repo.update_watermark(
+            dataset_name, source, version, max(last_timestamps)
+        )
+
+
 def _run_ingestion_pipeline_for_batch(
     run_params: IngestionRunParams,
     session: Session,
     time_space_batch: TimeSpaceBatch,
+    watermark: datetime | None = None,
+    last_timestamps: list[datetime] | None = None,
 ):
     """
     Ingest the data for a given year and month, specified by TimeBatch.
@@ -378,27 +436,88 @@ def _run_ingestion_pipeline_for_batch(
       Session on the catalogue database
     time_space_batch:
       Optionally read data only for one year and month
+    watermark:
+      Only the data not older than this is ingested, if given.
+    last_timestamps:
+      If given, the last report_timestamp of each partition saved is appended to it.
     """
     dataset_name = run_params.dataset_name
     source = run_params.source
     version = run_params.version
-    config = run_params.config
-    if entry_exists(dataset_name, session, source, time_space_batch, version):
+    journal = IngestionJournal(
+        session,
+        dataset_name,
+        source,
+        version,
+        get_batch_id(time_space_batch, watermark),
+    )
+    if watermark is not None and watermark >= time_space_batch.get_time_coverage()[1]:
+        logger.info("The data of this batch is older than the watermark, skipping.")
+    elif journal.has_pending_partitions():
+        # A previous run was interrupted, the batch is read again but only the
+        # partitions not committed yet are saved.
+        logger.warning("Resuming the ingestion of a partially ingested batch.")
+        _ingest_batch(
+            run_params, session, time_space_batch, watermark, journal, last_timestamps
+        )
+    elif run_params.incremental and journal.is_batch_committed():
+        logger.info("This batch has been already ingested, skipping.")
+    elif not run_params.incremental and entry_exists(
+        dataset_name, session, source, time_space_batch, version
+    ):
         logger.warning(
             "A partition with the chosen parameters already exists and update is set to False."
         )
     else:
-        sorted_partitions = _read_homogenise_and_partition(run_params, time_space_batch)
-        # Create dataset if it does not exist
-        cads_dataset_repo = CadsDatasetRepository(session)
-        cads_dataset_repo.create_dataset(dataset_name=dataset_name)
-        # Create dataset version if it does not exist
-        cads_dataset_version_repo = CadsDatasetVersionRepository(session)
-        cads_dataset_version_repo.create_dataset_version(dataset_name, version=version)
-        logger.info("Partitioning data and saving to storage")
-        s3_client = S3Client.from_config(config.s3config)
-        logger.debug(f"Getting client to S3 storage: {s3_client}")
-        save_partitions(session, s3_client, sorted_partitions)
+        _ingest_batch(
+            run_params, session, time_space_batch, watermark, journal, last_timestamps
+        )
+
+
+def _ingest_batch(
+    run_params: IngestionRunParams,
+    session: Session,
+    time_space_batch: TimeSpaceBatch,
+    watermark: datetime | None,
+    journal: IngestionJournal,
+    last_timestamps: list[datetime] | None = None,
+):
+    """Read, partition and save the data of a batch, writing the progress in journal."""
+    dataset_name = run_params.dataset_name
+    version = run_params.version
+    config = run_params.config
+    sorted_partitions = _read_homogenise_and_partition(
+        run_params, time_space_batch, watermark
+    )
+    # Create dataset if it does not exist
+    cads_dataset_repo = CadsDatasetRepository(session)
+    cads_dataset_repo.create_dataset(dataset_name=dataset_name)
+    # Create dataset version if it does not exist
+    cads_dataset_version_repo = CadsDatasetVersionRepository(session)
+    cads_dataset_version_repo.create_dataset_version(dataset_name, version=version)
+    logger.info("Partitioning data and saving to storage")
+    s3_client = S3Client.from_config(config.s3config)
+    logger.debug(f"Getting client to S3 storage: {s3_client}")
+    if last_timestamps is not None:
+        sorted_partitions = _track_last_timestamp(sorted_partitions, last_timestamps)
+    save_partitions(
+        session,
+        s3_client,
+        sorted_partitions,
+        append=run_params.incremental,
+        journal=journal,
+    )
+    journal.commit_batch()
+
+
+def _track_last_timestamp(
+    partitions: Iterator[DatasetPartition], last_timestamps: list[datetime]
+) -> Iterator[DatasetPartition]:
+    """Yield the partitions, appending the last report_timestamp of each one."""
+    for partition in partitions:
+        last_timestamp = partition.data["report_timestamp"].max()
+        last_timestamps.append(last_timestamp.to_pydatetime())
+        yield partition
 
 
 def _get_main_iterator(
@@ -465,6 +584,7 @@ def _get_space_iterator(
 def _read_homogenise_and_partition(
     run_params: IngestionRunParams,
     time_space_batch: TimeSpaceBatch,
+    watermark: datetime | None = None,
 ) -> Iterator[DatasetPartition]:
     config = run_params.config
     service_definition = run_params.service_definition
@@ -475,6 +595,12 @@ def _read_homogenise_and_partition(
     homogenised_data = read_batch_data(
         config, dataset_metadata, service_definition, time_space_batch
     )
+    if homogenised_data.attrs.get(GENERATED_OBSERVATION_ID, False):
+        dataset_metadata = dataclasses.replace(
+            dataset_metadata, generated_observation_id=True
+        )
+    if watermark is not None:
+        homogenised_data = _filter_by_watermark(homogenised_data, watermark)
     # Validate that times are inside the time batch
     _validate_time_interval(homogenised_data, time_space_batch.time_batch)
     # Check CDM compliance
@@ -508,40 +634,63 @@ def _handle_units(
     # Define units id not present and apply unit changes
     source_definition = service_definition.sources[source]
     if "units" not in homogenised_data.columns:
-        homogenised_data = define_units(
-            homogenised_data,
-            source_definition,
-            dataset_metadata.cdm_code_tables["observed_variable"],
-        )
+        homogenised_data = define_units(homogenised_data, source_definition)
     # If units is present but encoded as integers, decode them
     # Old datasets have all units as strings, so we shall keep it like this.
     unit_codes = dataset_metadata.cdm_code_tables["units"]
     code2unit = unit_codes.table["abbreviation"].to_dict()
     code2unit[0] = "none"
+    varname2units = get_varname2units(
+        dataset_metadata.cdm_code_tables["observed_variable"]
+    )
+    # Position of the first row of each variable, to check its units
+    variable_codes, variables = pandas.factorize(homogenised_data["observed_variable"])
+    first_rows = pandas.Series(variable_codes).drop_duplicates().loc[lambda c: c >= 0]
+    variables_first_rows = dict(zip(variables[first_rows.values], first_rows.index))
     unit_fields = [f for f in homogenised_data.columns if "units" in f]
     for unit_field in unit_fields:
         # Convert if we get units as integers
         if homogenised_data[unit_field].dtype.kind == "i":
-            # Decode integers using CDM tables
-            decoded_units = homogenised_data[unit_field].map(code2unit)
+            # Decode integers using CDM tables, once per unique code
+            unit_field_codes, unit_field_uniques = pandas.factorize(
+                homogenised_data[unit_field]
+            )
+            decoded_uniques = pandas.Index(unit_field_uniques).map(code2unit)
             # Check for nans
-            if decoded_units.isnull().any():
+            if decoded_uniques.isnull().any():
                 raise RuntimeError("Not all units were mapped")
-            homogenised_data[unit_field] = decoded_units
+            homogenised_data[unit_field] = gather_categorical(
+                decoded_uniques, unit_field_codes
+            )
         # Check the units agains he CDM
-        varname2units = get_varname2units(
-            dataset_metadata.cdm_code_tables["observed_variable"]
-        )
         for variable in source_definition.main_variables:
-            mask = homogenised_data["observed_variable"] == variable
             # Check if the variable is available, not all partitions contain all
             # variables
-            if mask.any():
-                units = homogenised_data.loc[mask, unit_field].iloc[0]
+            if variable in variables_first_rows:
+                units = homogenised_data[unit_field].iloc[
+                    variables_first_rows[variable]
+                ]
                 _check_cdm_units(units, variable, unit_field, varname2units)
     return homogenised_data
 
 
+def _filter_by_watermark(
+    homogenised_data: pandas.DataFrame, watermark: datetime
+) -> pandas.DataFrame:
+    """
+    Keep only the rows with a report_timestamp at or after the watermark.
+
+    Rows at the watermark are kept, as observations of other stations with the same
+    timestamp can arrive late. They are appended, so the ones already stored are
+    deduplicated when the partitions are merged.
+    """
+    is_new = homogenised_data["report_timestamp"] >= watermark
+    if not is_new.any():
+        raise EmptyBatchException
+    logger.info(f"Found {is_new.sum()} rows not older than {watermark}")
+    return homogenised_data.loc[is_new].reset_index(drop=True)
+
+
 def _validate_time_interval(homogenised_data: pandas.DataFrame, time_batch: TimeBatch):
     start_date, end_date = time_batch.get_time_coverage()
     times_check = between(homogenised_data.report_timestamp, start_date, end_date).all()
@@ -599,5 +748,6 @@ def set_version_status(
             raise RuntimeError(f"{dataset=} {version=} not found in the catalogue")
         dataset_version.deprecated = deprecated
         session.commit()
+        VersionStampRepository(session).bump(dataset)
         verb = "Deprecated" if deprecated else "Enabled"
         logger.info(f"{verb} {dataset=} {version=}")
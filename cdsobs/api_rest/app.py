@@ -1,6 +1,28 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
-from cdsobs.api_rest.endpoints import router
+from cdsobs.api_rest.endpoints import make_app_resources, router
+from cdsobs.utils.exceptions import ConfigNotFound
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Config, connection pool and S3 client are shared by all the requests
+    try:
+        app.state.resources = make_app_resources()
+    except ConfigNotFound:
+        logger.warning("Config file not found, it will be read on the first request.")
+        app.state.resources = None
+    yield
+    if app.state.resources is not None:
+        app.state.resources.engine.dispose()
+        await app.state.resources.async_engine.dispose()
+
 
-app = FastAPI(title="cads-obs-app", version="0.1", debug=True)
+app = FastAPI(title="cads-obs-app", version="0.1", debug=True, lifespan=lifespan)
 app.include_router(router)
@@ -0,0 +1,130 @@
+"""In-process cache for the responses of the HTTP API.
+
+Entries expire after CADSOBS_API_CACHE_TTL seconds (300 by default, 0 disables the
+cache) and the least recently used ones are evicted when there are more than
+CADSOBS_API_CACHE_SIZE (256 by default). The keys include the version stamp of the
+dataset, which make_production, deprecate-version, enable-version and get_forms_jsons
+increase, so the entries are invalidated as soon as the dataset changes, also when
+these run in other processes.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+_missing = object()
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache whose entries expire after a time to live.
+
+    Parameters
+    ----------
+    maxsize:
+      Maximum number of entries.
+    ttl:
+      Time to live of the entries, in seconds. If 0, nothing is cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """Return the value of key, calling compute to get it if missing or expired."""
+        now = time.monotonic()
+        value = self._get(key, now)
+        if value is _missing:
+            # Compute outside of the lock, so slow requests do not block the others.
+            value = compute()
+            self._set(key, value, now)
+        return value
+
+    async def aget_or_set(
+        self, key: Hashable, compute: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Return the value of key, awaiting compute to get it if missing or expired."""
+        now = time.monotonic()
+        value = self._get(key, now)
+        if value is _missing:
+            value = await compute()
+            self._set(key, value, now)
+        return value
+
+    def _get(self, key: Hashable, now: float) -> Any:
+        with self._lock:
+            if key in self._entries:
+                expires, value = self._entries[key]
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+        return _missing
+
+    def _set(self, key: Hashable, value: Any, now: float):
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = TTLCache(
+    maxsize=int(os.environ.get("CADSOBS_API_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("CADSOBS_API_CACHE_TTL", 300)),
+)
+
+
+def clear_response_cache():
+    response_cache.clear()
+
+
+def _render(content: Any) -> tuple[bytes, str]:
+    body = bytes(JSONResponse(content=jsonable_encoder(content)).body)
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return body, etag
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    # Weak comparison, as recommended for If-None-Match
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def cached_json_response(
+    request: Request, key: Hashable, compute: Callable[[], Any]
+) -> Response:
+    """
+    Return compute() as a JSON response with an ETag, reusing the cached one if any.
+
+    If the ETag is in the If-None-Match header of the request, an empty 304 (Not
+    Modified) response is returned instead.
+    """
+    body, etag = response_cache.get_or_set(key, lambda: _render(compute()))
+    headers = {"ETag": etag}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,42 +1,155 @@
 import os
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Annotated, Iterator
+from typing import Annotated, AsyncIterator, Iterator
 
 import sqlalchemy.orm
 import yaml
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
-from starlette.responses import JSONResponse
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 
+from cdsobs.api_rest.cache import cached_json_response, response_cache
 from cdsobs.cdm.lite import cdm_lite_variables
 from cdsobs.config import CDSObsConfig, validate_config
+from cdsobs.observation_catalogue.repositories.async_catalogue import (
+    AsyncCatalogueRepository,
+)
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.observation_catalogue.repositories.dataset import CadsDatasetRepository
+from cdsobs.observation_catalogue.repositories.version_stamp import (
+    ALL_DATASETS,
+    VersionStampRepository,
+)
 from cdsobs.retrieve.models import RetrieveArgs
-from cdsobs.retrieve.retrieve_services import get_catalogue_entries, get_urls
+from cdsobs.retrieve.retrieve_services import (
+    aget_catalogue_assets,
+    aget_last_version,
+    get_catalogue_assets,
+    get_retrieve_variables,
+    get_urls,
+)
+from cdsobs.retrieve.stream import StreamFormat, get_space_columns, stream_retrieve
 from cdsobs.service_definition.api import get_service_definition
+from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.storage import S3Client
 from cdsobs.utils.exceptions import ConfigNotFound, DataNotFoundException, SizeError
-from cdsobs.utils.utils import get_database_session
+from cdsobs.utils.utils import get_engine
 
 router = APIRouter()
 
 
+@dataclass
+class AppResources:
+    """
+    Objects shared by all the requests handled by a worker of the HTTP API.
+
+    They are created once, when the app starts, so the configuration is not read
+    again and the connections to the catalogue are taken from a pool instead of being
+    opened for each request.
+    """
+
+    cdsobs_config: CDSObsConfig
+    engine: sqlalchemy.Engine
+    session_factory: sqlalchemy.orm.sessionmaker
+    async_engine: AsyncEngine
+    async_session_factory: async_sessionmaker
+    _local: threading.local = field(default_factory=threading.local)
+
+    def get_s3_client(self) -> S3Client:
+        """Return the S3 client of the current thread."""
+        # boto3 resources are not thread safe, and sync endpoints run in a threadpool
+        if not hasattr(self._local, "s3_client"):
+            self._local.s3_client = S3Client.from_config(self.cdsobs_config.s3config)
+        return self._local.s3_client
+
+
+_resources_lock = threading.Lock()
+
+
+def make_app_resources() -> AppResources:
+    cdsobs_config = get_config()
+    db_config = cdsobs_config.catalogue_db
+    engine = get_engine(
+        db_config.get_url(),
+        pool_size=db_config.pool_size,
+        max_overflow=db_config.max_overflow,
+    )
+    session_factory = sqlalchemy.orm.sessionmaker(
+        autocommit=False, autoflush=False, bind=engine
+    )
+    # Engine for the async endpoints, it must be created in the event loop of the app
+    async_engine = create_async_engine(
+        db_config.get_async_url(),
+        pool_pre_ping=True,
+        pool_size=db_config.pool_size,
+        max_overflow=db_config.max_overflow,
+    )
+    async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+    return AppResources(
+        cdsobs_config, engine, session_factory, async_engine, async_session_factory
+    )
+
+
+def get_app_resources(request: Request) -> AppResources:
+    """Return the resources of the app, creating them if the app was not started."""
+    state = request.app.state
+    if getattr(state, "resources", None) is None:
+        with _resources_lock:
+            if getattr(state, "resources", None) is None:
+                state.resources = make_app_resources()
+    return state.resources
+
+
 @dataclass
 class HttpAPISession:
     cdsobs_config: CDSObsConfig
     catalogue_session: sqlalchemy.orm.Session
+    s3_client: S3Client | None = None
+    resources: AppResources | None = None
 
+    def get_s3_client(self) -> S3Client:
+        if self.resources is not None:
+            # The dependencies and the endpoint can run in different threads of the
+            # threadpool, so the client of the calling thread is taken on each call.
+            return self.resources.get_s3_client()
+        if self.s3_client is None:
+            self.s3_client = S3Client.from_config(self.cdsobs_config.s3config)
+        return self.s3_client
 
-def session_gen() -> Iterator[HttpAPISession]:
-    cdsobs_config = get_config()
+
+def session_gen(request: Request) -> Iterator[HttpAPISession]:
+    resources = get_app_resources(request)
+    catalogue_session = resources.session_factory()
     try:
-        catalogue_session = get_database_session(cdsobs_config.catalogue_db.get_url())
-        session = HttpAPISession(cdsobs_config, catalogue_session)
-        yield session
+        yield HttpAPISession(
+            resources.cdsobs_config, catalogue_session, resources=resources
+        )
     finally:
-        session.catalogue_session.close()
+        catalogue_session.close()
+
+
+@dataclass
+class AsyncHttpAPISession:
+    cdsobs_config: CDSObsConfig
+    catalogue_session: AsyncSession
+    s3_client: S3Client
+
+
+async def async_session_gen(request: Request) -> AsyncIterator[AsyncHttpAPISession]:
+    resources = get_app_resources(request)
+    # Async dependencies and endpoints run in the thread of the event loop, so its
+    # client is not shared with other threads.
+    async with resources.async_session_factory() as catalogue_session:
+        yield AsyncHttpAPISession(
+            resources.cdsobs_config, catalogue_session, resources.get_s3_client()
+        )
 
 
 def get_config() -> CDSObsConfig:
@@ -63,61 +176,133 @@ def make_http_exception(
 
 
 @router.post("/get_object_urls")
-def get_object_urls(
+async def get_object_urls(
     retrieve_args: RetrieveArgs,
-    session: Annotated[HttpAPISession, Depends(session_gen)],
+    session: Annotated[AsyncHttpAPISession, Depends(async_session_gen)],
 ) -> list[str]:
     # Query the storage to get the URLS of the files that contain the data requested
+    # This is the most requested endpoint, so it does not block the threadpool.
     try:
-        catalogue_repository = CatalogueRepository(session.catalogue_session)
-        entries = get_catalogue_entries(catalogue_repository, retrieve_args)
+        catalogue_repository = AsyncCatalogueRepository(session.catalogue_session)
+        if retrieve_args.params.version == "last":
+            dataset = retrieve_args.dataset
+            stamp = await catalogue_repository.get_stamp(dataset)
+            retrieve_args.params.version = await response_cache.aget_or_set(
+                ("last_version", dataset, stamp),
+                lambda: aget_last_version(session.catalogue_session, dataset),
+            )
+        assets = await aget_catalogue_assets(catalogue_repository, retrieve_args)
+        object_urls = get_urls(assets, session.s3_client.base)
     except DataNotFoundException as e:
         raise make_http_exception(status_code=500, message=f"Error: {e}")
+    except SizeError as e:
+        raise HTTPException(status_code=500, detail=dict(message=f"Error: {e}"))
     except Exception as e:
         raise make_http_exception(
             status_code=500,
             message=f"Error: Observations API failed: {e}",
             traceback=repr(e),
         )
-    s3client = S3Client.from_config(session.cdsobs_config.s3config)
+    return object_urls
+
+
+@router.post("/retrieve")
+def retrieve(
+    retrieve_args: RetrieveArgs,
+    session: Annotated[HttpAPISession, Depends(session_gen)],
+    output_format: StreamFormat = "csv",
+) -> StreamingResponse:
+    """
+    Stream the observations requested as CSV or Arrow IPC stream.
+
+    Only the rows matching the retrieve parameters are read from the partitions and
+    sent, so the client does not need to download the whole files.
+    """
+    dataset = retrieve_args.dataset
+    source = retrieve_args.params.dataset_source
     try:
-        object_urls = get_urls(entries, s3client.base)
-    except SizeError as e:
-        raise HTTPException(status_code=500, detail=dict(message=f"Error: {e}"))
+        catalogue_repository = CatalogueRepository(session.catalogue_session)
+        assets = get_catalogue_assets(catalogue_repository, retrieve_args)
+        object_urls = get_urls(assets, session.get_s3_client().base)
+        service_definition = _get_service_definition(
+            session, dataset, _get_stamp(session, dataset)
+        )
+    except DataNotFoundException as e:
+        raise make_http_exception(status_code=500, message=f"Error: {e}")
     except Exception as e:
         raise make_http_exception(
-            status_code=500, message="Error: Observations API failed", traceback=repr(e)
+            status_code=500,
+            message=f"Error: Observations API failed: {e}",
+            traceback=repr(e),
         )
-    return object_urls
+    content = stream_retrieve(
+        object_urls,
+        retrieve_args.params,
+        get_space_columns(service_definition, source),
+        get_retrieve_variables(service_definition, source),
+        output_format,
+    )
+    media_types = dict(csv="text/csv", arrow="application/vnd.apache.arrow.stream")
+    filename = f"{dataset}_{source}.{output_format}"
+    return StreamingResponse(
+        content=content,
+        media_type=media_types[output_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def _get_stamp(session: HttpAPISession, dataset: str) -> int:
+    return VersionStampRepository(session.catalogue_session).get_stamp(dataset)
+
+
+def _get_service_definition(
+    session: HttpAPISession, dataset: str, stamp: int
+) -> ServiceDefinition:
+    return response_cache.get_or_set(
+        ("service_definition_object", dataset, stamp),
+        lambda: get_service_definition(session.cdsobs_config, dataset),
+    )
 
 
-@router.get("/capabilities/datasets")
+@router.get("/capabilities/datasets", response_model=list[str])
 def get_capabilities(
-    session: Annotated[HttpAPISession, Depends(session_gen)]
-) -> list[str]:
+    request: Request, session: Annotated[HttpAPISession, Depends(session_gen)]
+) -> Response:
     """Get available datasets."""
-    results = CadsDatasetRepository(session.catalogue_session).get_all()
-    return [r.name for r in results]
 
+    def _get_datasets() -> list[str]:
+        results = CadsDatasetRepository(session.catalogue_session).get_all()
+        return [r.name for r in results]
+
+    stamp = _get_stamp(session, ALL_DATASETS)
+    return cached_json_response(request, ("datasets", stamp), _get_datasets)
 
-@router.get("/capabilities/{dataset}/sources")
+
+@router.get("/capabilities/{dataset}/sources", response_model=list[str])
 def get_sources(
     dataset: str,
+    request: Request,
     session: Annotated[HttpAPISession, Depends(session_gen)],
-) -> list[str]:
+) -> Response:
     """Get available sources for a given dataset."""
-    service_definition = get_service_definition(session.cdsobs_config, dataset)
-    return list(service_definition.sources)
+    stamp = _get_stamp(session, dataset)
+    return cached_json_response(
+        request,
+        ("sources", dataset, stamp),
+        lambda: list(_get_service_definition(session, dataset, stamp).sources),
+    )
 
 
 @router.get("/{dataset}/service_definition")
 def get_dataset_service_definition(
     dataset: str,
+    request: Request,
     session: Annotated[HttpAPISession, Depends(session_gen)],
-) -> JSONResponse:
+) -> Response:
     """Get the service definition for a dataset as JSON."""
-    try:
-        s3_client = S3Client.from_config(session.cdsobs_config.s3config)
+
+    def _read_service_definition() -> dict:
+        s3_client = session.get_s3_client()
         bucket_name = s3_client.get_bucket_name(dataset_name=dataset)
         s3_obj = s3_client.s3.Object(bucket_name, "service_definition.yml")
 
@@ -125,11 +310,13 @@ def get_dataset_service_definition(
         body = s3_obj.get()["Body"].read().decode("utf-8")
 
         # Parse YAML → Python object
-        data = yaml.safe_load(body)
-
-        # Return JSON
-        return JSONResponse(content=data)
+        return yaml.safe_load(body)
 
+    try:
+        stamp = _get_stamp(session, dataset)
+        return cached_json_response(
+            request, ("service_definition", dataset, stamp), _read_service_definition
+        )
     except FileNotFoundError:
         raise make_http_exception(
             status_code=404,
@@ -142,17 +329,27 @@ def get_cdm_lite_variables() -> dict[str, list[str] | dict]:
     return cdm_lite_variables
 
 
-@router.get("/{dataset}/{source}/disabled_fields")
+@router.get("/{dataset}/{source}/disabled_fields", response_model=list[str])
 def get_disabled_fields(
-    dataset: str, source: str, session: Annotated[HttpAPISession, Depends(session_gen)]
-) -> list[str]:
-    service_definition = get_service_definition(session.cdsobs_config, dataset)
-    disabled_fields_config = service_definition.disabled_fields
-    if isinstance(disabled_fields_config, dict):
-        disabled_fields = disabled_fields_config.get(source, [])
-    else:
-        disabled_fields = disabled_fields_config
-    return disabled_fields
+    dataset: str,
+    source: str,
+    request: Request,
+    session: Annotated[HttpAPISession, Depends(session_gen)],
+) -> Response:
+    stamp = _get_stamp(session, dataset)
+
+    def _get_disabled_fields() -> list[str]:
+        service_definition = _get_service_definition(session, dataset, stamp)
+        disabled_fields_config = service_definition.disabled_fields
+        if isinstance(disabled_fields_config, dict):
+            disabled_fields = disabled_fields_config.get(source, [])
+        else:
+            disabled_fields = disabled_fields_config
+        return disabled_fields
+
+    return cached_json_response(
+        request, ("disabled_fields", dataset, source, stamp), _get_disabled_fields
+    )
 
 
 @router.get("/{dataset}/forms/{json_name}")
@@ -163,7 +360,7 @@ def get_form(
 ) -> StreamingResponse:
     """Get the service definition for a dataset."""
     try:
-        s3_client = S3Client.from_config(session.cdsobs_config.s3config)
+        s3_client = session.get_s3_client()
         bucket_name = s3_client.get_bucket_name(dataset_name=dataset)
         s3_obj = s3_client.s3.Object(bucket_name, json_name)
         file_like = s3_obj.get()["Body"]
@@ -6,13 +6,18 @@ from pprint import pformat
 from typing import List, Optional
 
 import fsspec
+import numpy
 import pandas
 import xarray
 
+from cdsobs.cdm.cache import get_cached
 from cdsobs.cdm.check import (
+    CdmCompliancePlan,
     CdmTableFieldsMapping,
     check_for_ambiguous_fields,
+    check_primary_keys_nans,
     check_table_cdm_compliance,
+    get_primary_keys_in_data,
 )
 from cdsobs.cdm.code_tables import CDMCodeTable, CDMCodeTables
 from cdsobs.cdm.tables import CDMTables
@@ -24,9 +29,10 @@ from cdsobs.ingestion.core import (
 )
 from cdsobs.service_definition.service_definition_models import (
     SourceDefinition,
+    UnitChange,
 )
 from cdsobs.utils.logutils import get_logger
-from cdsobs.utils.utils import get_code_mapping, unique
+from cdsobs.utils.utils import gather_categorical, get_code_mapping, unique
 
 logger = get_logger(__name__)
 
@@ -156,7 +162,7 @@ def _extract_cdm_table_fields(
     cdm_table = cdm_tables[name]
     # Get the variables corresponding to this table. Exclude names that are not unique
     # in the CDM, like "type".
-    vars_in_data = [v for v in partition_data if v in cdm_table.fields]
+    vars_in_data = [v for v in partition_data if v in cdm_table.field_set]
     vars_with_slash = [
         v for v in partition_data if "|" in str(v) and str(v).split("|")[1] == name
     ]
@@ -204,12 +210,9 @@ def _add_external_names(
 ) -> pandas.DataFrame:
     # Check if the fields in this table are the external names in foreign keys of other
     # tables and are available, then add them.
-    table_definition = cdm_tables[name]
-    for foreign_key in cdm_tables.all_foreign_keys:
-        if (
-            (foreign_key.external_name in table_definition.fields)
-            and (foreign_key.name in partition_data)
-            and (foreign_key.external_name not in table_data)
+    for foreign_key in cdm_tables.get_foreign_keys_to_fields(name):
+        if (foreign_key.name in partition_data) and (
+            foreign_key.external_name not in table_data
         ):
             table_data = table_data.assign(
                 **{foreign_key.external_name: partition_data[foreign_key.name]}
@@ -268,6 +271,11 @@ def open_asset(cdm_netcdf: str, decode_variables: bool = False) -> xarray.Datase
 
 
 def read_cdm_code_table(cdm_tables_location: Path, name: str) -> CDMCodeTable:
+    """Read a CDM code table, parsing the CSV only once per process."""
+    return get_cached(cdm_tables_location, "tables", name, _read_cdm_code_table)
+
+
+def _read_cdm_code_table(cdm_tables_location: Path, name: str) -> CDMCodeTable:
     table_path = Path(cdm_tables_location, f"cdm-obs/tables/{name}.csv")
     table_data = pandas.read_csv(
         table_path,
@@ -307,16 +315,24 @@ def read_cdm_code_tables(
     return cdm_tables
 
 
+# Compliance plans by CDM tables, columns and dtypes of the input data
+_compliance_plans: dict[tuple, CdmCompliancePlan] = {}
+
+
 def check_cdm_compliance(
     homogenised_data: pandas.DataFrame,
     cdm_tables: CDMTables,
-):
+) -> dict[str, CdmTableFieldsMapping]:
     """Run a set of sanity checks on the input data.
 
     Run a set of sanity checks on the input data to ensure it is compliant with
     the Observations Common Data Model. Currently it will print warnings, but in the
     future it will be more strict and raise exceptions.
 
+    The checks that only depend on the columns and their dtypes are run once, and
+    their result is cached as a CdmCompliancePlan. Batches with the same columns
+    only check that the primary keys have no NaNs.
+
     Parameters
     ----------
     homogenised_data :
@@ -325,35 +341,91 @@ def check_cdm_compliance(
       CDM tables loaded from their definitions (use read_cdm_tables for this).
 
     """
-    logger.info("Checking for compliance with the Observations CDM.")
+    plan_key = (
+        tuple((name, table_def.fingerprint) for name, table_def in cdm_tables.items()),
+        tuple(homogenised_data.columns),
+        tuple(str(dtype) for dtype in homogenised_data.dtypes),
+    )
+    if plan_key in _compliance_plans:
+        logger.info("Checking for compliance with the Observations CDM (cached).")
+        plan = _compliance_plans[plan_key]
+    else:
+        logger.info("Checking for compliance with the Observations CDM.")
+        plan = _get_compliance_plan(homogenised_data, cdm_tables)
+        _compliance_plans[plan_key] = plan
+    # Check the primary keys for each table are NaN free
+    for primary_keys_in_data in plan.primary_keys_in_data.values():
+        check_primary_keys_nans(primary_keys_in_data, homogenised_data)
+    return plan.table_field_mappings
+
+
+def _get_compliance_plan(
+    homogenised_data: pandas.DataFrame, cdm_tables: CDMTables
+) -> CdmCompliancePlan:
     check_for_ambiguous_fields(cdm_tables, homogenised_data)
     table_field_mappings: dict[str, CdmTableFieldsMapping] = {}
+    primary_keys_in_data: dict[str, list[str]] = {}
     for table_name, table_def in cdm_tables.items():
         table_field_mapping = check_table_cdm_compliance(
             cdm_tables, homogenised_data, table_def
         )
         table_field_mappings[table_name] = table_field_mapping
-    return table_field_mappings
+        # Check the primary keys for this table are available
+        primary_keys_in_data[table_name] = get_primary_keys_in_data(table_field_mapping)
+    return CdmCompliancePlan(table_field_mappings, primary_keys_in_data)
 
 
 def define_units(
     homogenised_data: pandas.DataFrame,
     source_definition: SourceDefinition,
-    cdm_variable_table: CDMCodeTable,
 ):
     """Apply unit changes defined in the service_definition.json.
 
-    It also compares them against those defined in the CDM observed_variable table.
+    observed_variable is factorized once and the units, original units, scale and
+    offset are looked up by variable code, so each variable is validated only once.
+    The units columns are categorical.
     """
-    varname2units = get_varname2units(cdm_variable_table)
     unit_changes = source_definition.cdm_mapping.unit_changes
-    homogenised_data["units"] = ""
-    homogenised_data["original_units"] = ""
-    for variable in homogenised_data.observed_variable.unique():
-        _extract_variable_units_change(
-            homogenised_data, source_definition, unit_changes, variable, varname2units
+    codes, variables = pandas.factorize(homogenised_data["observed_variable"])
+    # The extra last element is for missing variables (code -1)
+    nvariables = len(variables)
+    new_units = numpy.full(nvariables + 1, "", dtype=object)
+    original_units = new_units.copy()
+    scale = numpy.ones(nvariables + 1)
+    offset = numpy.zeros(nvariables + 1)
+    changed = numpy.zeros(nvariables + 1, dtype=bool)
+    for vcode, variable in enumerate(variables):
+        (
+            new_units[vcode],
+            original_units[vcode],
+            unit_change,
+        ) = _extract_variable_units_change(source_definition, unit_changes, variable)
+        if unit_change is not None:
+            scale[vcode] = unit_change.scale
+            offset[vcode] = unit_change.offset
+            changed[vcode] = True
+    # Units missing in the descriptions are None, which was written as "None" when
+    # the units columns were object. Keep it, as missing categorical values are
+    # written as "nan" and the files, and their checksums, would change.
+    for units in [new_units, original_units]:
+        units[pandas.isnull(units)] = "None"
+    # Apply the unit changes
+    if changed.any():
+        observation_value = homogenised_data["observation_value"].to_numpy(copy=True)
+        if observation_value.dtype.kind != "f":
+            observation_value = observation_value.astype("float64")
+        rows_changed = changed[codes]
+        codes_changed = codes[rows_changed]
+        dtype = observation_value.dtype
+        observation_value[rows_changed] = (
+            observation_value[rows_changed] * scale.astype(dtype)[codes_changed]
+            + offset.astype(dtype)[codes_changed]
         )
-
+        homogenised_data["observation_value"] = observation_value
+    # Assign to the units columns, missing variables take the last element
+    units_codes = numpy.where(codes < 0, nvariables, codes)
+    homogenised_data["units"] = gather_categorical(new_units, units_codes)
+    homogenised_data["original_units"] = gather_categorical(original_units, units_codes)
     return homogenised_data
 
 
@@ -388,19 +460,15 @@ def get_cdm_repo_current_tag(path: Path) -> str:
 
 
 def _extract_variable_units_change(
-    homogenised_data: pandas.DataFrame,
     source_definition: SourceDefinition,
     unit_changes: Optional[dict],
     variable: str,
-    varname2units: pandas.DataFrame,
-):
-    observed_variable = homogenised_data.loc[:, "observed_variable"]
+) -> tuple[str | None, str | None, UnitChange | None]:
+    """Return the new units, original units and unit change for a variable."""
     description_units = source_definition.descriptions[variable].units
-    observed_variable_mask = observed_variable == variable
     if unit_changes is None or variable not in unit_changes:
         # Do not change units, set both units columns to be equal.
-        new_units = description_units
-        original_units = description_units
+        return description_units, description_units, None
     else:
         unit_change = unit_changes[variable]
         new_units = list(unit_change.names.values())[0]
@@ -412,17 +480,8 @@ def _extract_variable_units_change(
         logger.info(
             f"Changing units for variable {variable} according to service definition."
         )
-
-        homogenised_data.loc[observed_variable_mask, "observation_value"] = (
-            homogenised_data.loc[observed_variable_mask, "observation_value"]
-            * unit_change.scale
-            + unit_change.offset
-        )
         original_units = list(unit_change.names.keys())[0]
-
-    # Assign to the units columns
-    homogenised_data.loc[observed_variable_mask, "units"] = new_units
-    homogenised_data.loc[observed_variable_mask, "original_units"] = original_units
+        return new_units, original_units, unit_change
 
 
 def _check_cdm_units(
@@ -0,0 +1,128 @@
+"""Process-wide cache for the CDM tables and code tables.
+
+The tables are parsed from the CSV files of the CDM repository only once per process,
+keyed by location, kind (table_definitions or tables), name and the git revision of
+the CDM repository, which is checked on each call. If CADSOBS_CDM_CACHE_DIR is set,
+parsed tables are also pickled there, in a folder named after the git tag, so a cold
+start does not need to parse the CSVs again. When the CDM repository is checked out
+at a different tag, or edited, the key changes, so both the memory and the disk cache
+are invalidated.
+"""
+
+import os
+import pickle
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+CacheKey = tuple[str, str, str, str]
+_cache: dict[CacheKey, Any] = {}
+
+
+def get_cdm_revision(cdm_tables_location: Path) -> str | None:
+    """
+    Return the tag (or commit) the CDM repository is at, None if not a git repository.
+
+    Repositories with local changes are treated as not versioned. git is run on each
+    call, as the repository can be checked out at another commit or edited while the
+    process runs. This is still much cheaper than parsing the CSV files.
+    """
+    repo_path = Path(cdm_tables_location, "cdm-obs")
+    if not Path(repo_path, ".git").exists():
+        return None
+    revision = _describe(str(repo_path))
+    if revision is not None and revision.endswith("-dirty"):
+        revision = None
+    return revision
+
+
+def _describe(repo_path: str) -> str | None:
+    try:
+        revision = (
+            subprocess.check_output(
+                ["git", "-C", repo_path, "describe", "--tags", "--always", "--dirty"],
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        revision = None
+    return revision
+
+
+def get_cached(
+    cdm_tables_location: Path,
+    kind: str,
+    name: str,
+    reader: Callable[[Path, str], T],
+) -> T:
+    """
+    Return a CDM table from the cache, reading it with reader if it is not there.
+
+    The cached objects are shared, so they must not be modified in place.
+
+    Parameters
+    ----------
+    cdm_tables_location: Path
+      Location of the CDM tables.
+    kind:
+      Folder of the CDM repository the table belongs to.
+    name:
+      Name of the table.
+    reader:
+      Function used to read the table if not cached.
+    """
+    revision = get_cdm_revision(cdm_tables_location)
+    if revision is None:
+        # Not a git repository, use the modification time of the file instead.
+        table_path = Path(cdm_tables_location, "cdm-obs", kind, f"{name}.csv")
+        version = f"mtime-{table_path.stat().st_mtime_ns}"
+    else:
+        version = revision
+    key = (str(Path(cdm_tables_location).absolute()), kind, name, version)
+    if key not in _cache:
+        _cache[key] = _load(key, cdm_tables_location, name, reader, revision)
+    return _cache[key]
+
+
+def _load(
+    key: CacheKey,
+    cdm_tables_location: Path,
+    name: str,
+    reader: Callable[[Path, str], T],
+    revision: str | None,
+) -> T:
+    snapshot_path = _get_snapshot_path(key, revision)
+    if snapshot_path is not None and snapshot_path.exists():
+        logger.debug(f"Loading CDM table {name} from {snapshot_path}")
+        with snapshot_path.open("rb") as f:
+            return pickle.load(f)
+    table = reader(cdm_tables_location, name)
+    if snapshot_path is not None:
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write and then rename so concurrent processes never read a partial file
+        tmp_path = snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump(table, f)
+        tmp_path.replace(snapshot_path)
+    return table
+
+
+def _get_snapshot_path(key: CacheKey, revision: str | None) -> Path | None:
+    cache_dir = os.environ.get("CADSOBS_CDM_CACHE_DIR")
+    # Snapshots are only used when the tables are versioned with a git tag.
+    if cache_dir is None or revision is None:
+        return None
+    _, kind, name, _ = key
+    return Path(cache_dir, revision, kind, f"{name}.pkl")
+
+
+def clear_cdm_cache():
+    """Empty the memory cache, snapshots in CADSOBS_CDM_CACHE_DIR are kept."""
+    _cache.clear()
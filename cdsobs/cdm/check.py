@@ -61,6 +61,23 @@ class CdmTableFieldsMapping:
         return field_name
 
 
+@dataclass
+class CdmCompliancePlan:
+    """Result of the CDM checks that only depend on the columns and their dtypes.
+
+    Parameters
+    ----------
+    table_field_mappings:
+      Mapping of the input data fields for each of the CDM tables.
+    primary_keys_in_data:
+      Names in the input data of the primary keys of each table, they need to be
+      checked for NaNs in every batch.
+    """
+
+    table_field_mappings: dict[str, CdmTableFieldsMapping]
+    primary_keys_in_data: dict[str, List[str]]
+
+
 def check_for_ambiguous_fields(
     cdm_tables: CDMTables, homogenised_data: pandas.DataFrame
 ):
@@ -98,8 +115,6 @@ def check_table_cdm_compliance(
             "Also, the following fields can be mapped from their names in "
             f"children tables: {pformat(foreign_fields)}"
         )
-    # Check the primary keys for this table are available and NaN free
-    _check_primary_keys(table_field_mapping, homogenised_data)
     # Check data types
     _check_data_types(homogenised_data, table_field_mapping)
     return table_field_mapping
@@ -122,19 +137,18 @@ def _check_data_types(
     table_def = table_field_mapping.table
     table_name = table_field_mapping.table.name
     for field in table_field_mapping.fields_found:
-        cdm_dtype = (
-            str(table_def.table.loc[field, "kind"])
-            .replace(" (pk)", "")
-            .replace("*", "")
-            .strip()
-        )
+        cdm_dtype = table_def.get_cdm_dtype(field)
         cdm_numpy_dtype = cdm_dtypes2numpy[cdm_dtype]
         field_in_input_data = (
             field
             if field not in table_field_mapping.fields_with_suffix
             else field + f"|{table_name}"
         )
-        input_data_dtype = str(homogenised_data[field_in_input_data].dtype)
+        input_dtype = homogenised_data[field_in_input_data].dtype
+        # Categoricals are checked using the dtype of the categories
+        if isinstance(input_dtype, pandas.CategoricalDtype):
+            input_dtype = input_dtype.categories.dtype
+        input_data_dtype = str(input_dtype)
         # Check for equalness or if cdm_numpy_dtype it is a list check
         # input_data_dtype is in the list.
         dtype_check_passed = (input_data_dtype == cdm_numpy_dtype) or (
@@ -169,7 +183,7 @@ def get_cdm_table_mapping(
         else:
             fields_in_input_data.append(field)
     # Check which fields are available in the input data
-    fields_found = list(set(fields_in_input_data).intersection(table_def.fields))
+    fields_found = list(set(fields_in_input_data).intersection(table_def.field_set))
     foreign_fields = list(_get_foreign_fields(cdm_tables, homogenised_data, table_name))
     table_field_mapping = CdmTableFieldsMapping(
         fields_found, foreign_fields, fields_with_suffix, table_def
@@ -177,34 +191,36 @@ def get_cdm_table_mapping(
     return table_field_mapping
 
 
-def _check_primary_keys(
-    fields_mapping: CdmTableFieldsMapping, homogenised_data: pandas.DataFrame
-):
-    """Check that primary keys exist and have not NaN values."""
+def get_primary_keys_in_data(fields_mapping: CdmTableFieldsMapping) -> List[str]:
+    """Return the names in the data of the available primary keys of a table."""
     table_def = fields_mapping.table
     table_name = table_def.name
+    primary_keys_in_data = []
     for primary_key in table_def.primary_keys:
         if primary_key not in fields_mapping.all_fields_available:
             logger.warning(f"{primary_key=} not available in table {table_name}.")
         else:
-            # Check for nans
-            field_name = fields_mapping.get_field_name_in_data(primary_key)
-            if homogenised_data[field_name].isnull().any():
-                raise CdmValidationError(
-                    f"NaN found in {primary_key=}, this is not allowed."
-                )
+            primary_keys_in_data.append(
+                fields_mapping.get_field_name_in_data(primary_key)
+            )
+    return primary_keys_in_data
+
+
+def check_primary_keys_nans(
+    primary_keys_in_data: List[str], homogenised_data: pandas.DataFrame
+):
+    """Check that the primary keys have not NaN values."""
+    for field_name in primary_keys_in_data:
+        if homogenised_data[field_name].isnull().any():
+            raise CdmValidationError(
+                f"NaN found in {field_name=}, this is not allowed."
+            )
 
 
 def _get_foreign_fields(
     cdm_tables: CDMTables, homogenised_data: pandas.DataFrame, table_name: str
 ) -> Iterator[ForeignKey]:
     """For a table, get the fields that can be mapped from their children tables names."""
-    children_table_names = cdm_tables.get_children(table_name)
-    for children in children_table_names:
-        for fk in cdm_tables[children].foreign_keys:
-            if (
-                fk.external_table == table_name
-                and fk.external_name != fk.name
-                and fk.name in homogenised_data
-            ):
-                yield fk
+    for fk in cdm_tables.get_foreign_keys_to(table_name):
+        if fk.external_name != fk.name and fk.name in homogenised_data:
+            yield fk
@@ -8,10 +8,12 @@ from collections import UserDict
 from dataclasses import dataclass
 from itertools import chain
 from pathlib import Path
-from typing import Any, Iterable, Iterator, List
+from typing import Any, Iterable, List, Mapping
 
 import pandas
 
+from cdsobs.cdm.cache import get_cached
+
 """ constants """
 
 STATION_COLUMN = "primary_station_id"
@@ -51,6 +53,13 @@ class ForeignKey:
 
 @dataclass
 class CDMTable:
+    """
+    A CDM table definition.
+
+    Primary keys, fields, data types and foreign keys are computed once when the
+    object is created, as they are used in the hot paths of the CDM checks.
+    """
+
     name: str
     table: pandas.DataFrame
 
@@ -61,38 +70,60 @@ class CDMTable:
                 self.table.kind.str.contains("(pk)")
             ].index.tolist()
         self.primary_keys = primary_keys
+        self._fields = self.table.index.tolist()
+        self.field_set = frozenset(self._fields)
+        self._dtype_map = {
+            str(field): _parse_cdm_dtype(kind)
+            for field, kind in zip(self.table.index, self.table["kind"])
+        }
+        # There are some empty fields with spaces (strip solves this)
+        external_table = self.table.external_table.str.strip()
+        entries = external_table.loc[external_table.str.len() > 0]
+        self._foreign_keys = tuple(
+            ForeignKey(
+                str(name),
+                external.split(":")[1],
+                external.split(":")[0],
+                self.name,
+            )
+            for name, external in entries.items()
+        )
+        # Identifies the definition, to be used in cache keys
+        self.fingerprint = hash(
+            (
+                self.name,
+                tuple(self._dtype_map.items()),
+                tuple(self.primary_keys),
+                tuple((fk.name, fk.external_table) for fk in self._foreign_keys),
+            )
+        )
+
+    def __getstate__(self) -> dict:
+        # Pickle only the definition, the rest is recomputed when unpickling.
+        return dict(name=self.name, table=self.table)
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.__post_init__()
 
     @property
     def fields(self) -> List[str]:
-        return self.table.index.tolist()
+        return self._fields
 
     @property
     def dtypes(self) -> List[str]:
-        return [self.get_cdm_dtype(f) for f in self.fields]
+        return [self._dtype_map[f] for f in self.fields]
 
     @property
-    def foreign_keys(self) -> Iterator[ForeignKey]:
-        # There are some empty fields with spaces (strip solves this)
-        entries = self.table.loc[self.table.external_table.str.strip().str.len() > 0]
-        foreign_keys = (
-            ForeignKey(
-                str(name),
-                columns.loc["external_table"].split(":")[1],
-                columns.loc["external_table"].split(":")[0],
-                self.name,
-            )
-            for name, columns in entries.iterrows()
-        )
-        return foreign_keys
+    def foreign_keys(self) -> tuple[ForeignKey, ...]:
+        return self._foreign_keys
 
     def get_cdm_dtype(self, field: str) -> str:
-        cdm_dtype = (
-            str(self.table.loc[field, "kind"])
-            .replace(" (pk)", "")
-            .replace("*", "")
-            .strip()
-        )
-        return cdm_dtype
+        return self._dtype_map[field]
+
+
+def _parse_cdm_dtype(kind: Any) -> str:
+    return str(kind).replace(" (pk)", "").replace("*", "").strip()
 
 
 def get_dupes(ilist: Iterable) -> set:
@@ -132,37 +163,136 @@ class CDMTables(UserDict[str, CDMTable]):
 
     def __init__(self, cdm_tables_dict: dict[str, CDMTable]):
         UserDict.__init__(self)
+        self._index: CDMTablesIndex | None = None
         self.update(cdm_tables_dict)
 
+    def __setitem__(self, key: str, item: CDMTable):
+        super().__setitem__(key, item)
+        self._index = None
+
+    def __delitem__(self, key: str):
+        super().__delitem__(key)
+        self._index = None
+
+    @property
+    def index(self) -> "CDMTablesIndex":
+        """Precomputed relations between the tables, rebuilt only if tables change."""
+        if self._index is None:
+            self._index = CDMTablesIndex.from_tables(self)
+        return self._index
+
     @property
     def all_foreign_keys(self) -> List[ForeignKey]:
         """All the foreign keys in the tables loaded."""
-        return list(chain.from_iterable([t.foreign_keys for t in self.values()]))
+        return list(self.index.all_foreign_keys)
 
     @property
     def non_unique_fields(self) -> List[str]:
         """Fields names that are reused in different tables."""
-        all_fields = chain.from_iterable([table.fields for table in self.values()])
-        dupes = get_dupes(all_fields)
-        foreign_keys_left_names = [f.name for f in self.all_foreign_keys]
-        ambiguous_dupes = [d for d in dupes if d not in foreign_keys_left_names]
-        return ambiguous_dupes
+        return list(self.index.non_unique_fields)
 
     def get_children(self, table_name: str) -> List[str]:
         """Tables with foreign keys pointing to a given table."""
-        children = [
-            fk.local_table
-            for fk in self.all_foreign_keys
-            if fk.external_table == table_name and fk.external_table in self
-        ]
-        return sorted(set(children))
+        return list(self.index.children.get(table_name, ()))
+
+    def get_foreign_keys_to(self, table_name: str) -> tuple[ForeignKey, ...]:
+        """Foreign keys of the children tables pointing to a given table."""
+        return self.index.foreign_keys_by_external_table.get(table_name, ())
+
+    def get_foreign_keys_to_fields(self, table_name: str) -> tuple[ForeignKey, ...]:
+        """Foreign keys, of any table, whose external name is a field of a table."""
+        return self.index.foreign_keys_by_external_field.get(table_name, ())
+
+
+@dataclass(frozen=True)
+class CDMTablesIndex:
+    """
+    Relations between a set of CDM tables, computed once.
+
+    Parameters
+    ----------
+    fields:
+      All the fields in the tables.
+    all_foreign_keys:
+      All the foreign keys in the tables.
+    foreign_keys_by_local_table:
+      Foreign keys by the name of the (child) table that defines them.
+    foreign_keys_by_external_table:
+      Foreign keys by the name of the (parent) table they point to, only for the
+      loaded tables.
+    foreign_keys_by_external_field:
+      Foreign keys by the name of the tables that have their external name as a field.
+    children:
+      Sorted names of the children tables of each table.
+    non_unique_fields:
+      Field names that are reused in different tables, foreign keys excluded.
+    """
+
+    fields: frozenset[str]
+    all_foreign_keys: tuple[ForeignKey, ...]
+    foreign_keys_by_local_table: Mapping[str, tuple[ForeignKey, ...]]
+    foreign_keys_by_external_table: Mapping[str, tuple[ForeignKey, ...]]
+    foreign_keys_by_external_field: Mapping[str, tuple[ForeignKey, ...]]
+    children: Mapping[str, tuple[str, ...]]
+    non_unique_fields: tuple[str, ...]
+
+    @classmethod
+    def from_tables(cls, cdm_tables: Mapping[str, CDMTable]) -> "CDMTablesIndex":
+        all_fields = list(chain.from_iterable(t.fields for t in cdm_tables.values()))
+        all_foreign_keys = tuple(
+            chain.from_iterable(t.foreign_keys for t in cdm_tables.values())
+        )
+        foreign_keys_by_local_table = {
+            name: table.foreign_keys for name, table in cdm_tables.items()
+        }
+        children = {
+            name: tuple(
+                sorted(
+                    set(
+                        fk.local_table
+                        for fk in all_foreign_keys
+                        if fk.external_table == name
+                    )
+                )
+            )
+            for name in cdm_tables
+        }
+        foreign_keys_by_external_table = {
+            name: tuple(
+                fk
+                for child in children[name]
+                for fk in cdm_tables[child].foreign_keys
+                if fk.external_table == name
+            )
+            for name in cdm_tables
+        }
+        foreign_keys_by_external_field = {
+            name: tuple(
+                fk for fk in all_foreign_keys if fk.external_name in table.field_set
+            )
+            for name, table in cdm_tables.items()
+        }
+        foreign_keys_left_names = set(fk.name for fk in all_foreign_keys)
+        non_unique_fields = tuple(
+            d for d in get_dupes(all_fields) if d not in foreign_keys_left_names
+        )
+        return cls(
+            fields=frozenset(all_fields),
+            all_foreign_keys=all_foreign_keys,
+            foreign_keys_by_local_table=foreign_keys_by_local_table,
+            foreign_keys_by_external_table=foreign_keys_by_external_table,
+            foreign_keys_by_external_field=foreign_keys_by_external_field,
+            children=children,
+            non_unique_fields=non_unique_fields,
+        )
 
 
 def read_cdm_table(cdm_tables_location: Path, name: str) -> CDMTable:
     """
     Read a Common Data Model table from a CSV text file.
 
-    The files are locate din the git submodule in cdsobs/cdm.
+    The files are locate din the git submodule in cdsobs/cdm. Tables are cached, so
+    they are parsed only once per process (see cdsobs.cdm.cache).
 
     Parameters
     ----------
@@ -176,6 +306,10 @@ def read_cdm_table(cdm_tables_location: Path, name: str) -> CDMTable:
     -------
     CDMTable object which contains the name and a pandas.DataFrame with the data.
     """
+    return get_cached(cdm_tables_location, "table_definitions", name, _read_cdm_table)
+
+
+def _read_cdm_table(cdm_tables_location: Path, name: str) -> CDMTable:
     table_path = Path(cdm_tables_location, f"cdm-obs/table_definitions/{name}.csv")
     table_data = pandas.read_csv(
         table_path,
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import typer
+
+from cdsobs.cli._utils import config_yml_typer
+from cdsobs.config import read_and_validate_config
+from cdsobs.observation_catalogue.database import get_session
+from cdsobs.observation_catalogue.migrations import backfill_day_bitmaps
+
+
+def backfill_day_bitmap_command(
+    cdsobs_config_yml: Path = config_yml_typer,
+    dataset: str = typer.Option("", help="Only backfill the entries of this dataset"),
+    batch_size: int = typer.Option(
+        1000, help="Number of entries updated in each transaction"
+    ),
+):
+    """
+    Compute the day bitmap of the catalogue entries ingested before it existed.
+
+    It is computed from the constraints stored in the catalogue, without downloading
+    the files. Only the entries without it are updated, so it can be run several
+    times. Run upgrade-catalogue first to add the column.
+    """
+    config = read_and_validate_config(cdsobs_config_yml)
+    with get_session(config.catalogue_db) as session:
+        num_updated = backfill_day_bitmaps(session, dataset or None, batch_size)
+    typer.echo(f"Computed the day bitmap of {num_updated} catalogue entries")
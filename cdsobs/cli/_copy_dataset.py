@@ -317,7 +317,9 @@ def catalogue_copy(
         # However if we load them the other attributes will dissappear from __dict__
         # There is no way apparently of doing this better in sqlalchemy
         entry_dict = {
-            col.name: getattr(entry, col.name) for col in entry.__table__.columns
+            col.name: getattr(entry, col.name)
+            for col in entry.__table__.columns
+            if col.computed is None
         }
         entry_dict_json = jsonable_encoder(entry_dict)
         entry_dict_json.pop("id")
@@ -48,6 +48,13 @@ def make_production(
         "CADSOBS_SLACK_HOOK environment variables.",
         show_default=True,
     ),
+    incremental: bool = typer.Option(
+        False,
+        help="Only ingest the data not older than the last ingested report_timestamp "
+        "for this dataset, source and version, appending it to the existing "
+        "partitions.",
+        show_default=True,
+    ),
 ):
     """
     Upload datasets to the CADS observation repository.
@@ -72,4 +79,5 @@ def make_production(
             version,
             disable_cdm_tag_check,
             slack_notify,
+            incremental=incremental,
         )
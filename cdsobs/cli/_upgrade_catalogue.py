@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from cdsobs.cli._utils import config_yml_typer
+from cdsobs.config import read_and_validate_config
+from cdsobs.observation_catalogue.database import get_session
+from cdsobs.observation_catalogue.migrations import upgrade_catalogue
+
+
+def upgrade_catalogue_command(cdsobs_config_yml: Path = config_yml_typer):
+    """
+    Upgrade the schema of an existing catalogue database.
+
+    Adds the columns and indexes introduced by newer versions of cdsobs. It can be run
+    several times, only the missing ones are added.
+    """
+    config = read_and_validate_config(cdsobs_config_yml)
+    with get_session(config.catalogue_db) as session:
+        upgrade_catalogue(session)
@@ -3,6 +3,7 @@ import sys
 
 import typer
 
+from cdsobs.cli._backfill_day_bitmap import backfill_day_bitmap_command
 from cdsobs.cli._catalogue_explorer import (
     catalogue_dataset_info,
     list_catalogue,
@@ -17,6 +18,7 @@ from cdsobs.cli._make_cdm import make_cdm
 from cdsobs.cli._make_production import make_production
 from cdsobs.cli._object_storage import check_consistency
 from cdsobs.cli._retrieve import retrieve
+from cdsobs.cli._upgrade_catalogue import upgrade_catalogue_command
 from cdsobs.cli._utils import exception_handler
 from cdsobs.cli._validate import validate_service_definition
 
@@ -38,6 +40,8 @@ make_cdm = app.command()(make_cdm)
 get_forms_jsons = app.command("get_forms_jsons")(get_forms_jsons_command)
 deprecate_version = app.command()(deprecate_dataset_version)
 enable_version = app.command()(enable_dataset_version)
+upgrade_catalogue = app.command("upgrade-catalogue")(upgrade_catalogue_command)
+backfill_day_bitmap = app.command("backfill-day-bitmap")(backfill_day_bitmap_command)
 
 
 def main():
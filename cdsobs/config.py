@@ -30,10 +30,17 @@ class DBConfig(pydantic.BaseModel):
     host: str
     port: int
     db_name: str
-
-    def get_url(self) -> str:
+    # Maximum number of connections open at the same time by the readers of this
+    # process (or of all the processes in the host, see ConnectionBudget).
+    max_connections: int = 1
+    # Size of the connection pool of each process of the HTTP API, and connections
+    # that can be opened temporarily on top of it.
+    pool_size: int = 5
+    max_overflow: int = 10
+
+    def get_url(self, scheme: str = "postgresql") -> str:
         url = pydantic.PostgresDsn.build(
-            scheme="postgresql",
+            scheme=scheme,
             username=self.db_user,
             password=self.pwd,
             host=self.host,
@@ -42,6 +49,10 @@ class DBConfig(pydantic.BaseModel):
         )
         return url.unicode_string()
 
+    def get_async_url(self) -> str:
+        """URL using the asyncpg driver, for the SQLAlchemy asyncio engine."""
+        return self.get_url(scheme="postgresql+asyncpg")
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, DBConfig):
             return NotImplemented
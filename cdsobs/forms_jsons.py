@@ -17,6 +17,9 @@ from cdsobs.config import CDSObsConfig
 from cdsobs.constraints import iterative_ordering
 from cdsobs.observation_catalogue.models import CadsDatasetVersion, Catalogue
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
+from cdsobs.observation_catalogue.repositories.version_stamp import (
+    VersionStampRepository,
+)
 from cdsobs.retrieve.retrieve_services import merged_constraints_table
 from cdsobs.service_definition.api import get_service_definition
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
@@ -64,6 +67,8 @@ def get_forms_jsons(
         for json_file in json_files:
             logger.info(f"Uploading {json_file} to the storage.")
             storage_client.upload_file(bucket, json_file.name, json_file)
+        # Invalidate the responses of the HTTP API for this dataset
+        VersionStampRepository(session).bump(dataset)
     return json_files
 
 
@@ -1,7 +1,7 @@
 from importlib import import_module
 from pathlib import Path
 from pprint import pformat
-from typing import List
+from typing import Iterable, List
 
 import numpy
 import pandas
@@ -17,17 +17,25 @@ from cdsobs.ingestion.core import (
     DatasetReaderFunctionCallable,
     TimeSpaceBatch,
 )
+from cdsobs.ingestion.melt import melt_variables
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.service_definition.service_definition_models import (
     MeltColumns,
     ServiceDefinition,
     SourceDefinition,
-    UncertaintyColumn,
-    UncertaintyType,
 )
 from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import gather_categorical
 
 logger = get_logger(__name__)
+# String columns with few distinct values, stored as categoricals to save memory.
+CATEGORICAL_COLUMNS = [
+    "observed_variable",
+    "primary_station_id",
+    "station_name",
+    "units",
+    "original_units",
+]
 
 
 def join_header_and_data(
@@ -155,7 +163,12 @@ def cast_to_descriptions(
     for colname, desc in source_definition.descriptions.items():
         if colname in data_renamed and desc.dtype is not None:
             final_dtype = desc.dtype
-            if final_dtype == "object":
+            if final_dtype == "object" and (
+                colname in CATEGORICAL_COLUMNS
+                or isinstance(data_renamed[colname].dtype, pandas.CategoricalDtype)
+            ):
+                data_renamed[colname] = to_string_categorical(data_renamed[colname])
+            elif final_dtype == "object":
                 # pandas dtypes behave in annoying ways. Here we have to compare
                 # with object but cast to string so we do not end up with
                 # "integer" objects that will be casted back to int64 undexpectedly
@@ -175,15 +188,26 @@ def cast_to_descriptions(
     return data_renamed
 
 
+def to_string_categorical(series: pandas.Series) -> pandas.Series:
+    """
+    Cast a column to a categorical of strings, with missing values set to "null".
+
+    This is the categorical version of astype("string").fillna("null"), only the
+    unique values are converted to strings.
+    """
+    codes, uniques = pandas.factorize(series)
+    labels = numpy.append(pandas.Index(uniques).astype(str).to_numpy(), "null")
+    # Missing values take the "null" label
+    codes = numpy.where(codes < 0, len(uniques), codes)
+    categorical = gather_categorical(labels, codes)
+    return pandas.Series(categorical, index=series.index, name=series.name)
+
+
 def sort(partition: DatasetPartition) -> DatasetPartition:
     """Sort data of a partition."""
-    logger.info("Sorting partition data")
-    space_columns = partition.dataset_metadata.space_columns
-    latname = space_columns.y
-    lonname = space_columns.x
-    partition.data.sort_values(
-        by=["report_timestamp", latname, lonname], kind="mergesort", inplace=True
-    )
+    sort_key = partition.dataset_metadata.get_sort_key()
+    logger.info(f"Sorting partition data by {sort_key}")
+    partition.data.sort_values(by=sort_key, kind="mergesort", inplace=True)
     return partition
 
 
@@ -230,13 +254,26 @@ def read_batch_data(
         time_space_batch,
         **reader_extra_args,
     )
-    # Check of there is data for this time batch
-    if len(data_table) == 0:
-        raise EmptyBatchException
-    logger.info("Validating and homogenising data tables")
-    homogenised_data = validate_and_homogenise(data_table, service_definition, source)
-    # Explicitly remove this reference to reduce memory usage
-    del data_table
+    if isinstance(data_table, pandas.DataFrame):
+        # Check of there is data for this time batch
+        if len(data_table) == 0:
+            raise EmptyBatchException
+        logger.info("Validating and homogenising data tables")
+        homogenised_data = validate_and_homogenise(
+            data_table, service_definition, source
+        )
+        # Explicitly remove this reference to reduce memory usage
+        del data_table
+    else:
+        # The reader streams the data in chunks, which are homogenised as they are
+        # read, so the raw data is never fully loaded.
+        logger.info("Validating and homogenising data tables chunk by chunk")
+        homogenised_data = concat_chunks(
+            validate_and_homogenise(chunk, service_definition, source)
+            for chunk in data_table
+        )
+        if len(homogenised_data) == 0:
+            raise EmptyBatchException
     source_definition = service_definition.sources[source]
     if source_definition.cdm_mapping.melt_columns is not None:
         logger.info("Melting variable columns as requested")
@@ -249,6 +286,28 @@ def read_batch_data(
     return homogenised_data
 
 
+def concat_chunks(chunks: Iterable[pandas.DataFrame]) -> pandas.DataFrame:
+    """
+    Concatenate tables read in chunks.
+
+    The categories of the categorical columns are unified first, so they are not
+    converted to object when the categories of the chunks differ.
+    """
+    chunk_list = list(chunks)
+    if len(chunk_list) == 0:
+        return pandas.DataFrame()
+    for colname in chunk_list[0].columns:
+        dtypes = [chunk[colname].dtype for chunk in chunk_list if colname in chunk]
+        if all(isinstance(d, pandas.CategoricalDtype) for d in dtypes):
+            categories = dtypes[0].categories
+            for dtype in dtypes[1:]:
+                categories = categories.union(dtype.categories)
+            for chunk in chunk_list:
+                if colname in chunk:
+                    chunk[colname] = chunk[colname].cat.set_categories(categories)
+    return pandas.concat(chunk_list, ignore_index=True)
+
+
 class EmptyBatchException(Exception):
     pass
 
@@ -307,20 +366,11 @@ def _melt_variables(
     codes defined in the observed_variable CDM table. This will fail if the variable is
     not in the table.
     """
-    id_vars = [col for col in homogenised_data.columns if col not in variables]
-    homogenised_data_melted = homogenised_data.melt(
-        id_vars=id_vars,
-        value_vars=variables,
-        var_name="observed_variable",
-        value_name="observation_value",
-    )
-    # New observation id unique for each observation value
-    if "observation_id" not in homogenised_data_melted:
-        logger.info("Adding new observation id (only unique for this chunk)")
-        homogenised_data_melted["observation_id"] = homogenised_data_melted.index
-    # Handle auxiliary variables
-    homogenised_data_melted = _handle_aux_variables(
-        melt_columns, cdm_tables_location, homogenised_data_melted
+    uncertainty_type_table = read_cdm_code_table(
+        cdm_tables_location, "uncertainty_type"
+    ).table
+    homogenised_data_melted = melt_variables(
+        homogenised_data, variables, melt_columns, uncertainty_type_table
     )
 
     # Encode observed_variables
@@ -333,101 +383,7 @@ def _melt_variables(
     ).to_dict()
     # Check for variables not in the code table
     cdm_vars = set(code_dict)
-    not_found = set(homogenised_data_melted["observed_variable"].unique()) - cdm_vars
+    not_found = set(variables) - cdm_vars
     if len(not_found) > 0:
         logger.warning(f"Some variables were not found in the CDM: {not_found}")
     return homogenised_data_melted
-
-
-def _handle_aux_variables(
-    melt_columns: MeltColumns,
-    cdm_tables_location: Path,
-    homogenised_data_melted: pandas.DataFrame,
-) -> pandas.DataFrame:
-    uncertainty_type_table = read_cdm_code_table(
-        cdm_tables_location, "uncertainty_type"
-    ).table
-    logger.info("Aligning auxiliary variables with melted ones")
-    if melt_columns.uncertainty is not None:
-        homogenised_data_melted = _add_uncertainty_fields(
-            melt_columns.uncertainty, homogenised_data_melted, uncertainty_type_table
-        )
-    # Add quality flags
-    if melt_columns.quality_flag is not None:
-        na_quality_flag = 3
-        homogenised_data_melted["quality_flag"] = na_quality_flag
-        for qf_col in melt_columns.quality_flag["quality_flag"]:
-            var_mask = (
-                homogenised_data_melted["observed_variable"] == qf_col.main_variable
-            )
-            var_quality_flag = (
-                homogenised_data_melted.loc[var_mask, qf_col.name]
-                .fillna(na_quality_flag)
-                .astype("int")
-            )
-            homogenised_data_melted.loc[var_mask, "quality_flag"] = var_quality_flag
-            homogenised_data_melted = homogenised_data_melted.drop(qf_col.name, axis=1)
-            # Ensure is int and fill nans with 3 (missing according to the CDM)
-        homogenised_data_melted["quality_flag"] = (
-            homogenised_data_melted["quality_flag"].fillna(3).astype("uint8")
-        )
-    # Add processing level
-    if melt_columns.processing_level:
-        na_processing_level = 6
-        homogenised_data_melted["processing_level"] = na_processing_level
-        for pl_col in melt_columns.processing_level["processing_level"]:
-            var_mask = (
-                homogenised_data_melted["observed_variable"] == pl_col.main_variable
-            )
-            var_processing_level = (
-                homogenised_data_melted.loc[var_mask, pl_col.name]
-                .fillna(na_processing_level)
-                .astype("int")
-            )
-            homogenised_data_melted.loc[
-                var_mask, "processing_level"
-            ] = var_processing_level
-            homogenised_data_melted = homogenised_data_melted.drop(pl_col.name, axis=1)
-        homogenised_data_melted["processing_level"] = homogenised_data_melted[
-            "processing_level"
-        ].astype("uint8")
-    return homogenised_data_melted
-
-
-def _add_uncertainty_fields(
-    uncertainty_fields: dict[UncertaintyType, list[UncertaintyColumn]],
-    homogenised_data_melted,
-    uncertainty_type_table,
-):
-    for unc_type, unc_cols in uncertainty_fields.items():
-        unc_type_code = uncertainty_type_table.loc[
-            uncertainty_type_table.loc[:, "name"]
-            == unc_type.replace("_uncertainty", "").replace("_", " ")
-        ].index.item()
-        uncertainty_value_name = f"uncertainty_value{unc_type_code}"
-        uncertainty_type_name = f"uncertainty_type{unc_type_code}"
-        uncertainty_units_name = f"uncertainty_units{unc_type_code}"
-        homogenised_data_melted[uncertainty_value_name] = numpy.nan
-        homogenised_data_melted[uncertainty_type_name] = unc_type_code
-        homogenised_data_melted[uncertainty_type_name] = homogenised_data_melted[
-            uncertainty_type_name
-        ].astype("uint8")
-        homogenised_data_melted[uncertainty_units_name] = "NA"
-
-        for unc_col in unc_cols:
-            var = unc_col.main_variable
-            var_mask = homogenised_data_melted["observed_variable"] == var
-            # Fill the columns
-            homogenised_data_melted.loc[
-                var_mask, uncertainty_value_name
-            ] = homogenised_data_melted.loc[var_mask, unc_col.name]
-            homogenised_data_melted.loc[var_mask, uncertainty_type_name] = unc_type_code
-            homogenised_data_melted.loc[
-                var_mask, uncertainty_units_name
-            ] = unc_col.units
-            homogenised_data_melted = homogenised_data_melted.drop(unc_col.name, axis=1)
-
-        homogenised_data_melted[uncertainty_value_name] = homogenised_data_melted[
-            uncertainty_value_name
-        ].astype("float32")
-    return homogenised_data_melted
@@ -2,7 +2,7 @@ import dataclasses
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Literal, Optional, Protocol, Tuple, cast
+from typing import Iterator, Literal, Optional, Protocol, Tuple, cast
 
 import pandas
 from dateutil.relativedelta import relativedelta
@@ -12,7 +12,10 @@ from cdsobs.cdm.code_tables import CDMCodeTables
 from cdsobs.cdm.tables import CDMTables
 from cdsobs.config import CDSObsConfig
 from cdsobs.observation_catalogue.schemas.catalogue import CatalogueSchema
-from cdsobs.observation_catalogue.schemas.constraints import ConstraintsSchema
+from cdsobs.observation_catalogue.schemas.constraints import (
+    ConstraintsSchema,
+    PartitionSummary,
+)
 from cdsobs.service_definition.service_definition_models import (
     ServiceDefinition,
     SpaceColumns,
@@ -84,6 +87,15 @@ class DatasetMetadata:
     cdm_code_tables: CDMCodeTables
     space_columns: SpaceColumns
     version: str
+    sort_key: list[str] | None = None
+    # True if observation_id was generated when melting, so it is not an identity
+    generated_observation_id: bool = False
+
+    def get_sort_key(self) -> list[str]:
+        """Columns the partitions are sorted by, time and coordinates by default."""
+        if self.sort_key is not None:
+            return self.sort_key
+        return ["report_timestamp", self.space_columns.y, self.space_columns.x]
 
 
 def get_variables_from_service_definition(
@@ -163,6 +175,7 @@ class SerializedPartition:
     partition_params: PartitionParams
     dataset_metadata: DatasetMetadata
     constraints: ConstraintsSchema
+    summary: PartitionSummary | None = None
 
 
 def to_catalogue_record(partition: SerializedPartition, asset: str) -> CatalogueSchema:
@@ -170,6 +183,7 @@ def to_catalogue_record(partition: SerializedPartition, asset: str) -> Catalogue
     dataset_params = partition.dataset_metadata
     partition_params = partition.partition_params
     file_params = partition.file_params
+    summary = partition.summary
     catalogue_record = CatalogueSchema(
         dataset=dataset_params.name,
         dataset_source=dataset_params.dataset_source,
@@ -179,7 +193,10 @@ def to_catalogue_record(partition: SerializedPartition, asset: str) -> Catalogue
         latitude_coverage_end=partition_params.latitude_coverage_end,
         longitude_coverage_start=partition_params.longitude_coverage_start,
         longitude_coverage_end=partition_params.longitude_coverage_end,
-        variables=dataset_params.variables,
+        # The variables actually in the file, so filtering by variable prunes entries
+        variables=(
+            dataset_params.variables if summary is None else summary.variables
+        ),
         stations=partition_params.stations_ids,
         sources=partition_params.sources,
         asset=asset,
@@ -188,6 +205,12 @@ def to_catalogue_record(partition: SerializedPartition, asset: str) -> Catalogue
         file_checksum=file_params.file_checksum,
         constraints=partition.constraints,
         version=SemanticVersion.parse(dataset_params.version),
+        sort_key=dataset_params.get_sort_key(),
+        variable_counts=None if summary is None else summary.variable_counts,
+        station_day_ranges=None if summary is None else summary.station_day_ranges,
+        day_bitmap=partition.constraints.get_day_bitmap(
+            partition_params.time_coverage_start
+        ),
     )
     return catalogue_record
 
@@ -203,7 +226,7 @@ class DatasetReaderFunctionCallable(Protocol):
         source: str,
         time_batch: Optional[TimeSpaceBatch],
         **kwargs,
-    ) -> pandas.DataFrame:
+    ) -> pandas.DataFrame | Iterator[pandas.DataFrame]:
         ...
 
 
@@ -214,3 +237,6 @@ class IngestionRunParams:
     version: str
     config: CDSObsConfig
     service_definition: ServiceDefinition
+    # Only ingest the data not older than the watermark, appending it to the
+    # partitions.
+    incremental: bool = False
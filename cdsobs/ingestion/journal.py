@@ -0,0 +1,102 @@
+"""Journal of the partitions ingested, so make_production can resume after a crash."""
+
+from datetime import datetime
+from typing import Literal
+
+from sqlalchemy.orm import Session
+
+from cdsobs.ingestion.core import TimeSpaceBatch
+from cdsobs.observation_catalogue.repositories.ingestion_journal import (
+    IngestionJournalRepository,
+)
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+PartitionState = Literal["read", "serialized", "uploaded", "committed"]
+# Name of the entry that marks a whole batch as committed
+BATCH_ENTRY = "__batch__"
+
+
+def get_batch_id(
+    time_space_batch: TimeSpaceBatch, watermark: datetime | None = None
+) -> str:
+    """
+    Return a readable identifier of a batch.
+
+    Incremental runs include the watermark, as the same batch is read again each time
+    the watermark moves.
+    """
+    time_batch = time_space_batch.time_batch
+    batch_id = str(time_batch.year)
+    if time_batch.month is not None:
+        batch_id += f"-{time_batch.month:02d}"
+    if time_space_batch.space_batch == "global":
+        batch_id += "_global"
+    else:
+        batch_id += "_" + "_".join(
+            str(c) for c in time_space_batch.get_spatial_coverage()
+        )
+    if watermark is not None:
+        batch_id += f"_since_{watermark:%Y%m%dT%H%M%S}"
+    return batch_id
+
+
+class IngestionJournal:
+    """
+    State of the partitions of a batch, stored in the catalogue database.
+
+    Each partition goes through the states read, serialized, uploaded (to the storage)
+    and committed (to the catalogue). The states are read once when the journal is
+    created, and written each time they change.
+
+    Parameters
+    ----------
+    session:
+      Session in the catalogue database.
+    dataset:
+      Name of the dataset.
+    dataset_source:
+      Source of the dataset being ingested.
+    version:
+      Version of the dataset being ingested.
+    batch:
+      Identifier of the batch, see get_batch_id.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        dataset: str,
+        dataset_source: str,
+        version: str,
+        batch: str,
+    ):
+        self.repository = IngestionJournalRepository(session)
+        self.key = (dataset, dataset_source, version, batch)
+        self.states = self.repository.get_states(*self.key)
+
+    def is_batch_committed(self) -> bool:
+        return self.states.get(BATCH_ENTRY) == "committed"
+
+    def has_pending_partitions(self) -> bool:
+        """Whether a previous run was interrupted while ingesting this batch."""
+        return any(
+            state != "committed"
+            for partition, state in self.states.items()
+            if partition != BATCH_ENTRY
+        )
+
+    def get_state(self, partition: str) -> PartitionState | None:
+        return self.states.get(partition)  # type: ignore[return-value]
+
+    def set_state(self, partition: str, state: PartitionState):
+        logger.debug(f"Partition {partition} is {state}")
+        self.repository.set_state(*self.key, partition, state)
+        self.states[partition] = state
+
+    def commit_batch(self):
+        """Replace the entries of the partitions by a single one for the batch."""
+        self.repository.delete_batch(*self.key)
+        self.repository.set_state(*self.key, BATCH_ENTRY, "committed")
+        self.states = {BATCH_ENTRY: "committed"}
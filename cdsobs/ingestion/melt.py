@@ -0,0 +1,184 @@
+"""Melt the variable columns of wide-table sources (like WOUDC, GRUAN or USCRN)."""
+
+from typing import Any, List
+
+import numpy
+import pandas
+
+from cdsobs.service_definition.service_definition_models import (
+    MeltColumns,
+    UncertaintyColumn,
+    UncertaintyType,
+)
+from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import gather_categorical
+
+logger = get_logger(__name__)
+
+NA_QUALITY_FLAG = 3
+NA_PROCESSING_LEVEL = 6
+# Set in the attrs of the melted table when observation_id is generated by melt
+GENERATED_OBSERVATION_ID = "generated_observation_id"
+
+
+def melt_variables(
+    data: pandas.DataFrame,
+    variables: List[str],
+    melt_columns: MeltColumns,
+    uncertainty_type_table: pandas.DataFrame,
+) -> pandas.DataFrame:
+    """
+    Collapse the variable columns into observed_variable and observation_value.
+
+    The output is the same as DataFrame.melt followed by aligning the auxiliary
+    columns (uncertainty, quality flag and processing level) with their main
+    variables, but every output column is allocated only once. The melted table is
+    made of one block of rows per variable, so the id columns are tiled, the value
+    columns are stacked, and the auxiliary columns are copied into the block of
+    their main variable instead of being located with masks.
+
+    Parameters
+    ----------
+    data:
+      Wide table with one column per variable.
+    variables:
+      Names of the variable columns to melt.
+    melt_columns:
+      Auxiliary columns of the variables, from the service definition.
+    uncertainty_type_table:
+      uncertainty_type CDM code table.
+
+    Returns
+    -------
+    The melted table, with the auxiliary columns removed. If data has no
+    observation_id, it is generated and GENERATED_OBSERVATION_ID is set in its attrs.
+    """
+    aux_columns = _get_aux_columns(melt_columns)
+    id_vars = [
+        col for col in data.columns if col not in variables and col not in aux_columns
+    ]
+    nrows = len(data)
+    blocks = _Blocks(variables, nrows)
+    melted: dict[str, Any] = {col: _tile(data[col], len(variables)) for col in id_vars}
+    melted["observed_variable"] = pandas.Categorical.from_codes(
+        numpy.repeat(numpy.arange(len(variables)), nrows), categories=variables
+    )
+    melted["observation_value"] = pandas.concat(
+        [data[v] for v in variables], ignore_index=True
+    ).array
+    # New observation id unique for each observation value
+    generated_observation_id = "observation_id" not in melted
+    if generated_observation_id:
+        logger.info("Adding new observation id (only unique for this chunk)")
+        melted["observation_id"] = numpy.arange(blocks.size)
+    logger.info("Aligning auxiliary variables with melted ones")
+    if melt_columns.uncertainty is not None:
+        _add_uncertainty_fields(
+            melted, data, blocks, melt_columns.uncertainty, uncertainty_type_table
+        )
+    if melt_columns.quality_flag is not None:
+        melted["quality_flag"] = _align_flag(
+            data, blocks, melt_columns.quality_flag["quality_flag"], NA_QUALITY_FLAG
+        )
+    if melt_columns.processing_level:
+        melted["processing_level"] = _align_flag(
+            data,
+            blocks,
+            melt_columns.processing_level["processing_level"],
+            NA_PROCESSING_LEVEL,
+        )
+    melted_data = pandas.DataFrame(melted, copy=False)
+    melted_data.attrs[GENERATED_OBSERVATION_ID] = generated_observation_id
+    return melted_data
+
+
+class _Blocks:
+    """Position of the rows of each variable in the melted table."""
+
+    def __init__(self, variables: List[str], nrows: int):
+        self.variable_index = {v: i for i, v in enumerate(variables)}
+        self.nrows = nrows
+        self.size = nrows * len(variables)
+
+    def get(self, variable: str) -> slice | None:
+        """Return the rows of the variable, None if it is not melted."""
+        if variable not in self.variable_index:
+            return None
+        start = self.variable_index[variable] * self.nrows
+        return slice(start, start + self.nrows)
+
+
+def _get_aux_columns(melt_columns: MeltColumns) -> set[str]:
+    aux_columns: set[str] = set()
+    if melt_columns.uncertainty is not None:
+        for unc_cols in melt_columns.uncertainty.values():
+            aux_columns.update(c.name for c in unc_cols)
+    if melt_columns.quality_flag is not None:
+        aux_columns.update(c.name for c in melt_columns.quality_flag["quality_flag"])
+    if melt_columns.processing_level:
+        aux_columns.update(
+            c.name for c in melt_columns.processing_level["processing_level"]
+        )
+    return aux_columns
+
+
+def _tile(
+    series: pandas.Series, reps: int
+) -> numpy.ndarray | pandas.api.extensions.ExtensionArray:
+    """Repeat the whole column reps times."""
+    if isinstance(series.dtype, numpy.dtype):
+        return numpy.tile(series.to_numpy(), reps)
+    else:
+        # Extension arrays, categoricals only tile the codes.
+        return series.array.take(numpy.tile(numpy.arange(len(series)), reps))
+
+
+def _add_uncertainty_fields(
+    melted: dict[str, Any],
+    data: pandas.DataFrame,
+    blocks: _Blocks,
+    uncertainty_fields: dict[UncertaintyType, list[UncertaintyColumn]],
+    uncertainty_type_table: pandas.DataFrame,
+):
+    for unc_type, unc_cols in uncertainty_fields.items():
+        unc_type_code = uncertainty_type_table.loc[
+            uncertainty_type_table.loc[:, "name"]
+            == unc_type.replace("_uncertainty", "").replace("_", " ")
+        ].index.item()
+        uncertainty_value = numpy.full(blocks.size, numpy.nan, dtype="float32")
+        # Units are gathered from this labels, "NA" for the variables without
+        # uncertainty.
+        units_labels = ["NA"]
+        units_codes = numpy.zeros(blocks.size, dtype="int64")
+        for unc_col in unc_cols:
+            block = blocks.get(unc_col.main_variable)
+            if block is None:
+                continue
+            uncertainty_value[block] = data[unc_col.name].to_numpy(
+                dtype="float32", na_value=numpy.nan
+            )
+            units_codes[block] = len(units_labels)
+            units_labels.append(unc_col.units)
+        melted[f"uncertainty_value{unc_type_code}"] = uncertainty_value
+        melted[f"uncertainty_type{unc_type_code}"] = numpy.full(
+            blocks.size, unc_type_code, dtype="uint8"
+        )
+        melted[f"uncertainty_units{unc_type_code}"] = gather_categorical(
+            numpy.array(units_labels, dtype=object), units_codes
+        )
+
+
+def _align_flag(
+    data: pandas.DataFrame,
+    blocks: _Blocks,
+    flag_columns: list,
+    na_value: int,
+) -> numpy.ndarray:
+    """Build a quality flag or processing level column, na_value where missing."""
+    flag = numpy.full(blocks.size, na_value, dtype="uint8")
+    for flag_col in flag_columns:
+        block = blocks.get(flag_col.main_variable)
+        if block is None:
+            continue
+        flag[block] = data[flag_col.name].fillna(na_value).astype("int").to_numpy()
+    return flag
@@ -1,12 +1,15 @@
+import dataclasses
 import tempfile
 from pathlib import Path
 from typing import Any, Iterable, Iterator, Literal, Tuple, cast
 
+import numpy
 import pandas
 import sqlalchemy as sa
 from sqlalchemy.orm import Session
 
 from cdsobs.cdm.tables import STATION_COLUMN
+from cdsobs.ingestion.api import sort
 from cdsobs.ingestion.core import (
     DatasetMetadata,
     DatasetPartition,
@@ -16,7 +19,13 @@ from cdsobs.ingestion.core import (
     TimeBatch,
     to_catalogue_record,
 )
-from cdsobs.ingestion.serialize import serialize_partition, to_storage
+from cdsobs.ingestion.journal import IngestionJournal, PartitionState
+from cdsobs.ingestion.serialize import (
+    get_partition_filename,
+    read_partition_file,
+    serialize_partition,
+    to_storage,
+)
 from cdsobs.observation_catalogue.models import Catalogue
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.observation_catalogue.schemas.constraints import get_partition_constraints
@@ -26,6 +35,14 @@ from cdsobs.utils.types import BoundedLat, BoundedLon
 
 logger = get_logger(__name__)
 
+# Columns identifying an observation when observation_id is generated by melt
+NATURAL_KEY_COLUMNS = [
+    STATION_COLUMN,
+    "report_timestamp",
+    "observed_variable",
+    "z_coordinate",
+]
+
 
 def get_partitions(
     dataset_params: DatasetMetadata,
@@ -102,6 +119,8 @@ def save_partitions(
     db_session: Session,
     storage_client: StorageClient,
     partitions: Iterable[DatasetPartition],
+    append: bool = False,
+    journal: IngestionJournal | None = None,
 ):
     """
     Save partitions to storage and catalogue.
@@ -116,11 +135,19 @@ def save_partitions(
       Client providing an interface to the storage.
     partitions :
       Partitions yielded from the previous ingestion steps.
+    append :
+      If True, the data of the partitions that already exist is appended to the
+      stored files, which are rewritten, instead of being compared with them.
+    journal :
+      If given, the state of each partition is written there, and the partitions
+      already committed by a previous run are skipped.
     """
     logger.info("Reading Observations Common Data Model tables")
     with tempfile.TemporaryDirectory() as tempdir:
         for partition in partitions:
-            _save_partition(db_session, partition, storage_client, tempdir)
+            _save_partition(
+                db_session, partition, storage_client, tempdir, append, journal
+            )
 
 
 def _save_partition(
@@ -128,13 +155,36 @@ def _save_partition(
     partition: DatasetPartition,
     storage_client: StorageClient,
     tempdir: str,
+    append: bool = False,
+    journal: IngestionJournal | None = None,
 ):
     """Save one partition to storage.
 
     If the partition already exists in the storage and it is different, a merge is
     carried out.
     """
+    partition_name = get_partition_filename(
+        partition.dataset_metadata, partition.partition_params
+    )
+    if journal is not None and journal.get_state(partition_name) == "committed":
+        logger.info("This partition was committed by a previous run, skipping.")
+        return None
+    _set_journal_state(journal, partition_name, "read")
+    if append:
+        catalogue_record = get_partition_record(db_session, storage_client, partition)
+        if catalogue_record is not None:
+            logger.info("This partition already exists, appending the new data")
+            merge_partition(
+                db_session,
+                partition,
+                catalogue_record,
+                storage_client,
+                Path(tempdir),
+                journal,
+            )
+            return None
     serialized_partition = serialize_partition(partition, Path(tempdir))
+    _set_journal_state(journal, partition_name, "serialized")
     # Check the status of the partition in the storage & catalogue
     # Can be "new", "exists_identical" or "exists_different".
     partition_status = get_partition_status(
@@ -147,15 +197,34 @@ def _save_partition(
     match partition_status:
         case "exists_identical":
             logger.info("An identical partition has been already uploaded, skipping.")
+            _set_journal_state(journal, partition_name, "committed")
             return None
         case "new":
             partition_to_upload = serialized_partition
         case "exists_different":
-            raise RuntimeError("Partition exists but it is different")
+            catalogue_record = get_partition_record(
+                db_session, storage_client, partition
+            )
+            merge_partition(
+                db_session,
+                partition,
+                cast(Catalogue, catalogue_record),
+                storage_client,
+                Path(tempdir),
+                journal,
+            )
+            return None
         case _:
             raise RuntimeError(f"{partition_status} is an invalid status for partition")
     # Upload
-    upload_partition(db_session, partition_to_upload, storage_client)
+    upload_partition(db_session, partition_to_upload, storage_client, journal)
+
+
+def _set_journal_state(
+    journal: IngestionJournal | None, partition_name: str, state: PartitionState
+):
+    if journal is not None:
+        journal.set_state(partition_name, state)
 
 
 def get_partition_status(
@@ -190,10 +259,166 @@ def get_partition_status(
         return "new"
 
 
+def get_partition_record(
+    db_session: Session,
+    storage_client: StorageClient,
+    partition: DatasetPartition,
+) -> Catalogue | None:
+    """Return the catalogue record of a partition, None if it has not been uploaded."""
+    bucket_name = storage_client.get_bucket_name(partition.dataset_metadata.name)
+    filename = get_partition_filename(
+        partition.dataset_metadata, partition.partition_params
+    )
+    partition_asset = storage_client.get_asset(bucket_name, filename)
+    return db_session.scalars(
+        sa.select(Catalogue).filter(Catalogue.asset == partition_asset).limit(1)
+    ).first()
+
+
+def merge_partition(
+    db_session: Session,
+    partition: DatasetPartition,
+    catalogue_record: Catalogue,
+    storage_client: StorageClient,
+    tempdir: Path,
+    journal: IngestionJournal | None = None,
+):
+    """
+    Merge the data of a partition with the stored one and rewrite it.
+
+    The stored file is downloaded and read back to a table, and merged with the new
+    data with merge_partition_data. The merged data is sorted and the stations and
+    constraints are computed again for the whole partition.
+    """
+    stored_path = download_partition(storage_client, catalogue_record, tempdir)
+    stored_data = read_partition_file(stored_path)
+    merged_data = merge_partition_data(
+        stored_data,
+        partition.data,
+        partition.dataset_metadata.generated_observation_id,
+    )
+    logger.info(
+        f"Merged {len(partition.data)} rows into a partition of {len(stored_data)} "
+        f"rows, the result has {len(merged_data)} rows."
+    )
+    merged_partition = sort(rebuild_partition(partition, merged_data))
+    serialized_partition = serialize_partition(merged_partition, tempdir)
+    partition_name = serialized_partition.file_params.local_temp_path.name
+    _set_journal_state(journal, partition_name, "serialized")
+    rewrite_partition(
+        db_session,
+        serialized_partition,
+        catalogue_record,
+        stored_path,
+        storage_client,
+        journal,
+    )
+
+
+def merge_partition_data(
+    stored_data: pandas.DataFrame,
+    new_data: pandas.DataFrame,
+    generated_observation_id: bool = False,
+) -> pandas.DataFrame:
+    """
+    Concatenate two tables, keeping the new rows when an observation is repeated.
+
+    Observations are identified by observation_id. If it was generated when melting
+    it is only unique within each batch, so the natural key (station, time, variable
+    and height) is used instead, and observation_id is generated again for the
+    merged table. Repeated observations in new_data are dropped, keeping the last.
+    """
+    if generated_observation_id:
+        key = [
+            c
+            for c in NATURAL_KEY_COLUMNS
+            if c in stored_data.columns and c in new_data.columns
+        ]
+    else:
+        key = ["observation_id"]
+    new_data = new_data.drop_duplicates(key, keep="last")
+    is_replaced = pandas.MultiIndex.from_frame(stored_data[key]).isin(
+        pandas.MultiIndex.from_frame(new_data[key])
+    )
+    merged_data = pandas.concat(
+        [stored_data.loc[~is_replaced], new_data], ignore_index=True
+    )
+    if generated_observation_id:
+        merged_data["observation_id"] = numpy.arange(len(merged_data))
+    return merged_data
+
+
+def download_partition(
+    storage_client: StorageClient, catalogue_record: Catalogue, tempdir: Path
+) -> Path:
+    """Download the file of a partition, prefixed so it is not overwritten."""
+    bucket_name, object_name = catalogue_record.asset.split("/")
+    stored_path = Path(tempdir, f"stored_{object_name}")
+    logger.debug(f"Downloading {catalogue_record.asset} to {stored_path}")
+    storage_client.download_file(bucket_name, object_name, stored_path)
+    return stored_path
+
+
+def rebuild_partition(
+    partition: DatasetPartition, data: pandas.DataFrame
+) -> DatasetPartition:
+    """Return a copy of the partition with new data, updating stations and constraints."""
+    station_ids = sorted(data[STATION_COLUMN].unique().astype("str").tolist())
+    partition_params = dataclasses.replace(
+        partition.partition_params, stations_ids=station_ids
+    )
+    constraints = get_partition_constraints(data, time_column="report_timestamp")
+    return DatasetPartition(
+        partition.dataset_metadata, partition_params, data, constraints
+    )
+
+
+def rewrite_partition(
+    db_session: Session,
+    partition: SerializedPartition,
+    catalogue_record: Catalogue,
+    stored_path: Path,
+    storage_client: StorageClient,
+    journal: IngestionJournal | None = None,
+):
+    """
+    Replace a partition in the storage and update its catalogue record in place.
+
+    If the catalogue can not be updated the stored file is uploaded again, so the
+    storage and the catalogue are kept consistent.
+    """
+    logger.debug("Rewriting partition in the object storage")
+    asset = to_storage(
+        storage_client,
+        partition.dataset_metadata.name,
+        partition.file_params.local_temp_path,
+    )
+    partition_name = partition.file_params.local_temp_path.name
+    _set_journal_state(journal, partition_name, "uploaded")
+    try:
+        catalogue_repository = CatalogueRepository(session=db_session)
+        catalogue_repository.update(
+            catalogue_record, obj_in=to_catalogue_record(partition, asset)
+        )
+        logger.debug(f"Updated {catalogue_record.id=} in the catalogue database")
+    except (Exception, KeyboardInterrupt):
+        # rollback
+        db_session.rollback()
+        bucket_name, object_name = asset.split("/")
+        storage_client.upload_file(bucket_name, object_name, stored_path)
+        logger.error(
+            "Error when updating the Catalogue/Storage. Changes have been "
+            "rolled back to ensure consistency."
+        )
+        raise
+    _set_journal_state(journal, partition_name, "committed")
+
+
 def upload_partition(
     db_session: Session,
     partition: SerializedPartition,
     storage_client: StorageClient,
+    journal: IngestionJournal | None = None,
 ):
     """Upload data to storage and catalogue database."""
     logger.debug("Uploading to object storage")
@@ -204,6 +429,8 @@ def upload_partition(
         partition.file_params.local_temp_path,
     )
     logger.debug(f"Uploaded file {asset}")
+    partition_name = partition.file_params.local_temp_path.name
+    _set_journal_state(journal, partition_name, "uploaded")
     try:
         # Save to catalogue
         catalogue_record = to_catalogue_record(partition, asset)
@@ -221,3 +448,4 @@ def upload_partition(
             "rolled back to ensure consistency."
         )
         raise
+    _set_journal_state(journal, partition_name, "committed")
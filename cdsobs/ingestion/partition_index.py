@@ -0,0 +1,151 @@
+"""
+Index of the rows of a partition file, stored in its partition_index group.
+
+Partitions are sorted by report_timestamp, so the rows of each day are contiguous,
+but nothing else tells where a station or a variable is in the file. The index stores
+the first and last (plus one) row of each day and station and the number of rows of
+each observed variable, so the readers can compute the hyperslab that can contain the
+requested data, and skip the partition if a variable is not there, without reading the
+data variables.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import h5netcdf
+import numpy
+import pandas
+
+from cdsobs import constants
+from cdsobs.cdm.tables import STATION_COLUMN
+from cdsobs.utils.utils import datetime_to_seconds, seconds_to_datetime
+
+PARTITION_INDEX_GROUP = "partition_index"
+SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class PartitionIndex:
+    """
+    Row ranges of the days and stations and row counts of the observed variables.
+
+    The ranges are arrays of shape (n, 2) with the start and stop rows, as in a slice.
+    """
+
+    num_rows: int
+    days: pandas.DatetimeIndex
+    day_rows: numpy.ndarray
+    stations: numpy.ndarray
+    station_rows: numpy.ndarray
+    variable_codes: numpy.ndarray
+    variable_counts: numpy.ndarray
+
+    def get_rows(
+        self,
+        day_mask: numpy.ndarray | None = None,
+        stations: list[str] | None = None,
+        variable_codes: list[int] | None = None,
+    ) -> slice:
+        """
+        Return the slice of rows that contains all the rows matching the filters.
+
+        An empty slice means that there is nothing to read in the partition.
+        """
+        start, stop = 0, self.num_rows
+        if variable_codes is not None:
+            in_codes = numpy.isin(self.variable_codes, variable_codes)
+            if self.variable_counts[in_codes].sum() == 0:
+                return slice(0, 0)
+        selections = []
+        if day_mask is not None:
+            selections.append(self.day_rows[day_mask])
+        if stations is not None:
+            selections.append(self.station_rows[numpy.isin(self.stations, stations)])
+        for selected_rows in selections:
+            if len(selected_rows) == 0:
+                return slice(0, 0)
+            start = max(start, selected_rows[:, 0].min())
+            stop = min(stop, selected_rows[:, 1].max())
+        return slice(int(start), int(max(start, stop)))
+
+
+def get_partition_index(data: pandas.DataFrame) -> PartitionIndex:
+    """
+    Compute the index of the data of a partition, as written by to_netcdf.
+
+    report_timestamp can be datetimes or seconds since the reference time, and
+    observed_variable the CDM codes.
+    """
+    rows = pandas.Series(numpy.arange(len(data)))
+    timestamps = data["report_timestamp"].reset_index(drop=True)
+    if timestamps.dtype.kind == "M":
+        timestamps = pandas.Series(datetime_to_seconds(timestamps))
+    day_rows = _get_row_ranges(rows, timestamps // SECONDS_PER_DAY * SECONDS_PER_DAY)
+    station_rows = _get_row_ranges(
+        rows, data[STATION_COLUMN].reset_index(drop=True).astype(str)
+    )
+    variable_counts = data["observed_variable"].value_counts(sort=False).sort_index()
+    return PartitionIndex(
+        num_rows=len(data),
+        days=seconds_to_datetime(day_rows.index.to_numpy()),
+        day_rows=day_rows.to_numpy(),
+        stations=station_rows.index.to_numpy(),
+        station_rows=station_rows.to_numpy(),
+        variable_codes=variable_counts.index.to_numpy(),
+        variable_counts=variable_counts.to_numpy(),
+    )
+
+
+def _get_row_ranges(rows: pandas.Series, keys: pandas.Series) -> pandas.DataFrame:
+    grouped = rows.groupby(keys.to_numpy(), sort=True)
+    return pandas.DataFrame({"start": grouped.min(), "stop": grouped.max() + 1})
+
+
+def write_partition_index(file_path: Path, index: PartitionIndex):
+    """Write the index to the partition_index group of a partition file."""
+    stations = numpy.char.encode(index.stations.astype(str), "UTF-8")
+    slen = max(stations.dtype.itemsize, 1)
+    with h5netcdf.File(file_path, "a") as oncobj:
+        group = oncobj.create_group(PARTITION_INDEX_GROUP)
+        group.dimensions["day"] = len(index.days)
+        group.dimensions["station"] = len(stations)
+        group.dimensions["variable"] = len(index.variable_codes)
+        group.dimensions["range"] = 2
+        group.dimensions["string_station"] = slen
+        day = group.create_variable(
+            "day",
+            ("day",),
+            data=datetime_to_seconds(pandas.Series(index.days)),
+        )
+        day.attrs["units"] = constants.TIME_UNITS
+        group.create_variable("day_rows", ("day", "range"), data=index.day_rows)
+        group.create_variable(
+            "station",
+            ("station", "string_station"),
+            data=stations.astype(f"S{slen}").view("S1").reshape(len(stations), slen),
+        )
+        group.create_variable(
+            "station_rows", ("station", "range"), data=index.station_rows
+        )
+        group.create_variable("variable_code", ("variable",), data=index.variable_codes)
+        group.create_variable(
+            "variable_count", ("variable",), data=index.variable_counts
+        )
+
+
+def read_partition_index(incobj: h5netcdf.File) -> PartitionIndex | None:
+    """Read the index of an open partition file, None for files without index."""
+    if PARTITION_INDEX_GROUP not in incobj.groups:
+        return None
+    group = incobj.groups[PARTITION_INDEX_GROUP]
+    station_chars = group.variables["station"][...]
+    stations = station_chars.view(f"S{station_chars.shape[-1]}").ravel()
+    return PartitionIndex(
+        num_rows=incobj.dimensions["observation_id"].size,
+        days=seconds_to_datetime(group.variables["day"][...]),
+        day_rows=group.variables["day_rows"][...],
+        stations=numpy.char.decode(stations, "UTF-8").astype(object),
+        station_rows=group.variables["station_rows"][...],
+        variable_codes=group.variables["variable_code"][...],
+        variable_counts=group.variables["variable_count"][...],
+    )
@@ -1,25 +1,30 @@
+import atexit
 import calendar
 import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Iterable, List
 
-import cftime
 import dask
 import h5py
 import numpy
 import pandas
 
-from cdsobs import constants
+from cdsobs.cdm.cache import get_cdm_revision
 from cdsobs.cdm.denormalize import denormalize_tables
-from cdsobs.cdm.tables import CDMTable, read_cdm_tables
+from cdsobs.cdm.tables import CDMTable, CDMTables, read_cdm_tables
 from cdsobs.config import CDSObsConfig
 from cdsobs.ingestion.api import EmptyBatchException
 from cdsobs.ingestion.core import TimeBatch, TimeSpaceBatch
 from cdsobs.retrieve.filter_datasets import between, get_var_code_dict
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.utils.logutils import get_logger
-from cdsobs.utils.utils import datetime_to_seconds
+from cdsobs.utils.utils import (
+    datetime_to_seconds,
+    map_to_categorical,
+    seconds_to_datetime,
+)
 
 logger = get_logger(__name__)
 
@@ -297,25 +302,19 @@ def read_cuon_netcdfs(
         raise EmptyBatchException
     # Avoid for now: sensor_configuration, source_configuration
     tables_to_use = service_definition.available_cdm_tables
-    cdm_tables = read_cdm_tables(config.cdm_tables_location, tables_to_use)
-    files_and_slices = read_all_nc_slices(files, time_space_batch.time_batch)
-    denormalized_tables_futures = []
-    scheduler = get_scheduler()
+    pool = get_worker_pool(config.cdm_tables_location, tables_to_use)
+    files_and_slices = read_all_nc_slices(files, time_space_batch.time_batch, pool)
     # Check for emptiness
     if len(files_and_slices) == 0:
         raise EmptyBatchException
     # Use dask to speed up the process
-    for file_and_slices in files_and_slices:
-        denormalized_table_future = dask.delayed(_get_denormalized_table_file)(
-            cdm_tables, config, file_and_slices, tables_to_use, time_space_batch
+    denormalized_tables_futures = [
+        dask.delayed(_get_denormalized_table_file)(
+            config, file_and_slices, tables_to_use, time_space_batch
         )
-        if denormalized_table_future is not None:
-            denormalized_tables_futures.append(denormalized_table_future)
-    denormalized_tables = dask.compute(
-        *denormalized_tables_futures,
-        scheduler=scheduler,
-        num_workers=min(len(files_and_slices), 32),
-    )
+        for file_and_slices in files_and_slices
+    ]
+    denormalized_tables = _compute(denormalized_tables_futures, pool)
     # Check for emptiness
     if all([dt is None for dt in denormalized_tables]):
         raise EmptyBatchException
@@ -339,15 +338,104 @@ def get_scheduler():
     return scheduler
 
 
-def _get_denormalized_table_file(*args):
+def get_num_workers() -> int:
+    """Size of the worker pool, it can be set with CADSOBS_NUM_WORKERS."""
+    return int(os.environ.get("CADSOBS_NUM_WORKERS", 32))
+
+
+# The worker pool lives for the whole ingestion run, so the workers import pandas,
+# h5py and cdsobs and load the CDM tables only once.
+_worker_pool: ProcessPoolExecutor | None = None
+_worker_pool_initargs: tuple[str, tuple[str, ...], str | None] | None = None
+# CDM tables and variable code dict of the current process, by location and tables.
+_worker_cdm: dict[tuple[str, tuple[str, ...]], tuple[CDMTables, dict]] = {}
+
+
+def _get_worker_cdm(
+    cdm_tables_location: str | Path, tables_to_use: tuple[str, ...] | list[str]
+) -> tuple[CDMTables, dict]:
+    """Return the CDM tables and variable code dict, loading them only once."""
+    key = (str(cdm_tables_location), tuple(tables_to_use))
+    if key not in _worker_cdm:
+        cdm_tables = read_cdm_tables(Path(cdm_tables_location), list(tables_to_use))
+        code_dict = get_var_code_dict(Path(cdm_tables_location))
+        _worker_cdm[key] = (cdm_tables, code_dict)
+    return _worker_cdm[key]
+
+
+def _init_worker(
+    cdm_tables_location: str, tables_to_use: tuple[str, ...], cdm_revision: str | None
+):
+    # cdm_revision is only part of initargs so the pool is recreated when it changes
+    _get_worker_cdm(cdm_tables_location, tables_to_use)
+
+
+def get_worker_pool(
+    cdm_tables_location: str | Path, tables_to_use: list[str]
+) -> Executor | None:
+    """
+    Return the long-lived process pool used for the dask computations.
+
+    The pool is created the first time and reused afterwards, unless the CDM tables
+    needed, or the revision of the CDM repository, change.
+    Returns None if the processes scheduler is not in use.
+    """
+    global _worker_pool, _worker_pool_initargs
+    if get_scheduler() != "processes":
+        return None
+    initargs = (
+        str(cdm_tables_location),
+        tuple(tables_to_use),
+        get_cdm_revision(Path(cdm_tables_location)),
+    )
+    if _worker_pool is None or _worker_pool_initargs != initargs:
+        shutdown_worker_pool()
+        logger.info(f"Starting a pool of {get_num_workers()} worker processes")
+        _worker_pool = ProcessPoolExecutor(
+            max_workers=get_num_workers(),
+            initializer=_init_worker,
+            initargs=initargs,
+        )
+        _worker_pool_initargs = initargs
+    return _worker_pool
+
+
+def shutdown_worker_pool():
+    global _worker_pool, _worker_pool_initargs
+    if _worker_pool is not None:
+        _worker_pool.shutdown()
+        _worker_pool = None
+        _worker_pool_initargs = None
+
+
+atexit.register(shutdown_worker_pool)
+
+
+def _compute(tasks: list, pool: Executor | None) -> list:
+    if pool is None:
+        results = dask.compute(*tasks, scheduler=get_scheduler())
+    else:
+        results = dask.compute(*tasks, scheduler="processes", pool=pool)
+    return list(results)
+
+
+def _get_denormalized_table_file(
+    config: CDSObsConfig,
+    file_and_slices: CUONFileandSlices,
+    tables_to_use: list[str],
+    time_space_batch: TimeSpaceBatch,
+):
+    cdm_tables, code_dict = _get_worker_cdm(config.cdm_tables_location, tables_to_use)
     try:
-        return get_denormalized_table_file(*args)
+        return get_denormalized_table_file(
+            cdm_tables, code_dict, file_and_slices, tables_to_use, time_space_batch
+        )
     except NoDataInFileException:
         return None
 
 
 def get_denormalized_table_file(
-    cdm_tables, config, file_and_slices, tables_to_use, time_space_batch
+    cdm_tables, code_dict, file_and_slices, tables_to_use, time_space_batch
 ):
     dataset_cdm: dict[str, pandas.DataFrame] = {}
     for table_name, table_definition in cdm_tables.items():
@@ -382,30 +470,55 @@ def get_denormalized_table_file(
     denormalized_table_file = denormalize_tables(
         cdm_tables, dataset_cdm, tables_to_use, ignore_errors=False
     )
-    # Decode time
-    denormalized_table_file = decode_time(denormalized_table_file, file_and_slices)
-    # Fixes for CUON V29 files
-    denormalized_table_file = fixes_for_cuonv29(denormalized_table_file)
-    # Fix units
-    denormalized_table_file = fix_units(denormalized_table_file)
-
-    # Decode variable names
-    code_dict = get_var_code_dict(config.cdm_tables_location)
-    denormalized_table_file["observed_variable"] = denormalized_table_file[
-        "observed_variable"
-    ].map(code_dict)
+    # Decode time, apply the fixes for CUON V29 files and fix the units
+    denormalized_table_file = fix_denormalized_table_file(
+        denormalized_table_file, file_and_slices
+    )
+
+    # Decode variable names. All the files share the same categories so the
+    # categorical dtype is kept when the files are concatenated.
+    denormalized_table_file["observed_variable"] = map_to_categorical(
+        denormalized_table_file["observed_variable"],
+        code_dict,
+        categories=sorted(set(code_dict.values())),
+    )
     return denormalized_table_file
 
 
-def fix_units(denormalized_table_file: pandas.DataFrame) -> pandas.DataFrame:
+def fix_denormalized_table_file(
+    denormalized_table_file: pandas.DataFrame, file_and_slices: CUONFileandSlices
+) -> pandas.DataFrame:
+    """
+    Decode the times and apply all the fixes needed by the CUON files in one stage.
+
+    The observed variable masks are computed once, and every fixed column is
+    modified as a NumPy array and assigned back only once. The rows with observed
+    variable 0 are removed at the end.
+    """
+    denormalized_table_file = decode_time(denormalized_table_file, file_and_slices)
+    observed_variable = denormalized_table_file["observed_variable"].to_numpy()
+    denormalized_table_file = fixes_for_cuonv29(
+        denormalized_table_file, observed_variable
+    )
+    denormalized_table_file = fix_units(denormalized_table_file, observed_variable)
+    # Remove obs id zero
+    return denormalized_table_file.loc[observed_variable != 0]
+
+
+def fix_units(
+    denormalized_table_file: pandas.DataFrame, observed_variable: numpy.ndarray
+) -> pandas.DataFrame:
     """Fix the wrong units in cuon v29, including the uncertainties and homogenisation."""
     # Relative humidity, from 1 to 100 %
     relative_humidity_code = 138
     relative_humidity_units_code = 300  # %
-    relative_humidity_mask = (
-        denormalized_table_file["observed_variable"] == relative_humidity_code
-    )
-    cols_to_scale_humidity = [
+    relative_humidity_mask = observed_variable == relative_humidity_code
+    # Geopotential, from J/kg (m2s2) to m
+    geopotential_code = 117
+    geopotential_units_code = 631  # geopotential meters
+    g = 9.80665  # g in m s-2
+    geopotential_mask = observed_variable == geopotential_code
+    cols_to_scale = [
         "observation_value",
         "uncertainty_value1",
         "homogenisation_adjustment",
@@ -413,48 +526,42 @@ def fix_units(denormalized_table_file: pandas.DataFrame) -> pandas.DataFrame:
         "fg_depar@body",
         "fg_depar@offline",
     ]
-    for col in cols_to_scale_humidity:
-        denormalized_table_file.loc[relative_humidity_mask, col] *= 100
-
-    denormalized_table_file.loc[
-        relative_humidity_mask, "units"
-    ] = relative_humidity_units_code
-    denormalized_table_file.loc[
-        relative_humidity_mask, "uncertainty_units1"
-    ] = relative_humidity_units_code
-    # Geopotential, from J/kg (m2s2) to m
-    geopotential_code = 117
-    geopotential_units_code = 631  # geopotential meters
-    g = 9.80665  # g in m s-2
-    geopotential_mask = (
-        denormalized_table_file["observed_variable"] == geopotential_code
-    )
-    cols_to_scale_geopotential = cols_to_scale_humidity.copy()
-    # There is no homogenisation_adjustment for geopotential
-    cols_to_scale_geopotential.remove("homogenisation_adjustment")
-    for col in cols_to_scale_geopotential:
-        denormalized_table_file.loc[geopotential_mask, col] /= g
-
-    denormalized_table_file.loc[geopotential_mask, "units"] = geopotential_units_code
-    denormalized_table_file.loc[
-        geopotential_mask, "uncertainty_units1"
-    ] = geopotential_units_code
+    for col in cols_to_scale:
+        if col not in denormalized_table_file:
+            continue
+        values = denormalized_table_file[col].to_numpy(copy=True)
+        values[relative_humidity_mask] *= 100
+        # There is no homogenisation_adjustment for geopotential
+        if col != "homogenisation_adjustment":
+            values[geopotential_mask] /= g
+        denormalized_table_file[col] = values
+
+    for col in ["units", "uncertainty_units1"]:
+        if col in denormalized_table_file:
+            values = denormalized_table_file[col].to_numpy(copy=True)
+        else:
+            values = numpy.full(len(denormalized_table_file), numpy.nan)
+        values[relative_humidity_mask] = relative_humidity_units_code
+        values[geopotential_mask] = geopotential_units_code
+        denormalized_table_file[col] = values
     return denormalized_table_file
 
 
-def fixes_for_cuonv29(denormalized_table_file: pandas.DataFrame) -> pandas.DataFrame:
+def fixes_for_cuonv29(
+    denormalized_table_file: pandas.DataFrame, observed_variable: numpy.ndarray
+) -> pandas.DataFrame:
     """Multiple fixed needed to correct issues found in the CUON files."""
+    nrows = len(denormalized_table_file)
     # Need this change avoid nans in this variable that is an integer
-    denormalized_table_file["uncertainty_type1"] = 1
-    denormalized_table_file["uncertainty_type1"] = denormalized_table_file[
-        "uncertainty_type1"
-    ].astype("int")
+    denormalized_table_file["uncertainty_type1"] = numpy.ones(nrows, dtype="int")
     # Fix profile id and quality flag
-    denormalized_table_file["profile_id"] = denormalized_table_file.report_id.copy()
-    denormalized_table_file["quality_flag"] = 2
+    denormalized_table_file["profile_id"] = denormalized_table_file[
+        "report_id"
+    ].to_numpy(copy=True)
+    denormalized_table_file["quality_flag"] = numpy.full(nrows, 2)
     # Fix homogenisation
-    denormalized_table_file["homogenisation_method"] = 14
-    denormalized_table_file["report_meaning_of_timestamp"] = 1
+    denormalized_table_file["homogenisation_method"] = numpy.full(nrows, 14)
+    denormalized_table_file["report_meaning_of_timestamp"] = numpy.full(nrows, 1)
     if "RISE_bias_estimate" in denormalized_table_file:
         logger.warning("Applying fixes for CUON V29 files homogenisation")
         denormalized_table_file = denormalized_table_file.rename(
@@ -463,24 +570,19 @@ def fixes_for_cuonv29(denormalized_table_file: pandas.DataFrame) -> pandas.DataF
         # Merge homogenisation adjustments
         homogenisation_adjustment = denormalized_table_file[
             "homogenisation_adjustment"
-        ].copy()
-        observed_variable = denormalized_table_file["observed_variable"]
-        # Humidity
-        if "humidity_bias_estimate" in denormalized_table_file:
-            humidity_adjustment = denormalized_table_file["humidity_bias_estimate"]
-            humidity_variables = (34, 137, 138, 39)
-            mask = numpy.isin(observed_variable, humidity_variables)
-            homogenisation_adjustment.loc[mask] = humidity_adjustment[mask]
-        else:
-            logger.warning("humidity_bias_estimate not found")
-        # Wind
-        if "wind_bias_estimate" in denormalized_table_file:
-            wind_adjustment = denormalized_table_file["wind_bias_estimate"]
-            wind_variables = (106, 107, 139, 140)
-            mask = numpy.isin(observed_variable, wind_variables)
-            homogenisation_adjustment.loc[mask] = wind_adjustment[mask]
-        else:
-            logger.warning("wind_bias_estimate not found")
+        ].to_numpy(copy=True)
+        bias_estimates = [
+            ("humidity_bias_estimate", (34, 137, 138, 39)),
+            ("wind_bias_estimate", (106, 107, 139, 140)),
+        ]
+        for bias_estimate, variables in bias_estimates:
+            if bias_estimate in denormalized_table_file:
+                mask = numpy.isin(observed_variable, variables)
+                homogenisation_adjustment[mask] = denormalized_table_file[
+                    bias_estimate
+                ].to_numpy()[mask]
+            else:
+                logger.warning(f"{bias_estimate} not found")
         denormalized_table_file["homogenisation_adjustment"] = homogenisation_adjustment
         # Remove these, we don't need them, it is not all in homogenisation_adjustment
         denormalized_table_file = denormalized_table_file.drop(
@@ -488,10 +590,6 @@ def fixes_for_cuonv29(denormalized_table_file: pandas.DataFrame) -> pandas.DataF
         )
     else:
         logger.warning("Bias estimates not found for this partition")
-    # Remove obs id zero
-    denormalized_table_file = denormalized_table_file.loc[
-        denormalized_table_file["observed_variable"] != 0
-    ]
     return denormalized_table_file
 
 
@@ -500,10 +598,8 @@ def decode_time(
 ) -> pandas.DataFrame:
     if len(denormalized_table_file) > 0:
         for time_field in ["record_timestamp", "report_timestamp", "date_time"]:
-            denormalized_table_file.loc[:, time_field] = cftime.num2date(
-                denormalized_table_file.loc[:, time_field],
-                constants.TIME_UNITS,
-                only_use_cftime_datetimes=False,
+            denormalized_table_file[time_field] = seconds_to_datetime(
+                denormalized_table_file[time_field]
             )
     else:
         logger.warning(f"No data was found in file {file_and_slices.path}")
@@ -685,7 +781,9 @@ def read_nc_file_slices(
     return result
 
 
-def read_all_nc_slices(files: List, time_batch: TimeBatch) -> list[CUONFileandSlices]:
+def read_all_nc_slices(
+    files: List, time_batch: TimeBatch, pool: Executor | None = None
+) -> list[CUONFileandSlices]:
     """Read variable slices of all station files using h5py."""
     tocs = []
 
@@ -693,8 +791,6 @@ def read_all_nc_slices(files: List, time_batch: TimeBatch) -> list[CUONFileandSl
         logger.info(f"Reading slices from {file=}")
         toc = dask.delayed(read_nc_file_slices)(Path(file), time_batch)
         tocs.append(toc)
-
-    scheduler = get_scheduler()
-    tocs = dask.compute(*tocs, scheduler=scheduler, num_workers=min(len(files), 32))
+    tocs = _compute(tocs, pool)
     tocs = [t for t in tocs if t is not None]
     return tocs
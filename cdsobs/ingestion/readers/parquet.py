@@ -9,6 +9,7 @@ from cdsobs.ingestion.core import TimeSpaceBatch
 from cdsobs.retrieve.filter_datasets import get_var_code_dict
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import map_to_categorical
 
 logger = get_logger(__name__)
 
@@ -78,7 +79,7 @@ def read_flat_parquet(
         raise EmptyBatchException
     # Decode variable names
     code_dict = get_var_code_dict(config.cdm_tables_location)
-    data["observed_variable"] = data["observed_variable"].map(code_dict)
+    data["observed_variable"] = map_to_categorical(data["observed_variable"], code_dict)
     # Remove timezone information, that gives problems, all input must be in UTC
     for col in data:
         if data[col].dtype.kind == "M":
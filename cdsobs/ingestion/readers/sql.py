@@ -1,9 +1,14 @@
 import inspect
-from typing import Any, Callable, Protocol, Tuple
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Iterator, Protocol, Tuple, TypeAlias, cast
 
 import connectorx as cx
 import pandas
 import pandas as pd
+import pyarrow
+import sqlalchemy as sa
 
 from cdsobs.config import CDSObsConfig, DBConfig
 from cdsobs.ingestion.api import join_header_and_data
@@ -12,20 +17,56 @@ from cdsobs.service_definition.service_definition_models import (
     ServiceDefinition,
     SourceDefinition,
 )
+from cdsobs.utils.connection_budget import get_connection_budget
 from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import get_engine
 
 logger = get_logger(__name__)
 
 REPORT_TIMESTAMP = "report_timestamp"
+# The data table can be read at once or in chunks
+DataTable: TypeAlias = pandas.DataFrame | Iterator[pandas.DataFrame]
+
+
+@dataclass
+class SQLReadOptions:
+    """
+    Options of the SQL readers.
+
+    Attributes
+    ----------
+    chunk_size:
+      If given, the data table is streamed as Arrow record batches and returned as an
+      iterator of chunks of chunk_size rows, so it is never fully loaded.
+    header_fields:
+      Columns to select from the header table, all if None.
+    data_fields:
+      Columns to select from the data table, all if None.
+    server_side_join:
+      Join the header and data tables in the database with a single query. The
+      joined table is returned as the data table, with the join ids renamed to
+      report_id and observation_id. For the fields in both tables, the values of the
+      header are used. header_fields and data_fields are required.
+    """
+
+    chunk_size: int | None = None
+    header_fields: list[str] | None = None
+    data_fields: list[str] | None = None
+    server_side_join: bool = False
 
 
 def read_time_partitioned_tables(
     config: DBConfig,
     source_definition: SourceDefinition,
     time_batch: TimeBatch,
-) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    read_options: SQLReadOptions | None = None,
+) -> Tuple[pandas.DataFrame, DataTable]:
     return read_sql_tables(
-        config, source_definition, time_batch, time_is_in_data_table=True
+        config,
+        source_definition,
+        time_batch,
+        time_is_in_data_table=True,
+        read_options=read_options,
     )
 
 
@@ -34,89 +75,246 @@ def read_sql_tables(
     source_definition: SourceDefinition,
     time_batch: TimeBatch,
     time_is_in_data_table: bool = False,
-) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
-    """Read data from the SQL tables."""
-    # Get the URL to the database
-    db_url = config.get_url()
+    read_options: SQLReadOptions | None = None,
+) -> Tuple[pandas.DataFrame, DataTable]:
+    """
+    Read data from the SQL tables.
 
+    If read_options.chunk_size is given, the data table is returned as an iterator of
+    chunks. Otherwise, the data table is read using up to config.max_connections
+    connections in parallel, each one reading a part of the time interval.
+    """
+    read_options = read_options if read_options is not None else SQLReadOptions()
     # Define the time_batch specifics in case it exist
     start, end = time_batch.get_time_coverage()
     time_field, time_field_in_header = get_time_field(source_definition)
-
-    if source_definition.is_multitable():
+    header_fields = "*"
+    data_fields = "d.*"
+    if read_options.header_fields is not None:
+        header_fields = ", ".join(read_options.header_fields)
+    if read_options.data_fields is not None:
+        data_fields = ", ".join(f"d.{f}" for f in read_options.data_fields)
+
+    if source_definition.is_multitable() and read_options.server_side_join:
+        header_data = pd.DataFrame()
+        data_querystr, data_time_field = get_joined_query(
+            source_definition,
+            read_options,
+            time_field,
+            time_field_in_header,
+            time_is_in_data_table,
+            start,
+            end,
+        )
+        # The same order as the join in pandas, which keeps the header order
+        order_by = ["report_id", "observation_id"]
+    elif source_definition.is_multitable():
         join_ids = source_definition.join_ids
         assert join_ids is not None
         # Get the header data
         header_table = source_definition.header_table
-        header_querystr = f"SELECT * FROM {header_table}"
+        header_querystr = f"SELECT {header_fields} FROM {header_table}"
         # Time filter
         # Closed left, open right
-        header_time_filter_query_str = (
-            f" WHERE {time_field} >= '{start}' AND {time_field} < '{end}'"
-        )
         if time_field_in_header:
             # Append filters to the simple select query
-            header_querystr += header_time_filter_query_str
+            header_querystr += get_time_filter(time_field, start, end)
         # We need sortby to the result to be deterministic
         header_querystr += f" ORDER BY {join_ids.header}"
-        # This is to use only one thread in order to no overwhelm the database
-        header_data = cx.read_sql(
-            db_url, header_querystr, return_type="pandas", partition_num=1
-        )
+        header_data = read_sql(config, header_querystr)
 
         # Get the data data
         data_table = source_definition.data_table
-        data_querystr = f"SELECT d.* FROM {data_table} d"
+        data_querystr = f"SELECT {data_fields} FROM {data_table} d"
         # Time filter for data
         if time_is_in_data_table:
-            data_time_filter_query_str = header_time_filter_query_str
+            data_time_field = time_field
         else:
-            data_time_filter_query_str = (
+            data_querystr += (
                 f" INNER JOIN {header_table} h "
-                f"ON d.{join_ids.data}=h.{join_ids.header} "
-                f"where h.{time_field} >= '{start}' and h.{time_field} < '{end}'"
+                f"ON d.{join_ids.data}=h.{join_ids.header}"
             )
-
-        # Append filters to the simple select query
-        data_querystr += data_time_filter_query_str
+            data_time_field = f"h.{time_field}"
         # We need order by to the result to be deterministic
-        data_querystr += " ORDER BY id"
-        # This is to use only one thread in order to no overwhelm the database
-        data_data = cx.read_sql(
-            db_url, data_querystr, return_type="pandas", partition_num=1
-        )
-        result = (header_data, data_data)
+        order_by = ["id"]
     else:
+        header_data = pd.DataFrame()
         data_table = source_definition.data_table
-        data_querystr = f"SELECT * FROM {data_table}"
-        # Time filter
-        data_time_filter_query_str = (
-            f" WHERE {time_field} >= '{start}' AND {time_field} < '{end}'"
+        data_querystr = f"SELECT {data_fields} FROM {data_table} d"
+        data_time_field = time_field
+        # We need order by the result to be deterministic
+        order_by = _get_order_by(data_table, config, source_definition)
+    order_by_str = f" ORDER BY {', '.join(order_by)}"
+    data_data: DataTable
+    if read_options.chunk_size is not None:
+        data_querystr += get_time_filter(data_time_field, start, end) + order_by_str
+        data_data = read_sql_chunks(config, data_querystr, read_options.chunk_size)
+    else:
+        data_data = read_sql_time_ranges(
+            config,
+            data_querystr,
+            data_time_field,
+            start,
+            end,
+            order_by,
         )
+    # For single tables, the header is an empty dataframe.
+    return header_data, data_data
 
-        # Append filters to the simple select query
-        # Closed left, open right
-        data_querystr += data_time_filter_query_str
-        # We need order by the result to be deterministic
-        order_by_str = _get_order_by(data_table, db_url, source_definition)
-        data_querystr += order_by_str
+
+def get_joined_query(
+    source_definition: SourceDefinition,
+    read_options: SQLReadOptions,
+    time_field: str,
+    time_field_in_header: bool,
+    time_is_in_data_table: bool,
+    start: datetime,
+    end: datetime,
+) -> Tuple[str, str]:
+    """
+    Return the query joining the header and data tables, without the time filter.
+
+    The field the time filter must be applied to is also returned.
+    """
+    join_ids = source_definition.join_ids
+    assert join_ids is not None
+    assert read_options.header_fields is not None
+    assert read_options.data_fields is not None
+    header_table = source_definition.header_table
+    data_table = source_definition.data_table
+    selected = [
+        f"h.{f} AS report_id" if f == join_ids.header else f"h.{f}"
+        for f in read_options.header_fields
+    ]
+    for field in read_options.data_fields:
+        if field == "id":
+            selected.append("d.id AS observation_id")
+        elif field != join_ids.data and field not in read_options.header_fields:
+            selected.append(f"d.{field}")
+    join_condition = f"d.{join_ids.data}=h.{join_ids.header}"
+    if time_is_in_data_table and time_field_in_header:
+        # The header is filtered too, as when it is read alone.
+        join_condition += (
+            f" AND h.{time_field} >= '{start}' AND h.{time_field} < '{end}'"
+        )
+    querystr = (
+        f"SELECT {', '.join(selected)} FROM {data_table} d "
+        f"INNER JOIN {header_table} h ON {join_condition}"
+    )
+    data_time_field = f"d.{time_field}" if time_is_in_data_table else f"h.{time_field}"
+    return querystr, data_time_field
+
+
+def get_time_filter(time_field: str, start: datetime, end: datetime) -> str:
+    # Closed left, open right
+    return f" WHERE {time_field} >= '{start}' AND {time_field} < '{end}'"
+
+
+def read_sql(config: DBConfig, querystr: str) -> pandas.DataFrame:
+    """Read the result of a query using one connection of the budget."""
+    with get_connection_budget(config).acquire(1):
         # This is to use only one thread in order to no overwhelm the database
-        data_data = cx.read_sql(
-            db_url, data_querystr, return_type="pandas", partition_num=1
+        return cx.read_sql(
+            config.get_url(), querystr, return_type="pandas", partition_num=1
+        )
+
+
+def read_sql_time_ranges(
+    config: DBConfig,
+    querystr: str,
+    time_field: str,
+    start: datetime,
+    end: datetime,
+    order_by: list[str],
+) -> pandas.DataFrame:
+    """
+    Read the rows of a query in [start, end), in parallel if the budget allows.
+
+    As many connections as free in the connection budget of the database (up to
+    config.max_connections) are used. The time interval is split in one sub-interval
+    per connection, and connectorx reads them in parallel. The result is sorted by
+    order_by, so it is the same as reading it with a single query.
+    """
+    with get_connection_budget(config).acquire(config.max_connections) as nconn:
+        time_filters = [
+            get_time_filter(time_field, range_start, range_end)
+            for range_start, range_end in split_time_range(start, end, nconn)
+        ]
+        order_by_str = f" ORDER BY {', '.join(order_by)}"
+        queries = [
+            querystr + time_filter + order_by_str for time_filter in time_filters
+        ]
+        if len(queries) == 1:
+            return cx.read_sql(
+                config.get_url(), queries[0], return_type="pandas", partition_num=1
+            )
+        logger.info(f"Reading data with {nconn} connections in parallel")
+        data = cx.read_sql(config.get_url(), queries, return_type="pandas")
+    # Each query is sorted, but the whole table needs to be sorted again.
+    return data.sort_values(order_by, kind="stable", ignore_index=True)
+
+
+def split_time_range(
+    start: datetime, end: datetime, num_ranges: int
+) -> list[tuple[datetime, datetime]]:
+    """Split [start, end) in num_ranges contiguous intervals, rounded to seconds."""
+    bounds = pandas.date_range(start, end, periods=num_ranges + 1).floor("s")
+    bounds_list = [b.to_pydatetime() for b in bounds]
+    bounds_list[-1] = end
+    return list(zip(bounds_list[:-1], bounds_list[1:]))
+
+
+def read_sql_chunks(
+    config: DBConfig, querystr: str, chunk_size: int
+) -> Iterator[pandas.DataFrame]:
+    """
+    Read the result of a query in chunks of chunk_size rows.
+
+    The rows are streamed from the database as Arrow record batches, and each batch is
+    converted to pandas only when it is consumed. Integers are returned as nullable
+    pandas integers and timestamps as naive UTC, as connectorx does for pandas. The
+    connection is taken from the budget until the iterator is exhausted.
+    """
+    logger.debug(f"Streaming query results in chunks of {chunk_size} rows")
+    with get_connection_budget(config).acquire(1):
+        reader = cx.read_sql(
+            config.get_url(),
+            querystr,
+            return_type="arrow_stream",
+            batch_size=chunk_size,
         )
-        # Return an empty dataframe as header.
-        result = (pd.DataFrame(), data_data)
-    return result
+        for record_batch in reader:
+            if record_batch.num_rows == 0:
+                continue
+            yield record_batch_to_pandas(record_batch)
+
 
+def record_batch_to_pandas(record_batch: pyarrow.RecordBatch) -> pandas.DataFrame:
+    """Convert an Arrow record batch to pandas with the dtypes of connectorx."""
+    chunk = record_batch.to_pandas(types_mapper=_integer_types_mapper)
+    for field_name in chunk.columns:
+        field_dtype = chunk[field_name].dtype
+        if isinstance(field_dtype, pandas.DatetimeTZDtype):
+            chunk[field_name] = chunk[field_name].dt.tz_convert(None)
+    return chunk
 
-def _get_order_by(data_table, db_url, source_definition):
-    columns = cx.read_sql(db_url, f"select * FROM {data_table} LIMIT 1").columns
-    if "id" in columns:
-        sort_cols = "id"
+
+def _integer_types_mapper(arrow_type: pyarrow.DataType):
+    if pyarrow.types.is_integer(arrow_type):
+        return pandas.Int64Dtype()
     else:
-        sort_cols = ", ".join(source_definition.order_by)
-    order_by_str = f" ORDER BY {sort_cols}"
-    return order_by_str
+        return None
+
+
+def _get_order_by(
+    data_table: str, config: DBConfig, source_definition: SourceDefinition
+) -> list[str]:
+    if "id" in get_table_columns(config, data_table):
+        sort_cols = ["id"]
+    else:
+        assert source_definition.order_by is not None
+        sort_cols = source_definition.order_by
+    return sort_cols
 
 
 class SQLReaderFunctionCallable(Protocol):
@@ -125,7 +323,8 @@ class SQLReaderFunctionCallable(Protocol):
         config: DBConfig,
         source_definition: SourceDefinition,
         time_batch: TimeBatch,
-    ) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+        read_options: SQLReadOptions | None = None,
+    ) -> Tuple[pandas.DataFrame, DataTable]:
         ...
 
 
@@ -145,17 +344,27 @@ def read_singletable_data(
     service_definition: ServiceDefinition,
     source: str,
     time_space_batch: TimeSpaceBatch,
-) -> pandas.DataFrame:
-    """Read datasets formatted as one single table."""
+    chunk_size: int | str | None = None,
+) -> DataTable:
+    """
+    Read datasets formatted as one single table.
+
+    If chunk_size is given, the data is streamed from the database and an iterator of
+    chunks of chunk_size rows is returned.
+    """
     source_definition = service_definition.sources[source]
     # Get the reader function for this dataset
     ingestion_db_config = config.ingestion_databases[service_definition.ingestion_db]
     sql_reader_function = dataset2sqlreader_function[dataset_name]
+    read_options = SQLReadOptions(
+        chunk_size=int(chunk_size) if chunk_size is not None else None
+    )
     _, data_table = read_ingestion_tables(
         ingestion_db_config,
         source_definition=source_definition,
         sql_reader_function=sql_reader_function,
         time_batch=time_space_batch.time_batch,
+        read_options=read_options,
     )
     return data_table
 
@@ -166,8 +375,19 @@ def read_header_and_data_tables(
     service_definition: ServiceDefinition,
     source: str,
     time_batch: TimeBatch,
-) -> pandas.DataFrame:
-    """Read datasets formatted as two related header and data tables."""
+    chunk_size: int | str | None = None,
+    server_side_join: bool | str = False,
+) -> DataTable:
+    """
+    Read datasets formatted as two related header and data tables.
+
+    If chunk_size is given, the data table is streamed from the database in chunks of
+    chunk_size rows, and each chunk is joined with the header as it is read. An
+    iterator of joined chunks is returned. If server_side_join is True, the tables
+    are joined by the database with a single query instead.
+
+    In both cases, only the header columns used are selected in the queries.
+    """
     source_definition = service_definition.sources[source]
     if not source_definition.is_multitable():
         raise RuntimeError(
@@ -177,50 +397,121 @@ def read_header_and_data_tables(
     # Get the reader function for this dataset
     sql_reader_function = dataset2sqlreader_function[dataset_name]
     ingestion_db_config = config.ingestion_databases[service_definition.ingestion_db]
+    header_fields_to_drop, data_fields_to_drop = get_fields_to_drop(source)
+    read_options = SQLReadOptions(
+        chunk_size=int(chunk_size) if chunk_size is not None else None,
+        server_side_join=str(server_side_join).lower() == "true",
+    )
+    if read_options.chunk_size is not None or read_options.server_side_join:
+        header_table_name = source_definition.header_table
+        assert header_table_name is not None
+        header_table_columns = get_table_columns(ingestion_db_config, header_table_name)
+        data_table_columns = get_table_columns(
+            ingestion_db_config, source_definition.data_table
+        )
+        read_options.header_fields = get_header_fields(
+            source_definition, header_table_columns, header_fields_to_drop
+        )
+        read_options.data_fields = [
+            f for f in data_table_columns if f not in data_fields_to_drop
+        ]
     header_table, data_table = read_ingestion_tables(
         ingestion_db_config,
         source_definition,
         sql_reader_function,
         time_batch,
+        read_options=read_options,
     )
+    if read_options.server_side_join:
+        # Already joined by the database
+        return data_table
+    header_table = header_table.drop(columns=header_fields_to_drop, errors="ignore")
     # Filter unwanted fields
-    header_columns = source_definition.get_raw_header_columns()
-    mandatory_columns = source_definition.get_raw_mandatory_columns()
-    join_ids = source_definition.join_ids
-    assert join_ids is not None
-    if source == "Dobson_O3":
-        header_table = header_table.drop("date_of_observation", axis=1)
-    fields_header = header_columns + [join_ids.header] + mandatory_columns
-    fields_header = list(set([f for f in fields_header if f in header_table.columns]))
+    fields_header = get_header_fields(
+        source_definition, header_table.columns.tolist(), header_fields_to_drop
+    )
     header_table = header_table[fields_header]
     # Rename indices
+    join_ids = source_definition.join_ids
+    assert join_ids is not None
     header_table = header_table.rename({join_ids.header: "report_id"}, axis=1)
+    if isinstance(data_table, pandas.DataFrame):
+        return _join_data_table(
+            header_table, data_table, source_definition, data_fields_to_drop
+        )
+    else:
+        return (
+            _join_data_table(
+                header_table, chunk, source_definition, data_fields_to_drop
+            )
+            for chunk in data_table
+        )
+
+
+def _join_data_table(
+    header_table: pandas.DataFrame,
+    data_table: pandas.DataFrame,
+    source_definition: SourceDefinition,
+    data_fields_to_drop: list[str],
+) -> pandas.DataFrame:
+    join_ids = source_definition.join_ids
+    assert join_ids is not None
     data_table = data_table.rename(
         {"id": "observation_id", join_ids.data: "report_id"}, axis=1
     )
     # Remove some offending fields
-    if source == "IGRA" and "version" in data_table:
+    data_table = data_table.drop(columns=data_fields_to_drop, errors="ignore")
+    # Join header and data
+    data_joined = join_header_and_data(header_table, data_table)
+    return data_joined
+
+
+def get_header_fields(
+    source_definition: SourceDefinition,
+    header_table_columns: list[str],
+    header_fields_to_drop: list[str],
+) -> list[str]:
+    """Return the fields of the header table used, in the order of the table."""
+    join_ids = source_definition.join_ids
+    assert join_ids is not None
+    header_columns = source_definition.get_raw_header_columns()
+    mandatory_columns = source_definition.get_raw_mandatory_columns()
+    fields_header = set(header_columns + [join_ids.header] + mandatory_columns)
+    return [
+        f
+        for f in header_table_columns
+        if f in fields_header and f not in header_fields_to_drop
+    ]
+
+
+def get_fields_to_drop(source: str) -> Tuple[list[str], list[str]]:
+    """
+    Return the fields to remove from the header and data tables of a source.
+
+    These fields appear in both tables with different values.
+    """
+    header_fields_to_drop = []
+    data_fields_to_drop = []
+    if source in ["Dobson_O3", "Brewer_O3"]:
+        logger.warning(
+            "Deleted date_of_observation from header table as it conflicts with the"
+            " date_of_observation in the data table."
+        )
+        header_fields_to_drop.append("date_of_observation")
+    if source == "IGRA":
         # Is all nans and conflicts with the header version
         logger.warning(
             "Deleted version from data table as it is all nans and conflicts"
-            "with the header version."
+            " with the header version."
         )
-        data_table = data_table.drop("version", axis=1)
-    # Join header and data
+        data_fields_to_drop.append("version")
     if source in ["IGS", "EPN", "IGS_R3"]:
         logger.warning(
             "Deleted idstation from data table as it conflicts with the"
-            "idstation in the header table."
-        )
-        data_table = data_table.drop(columns="idstation")
-    if source in ["Brewer_O3"]:
-        logger.warning(
-            "Deleted date_of_observation from header table as it conflicts with the"
-            "idstation in the header table."
+            " idstation in the header table."
         )
-        header_table = header_table.drop(columns="date_of_observation")
-    data_joined = join_header_and_data(header_table, data_table)
-    return data_joined
+        data_fields_to_drop.append("idstation")
+    return header_fields_to_drop, data_fields_to_drop
 
 
 def read_ingestion_tables(
@@ -228,7 +519,8 @@ def read_ingestion_tables(
     source_definition: SourceDefinition,
     sql_reader_function: SQLReaderFunctionCallable,
     time_batch: TimeBatch,
-) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    read_options: SQLReadOptions | None = None,
+) -> Tuple[pandas.DataFrame, DataTable]:
     """
     Read ingestion tables into pandas dataframes.
 
@@ -246,6 +538,9 @@ def read_ingestion_tables(
       A function that returns the header and data pandas dataframes
     time_batch:
       For the data table, read data for only this month and year
+    read_options:
+      Optional, options of the reader (read in chunks, join in the database...). The
+      data types of each chunk are fixed when it is read.
 
     Returns
     -------
@@ -259,11 +554,19 @@ def read_ingestion_tables(
     else:
         header_table_name = source_definition.header_table
     data_table_name = source_definition.data_table
-    header, data = sql_reader_function(config, source_definition, time_batch)
+    header, data = sql_reader_function(
+        config, source_definition, time_batch, read_options=read_options
+    )
     logger.debug("Fixing data types of the input fields")
-    sql_data_types = get_sql_data_types(config, data_table_name, header_table_name)
-    header = cast_to_right_types(header, sql_data_types)
-    data = cast_to_right_types(data, sql_data_types)
+    if read_options is not None and read_options.server_side_join:
+        cast_plan = get_joined_cast_plan(config, source_definition)
+    else:
+        cast_plan = get_cast_plan(config, data_table_name, header_table_name)
+    header = cast_to_right_types(header, cast_plan)
+    if isinstance(data, pandas.DataFrame):
+        data = cast_to_right_types(data, cast_plan)
+    else:
+        data = (cast_to_right_types(chunk, cast_plan) for chunk in data)
     return header, data
 
 
@@ -274,29 +577,91 @@ def get_function_reference(sql_reader_function: Callable) -> str:
     return module + "." + name
 
 
-def get_sql_data_types(
-    config: DBConfig, data_table_name: str, header_table_name: str | None
-) -> pandas.Series:
-    # Ids are renamed, so they fit with the result of the merge. pandas merge renames
-    # conflicting colums appending "_x" and "_y" to them.
-    header_data_types = pandas.read_sql(
-        f"select column_name, data_type from information_schema.columns where "
-        f"table_name='{header_table_name}' ORDER BY column_name",
-        config.get_url(),
-        index_col="column_name",
+@dataclass(frozen=True)
+class TableSchema:
+    """Columns of a table and their SQL data types, in the order of the table."""
+
+    columns: tuple[str, ...]
+    data_types: tuple[str, ...]
+
+
+def get_table_schema(config: DBConfig, table_name: str) -> TableSchema:
+    """
+    Return the schema of a table from information_schema.
+
+    The schema is only queried once per table and run, as the ingestion tables do not
+    change while they are being read. Use clear_schema_cache if they do.
+    """
+    return _get_table_schema(config.get_url(), table_name)
+
+
+@lru_cache
+def _get_table_schema(db_url: str, table_name: str) -> TableSchema:
+    logger.debug(f"Reading the schema of {table_name}")
+    schema = pandas.read_sql(
+        sa.text(
+            "select column_name, data_type from information_schema.columns where "
+            "table_name=:table_name ORDER BY ordinal_position"
+        ),
+        get_engine(db_url),
+        params=dict(table_name=table_name),
     )
-    data_data_types = pandas.read_sql(
-        f"select column_name, data_type from information_schema.columns where "
-        f"table_name='{data_table_name}' ORDER BY column_name",
-        config.get_url(),
-        index_col="column_name",
+    return TableSchema(
+        columns=tuple(schema["column_name"]), data_types=tuple(schema["data_type"])
     )
-    data_types_sql = pandas.concat([header_data_types, data_data_types])
-    data_types_sql = data_types_sql[~data_types_sql.index.duplicated(keep="first")]
-    # if any(~data_types_sql.data_type.isin(sqltype2numpytypes)):
-    #     raise RuntimeError("Not all SQL types found can be mapped to numpy")
-    # data_types = data_types_sql.replace(dict(data_type=sqltype2numpytypes))
-    return data_types_sql.squeeze()
+
+
+def clear_schema_cache():
+    _get_table_schema.cache_clear()
+    _get_cast_plan.cache_clear()
+
+
+def get_cast_plan(
+    config: DBConfig, data_table_name: str, header_table_name: str | None
+) -> dict[str, str]:
+    """
+    Return the numpy dtype of each column of the data and header tables.
+
+    This is computed once per run and used to cast every batch read.
+    """
+    return _get_cast_plan(config.get_url(), data_table_name, header_table_name)
+
+
+@lru_cache
+def _get_cast_plan(
+    db_url: str, data_table_name: str, header_table_name: str | None
+) -> dict[str, str]:
+    cast_plan: dict[str, str] = {}
+    # For the columns in both tables, the header type is used.
+    for table_name in [data_table_name, header_table_name]:
+        if table_name is None:
+            continue
+        schema = _get_table_schema(db_url, table_name)
+        for column, sql_type in zip(schema.columns, schema.data_types):
+            if sql_type in sqltype2numpytypes:
+                cast_plan[column] = sqltype2numpytypes[sql_type]
+    return cast_plan
+
+
+def get_joined_cast_plan(
+    config: DBConfig, source_definition: SourceDefinition
+) -> dict[str, str]:
+    """Return the cast plan of the header and data tables joined in the database."""
+    join_ids = source_definition.join_ids
+    header_table_name = source_definition.header_table
+    assert join_ids is not None and header_table_name is not None
+    data_table_name = source_definition.data_table
+    cast_plan = dict(get_cast_plan(config, data_table_name, header_table_name))
+    header_cast_plan = get_cast_plan(config, header_table_name, None)
+    data_cast_plan = get_cast_plan(config, data_table_name, None)
+    cast_plan["report_id"] = header_cast_plan[join_ids.header]
+    cast_plan["observation_id"] = data_cast_plan["id"]
+    return cast_plan
+
+
+def get_table_columns(config: DBConfig, table_name: str) -> list[str]:
+    """Return the column names of a table, in the order of the table."""
+    return list(get_table_schema(config, table_name).columns)
 
 
 sqltype2numpytypes = {
@@ -354,21 +719,20 @@ def get_time_field(source_definition: SourceDefinition) -> Tuple[str, bool]:
 
 
 def cast_to_right_types(
-    data_from_sql: pandas.DataFrame, sql_types: pandas.Series
+    data_from_sql: pandas.DataFrame, cast_plan: dict[str, str]
 ) -> pandas.DataFrame:
     """
     Cast to the right types according to our sql to pandas mapping.
 
     By default, we get too large types (float64 and int64) and also nulleble types that
-    do not have an equivalent in numpy. We fix that here.
+    do not have an equivalent in numpy. We fix that here. cast_plan maps each column
+    to its numpy dtype, see get_cast_plan.
     """
-    input_dtypes = data_from_sql.dtypes
-
-    for field_name in data_from_sql.columns.tolist():
-        # field_name = cast(str, colname)  # Workaround for bug in pandas-stubs
-        input_dtype = input_dtypes.loc[field_name]
-        sql_type = sql_types.loc[field_name]
-        numpy_dtype = sqltype2numpytypes[sql_type]
+    for field_name, input_dtype in data_from_sql.dtypes.items():
+        field_name = cast(str, field_name)  # Workaround for bug in pandas-stubs
+        if field_name not in cast_plan:
+            raise KeyError(f"SQL data type of {field_name} not found or not supported")
+        numpy_dtype = cast_plan[field_name]
         if str(input_dtype) != numpy_dtype:
             # Check nullable integers and convert to int64 without nulls
             if (str(input_dtype) == "Int64") and data_from_sql[
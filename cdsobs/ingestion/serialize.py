@@ -19,15 +19,27 @@ from cdsobs.ingestion.core import (
     SerializedPartition,
     TimeSpaceBatch,
 )
+from cdsobs.ingestion.partition_index import (
+    get_partition_index,
+    write_partition_index,
+)
 from cdsobs.netcdf import (
     get_encoding_with_compression,
     get_encoding_with_compression_xarray,
 )
+from cdsobs.observation_catalogue.schemas.constraints import get_partition_summary
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.storage import StorageClient
 from cdsobs.utils.logutils import get_logger
 from cdsobs.utils.types import ByteSize
-from cdsobs.utils.utils import compute_hash, datetime_to_seconds, get_file_size
+from cdsobs.utils.utils import (
+    compute_hash,
+    datetime_to_seconds,
+    get_code_mapping,
+    get_file_size,
+    map_to_categorical,
+    seconds_to_datetime,
+)
 
 logger = get_logger(__name__)
 
@@ -48,6 +60,7 @@ def write_pandas_to_netcdf(
     encoding: dict,
     var_selection: list[str] | None = None,
     attrs: dict | None = None,
+    global_attrs: dict | None = None,
 ):
     """Write each variable to netcdf using h5netcdf.
 
@@ -70,25 +83,25 @@ def write_pandas_to_netcdf(
     for v in var_selection:
         vardata = input_data[v]
         var_encoding = encoding[v] if v in encoding else {}
-        fillvalue = _get_default_fillvalue(vardata.values.dtype)
-        if str(vardata.values.dtype) not in ["string", "object"]:
+        if isinstance(vardata.dtype, pandas.CategoricalDtype):
+            values = _categorical_to_numpy(vardata)
+        elif str(vardata.values.dtype) in ["string", "object"]:
+            values = _strings_to_bytes(vardata)
+        else:
+            values = vardata.values
+        fillvalue = _get_default_fillvalue(values.dtype)
+        if values.dtype.kind != "S":
             # This is needed so
             ovar = oncobj.create_variable(
                 v,
-                data=vardata.values,
+                data=values,
                 dimensions=dimensions_base,
                 chunks=(max_chunksize,),
                 fillvalue=fillvalue,
                 **var_encoding,
             )
         else:
-            try:
-                vardata = vardata.astype("bytes").values
-            except UnicodeError:
-                # Need this in some cases for the non ascii characters to be well
-                # handled. This should be fixed before, not sure why it happens here.
-                vardata = vardata.str.encode("UTF-8").astype("bytes").values
-            slen = vardata.dtype.itemsize
+            slen = values.dtype.itemsize
             sdict[v] = slen
             strdim = "string_" + v
             oncobj.dimensions[strdim] = slen
@@ -101,7 +114,7 @@ def write_pandas_to_netcdf(
             var_encoding["dtype"] = "S1"
             ovar = oncobj.create_variable(
                 v,
-                data=vardata.view("S1").reshape(vardata.shape[0], slen),
+                data=values.view("S1").reshape(values.shape[0], slen),
                 chunks=(max_chunksize_str, slen),
                 dimensions=dimensions,
                 fillvalue=fillvalue,
@@ -109,11 +122,43 @@ def write_pandas_to_netcdf(
             )
         if attrs is not None and v in attrs:
             ovar.attrs.update(attrs[v])
+    if global_attrs is not None:
+        oncobj.attrs.update(global_attrs)
 
     oncobj.sync()
     oncobj.close()
 
 
+def _strings_to_bytes(vardata: pandas.Series) -> numpy.ndarray:
+    try:
+        return vardata.astype("bytes").values
+    except UnicodeError:
+        # Need this in some cases for the non ascii characters to be well
+        # handled. This should be fixed before, not sure why it happens here.
+        return vardata.str.encode("UTF-8").astype("bytes").values
+
+
+def _categorical_to_numpy(vardata: pandas.Series) -> numpy.ndarray:
+    """
+    Gather the categories by code.
+
+    The result is the same as for the non categorical column, but strings are only
+    encoded once per category.
+    """
+    categories = pandas.Series(vardata.cat.categories)
+    codes = vardata.cat.codes.to_numpy()
+    if str(categories.dtype) in ["string", "object"]:
+        category_values = _strings_to_bytes(categories)
+        missing = numpy.array([b"nan"])
+    else:
+        category_values = categories.to_numpy()
+        missing = numpy.array([numpy.nan])
+    if (codes < 0).any():
+        # Missing values have code -1, which takes the last element
+        category_values = numpy.concatenate([category_values, missing])
+    return category_values[codes]
+
+
 def to_netcdf(
     cdm_dataset: CdmDataset, tempdir: Path, encode_variables: bool = True
 ) -> Path:
@@ -147,26 +192,82 @@ def to_netcdf(
             cdm_dataset.dataset[varname] = datetime_to_seconds(var_series)
             attrs[varname] = dict(units=constants.TIME_UNITS)
     # Write to netCDF
+    # Record the layout of the rows, so readers know how the file is sorted
+    sort_key = cdm_dataset.dataset_params.get_sort_key()
     write_pandas_to_netcdf(
-        output_path, cdm_dataset.dataset.reset_index(), encoding=encoding, attrs=attrs
+        output_path,
+        cdm_dataset.dataset.reset_index(),
+        encoding=encoding,
+        attrs=attrs,
+        global_attrs=dict(sort_key=",".join(sort_key)),
     )
+    if encode_variables:
+        # Row ranges of days and stations, so the readers can read only a hyperslab
+        write_partition_index(output_path, get_partition_index(cdm_dataset.dataset))
     return output_path
 
 
+def read_partition_file(file_path: Path) -> pandas.DataFrame:
+    """
+    Read a partition file written by to_netcdf back to a table.
+
+    This is the inverse of to_netcdf: character arrays are joined and decoded to
+    strings, times are converted back to datetimes and the observed variables are
+    decoded using the labels stored in the file. Fill values are kept as they are, so
+    the data can be written again without changing the data types.
+    """
+    with h5netcdf.File(file_path, "r") as incobj:
+        return read_partition_variables(incobj, list(incobj.variables))
+
+
+def read_partition_variables(
+    incobj: h5netcdf.File, varnames: list[str], rows: slice = slice(None)
+) -> pandas.DataFrame:
+    """
+    Read and decode some variables of an open partition file, as read_partition_file.
+
+    Only the rows in the rows slice are read, so files opened remotely are read in
+    byte ranges.
+    """
+    data = dict()
+    for varname in varnames:
+        variable = incobj.variables[varname]
+        values = variable[rows]
+        if values.dtype.kind == "S":
+            slen = values.shape[-1]
+            strings = values.view(f"S{slen}").ravel()
+            data[varname] = pandas.Series(strings).str.decode("UTF-8")
+        elif variable.attrs.get("units") == constants.TIME_UNITS:
+            data[varname] = seconds_to_datetime(values)
+        elif varname == "observed_variable":
+            code2var = get_code_mapping(incobj, inverse=True)
+            data[varname] = map_to_categorical(pandas.Series(values), code2var)
+        else:
+            data[varname] = values
+    return pandas.DataFrame(data)
+
+
 def encode_observed_variables(
     cdm_code_tables: CDMCodeTables, data: pandas.DataFrame
 ) -> Tuple[pandas.Series, dict]:
     code_table = cdm_code_tables["observed_variable"].table
     # strip to remove extra spaces
     var2code = get_var2code(code_table)
-    variables = data["observed_variable"].unique().astype("S")
+    # Work on the unique values only, observed_variable is usually a categorical
+    codes, variables = pandas.factorize(data["observed_variable"])
+    if (codes < 0).any():
+        raise RuntimeError("Missing values found in observed_variable")
+    variables = [
+        v if isinstance(v, bytes) else str(v).encode("UTF-8") for v in variables
+    ]
     variables_not_in_cdm = [v for v in variables if v not in var2code]
     if len(variables_not_in_cdm) > 0:
         raise RuntimeError(f"Variables not found in CDM: {variables_not_in_cdm}")
-    encoded_data = (
-        data["observed_variable"].str.encode("UTF-8").map(var2code).astype("uint8")
+    variable_codes = numpy.array([var2code[v] for v in variables], dtype="uint8")
+    encoded_data = pandas.Series(
+        variable_codes[codes], index=data.index, name="observed_variable"
     )
-    codes_in_data = encoded_data.unique()
+    codes_in_data = set(variable_codes)
     var2code_subset = {
         var.decode("ascii"): code
         for var, code in var2code.items()
@@ -208,6 +309,7 @@ def serialize_partition(partition: DatasetPartition, odir: Path) -> SerializedPa
     -------
     An SerializedPartition object with the partition and file parameters.
     """
+    summary = get_partition_summary(partition.data)
     # Get in memory representation of the CDM
     cdm_dataset = to_cdm_dataset(partition)
     # Save to netcdf
@@ -221,6 +323,7 @@ def serialize_partition(partition: DatasetPartition, odir: Path) -> SerializedPa
         partition.partition_params,
         partition.dataset_metadata,
         partition.constraints,
+        summary,
     )
 
 
@@ -290,14 +393,15 @@ def batch_to_netcdf(
         if homogenised_data[field].dtype == "string":
             homogenised_data[field] = homogenised_data[field].str.encode("UTF-8")
     homogenised_data = define_units(
-        homogenised_data,
-        service_definition.sources[source],
-        dataset_params.cdm_code_tables["observed_variable"],
+        homogenised_data, service_definition.sources[source]
     )
     encoded_data, var2code_subset = encode_observed_variables(
         dataset_params.cdm_code_tables, homogenised_data
     )
     homogenised_data["observed_variable"] = encoded_data
+    for field in homogenised_data:
+        if isinstance(homogenised_data[field].dtype, pandas.CategoricalDtype):
+            homogenised_data[field] = _categorical_to_numpy(homogenised_data[field])
     homogenised_data_xr = homogenised_data.to_xarray()
     if service_definition.global_attributes is not None:
         homogenised_data.attrs = {
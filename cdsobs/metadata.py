@@ -34,5 +34,6 @@ def get_dataset_metadata(run_params: IngestionRunParams) -> DatasetMetadata:
         cdm_code_tables,
         space_columns,
         run_params.version,
+        service_definition.sort_key,
     )
     return dataset_metadata
@@ -13,7 +13,11 @@ def get_encoding_with_compression(
     # Set compresison for the observations table
     for var in dataset.columns:
         encoding.update({var: dict(compression="gzip", compression_opts=1)})
-        match dataset[var].dtype.kind, string_transform:
+        var_dtype = dataset[var].dtype
+        if isinstance(var_dtype, pandas.CategoricalDtype):
+            # Categoricals are written as their categories
+            var_dtype = var_dtype.categories.dtype
+        match var_dtype.kind, string_transform:
             case "O", "str_to_char":
                 encoding[var].update(dict(dtype="S"))
             case "S" | "O", "char_to_str":
@@ -21,7 +25,7 @@ def get_encoding_with_compression(
             case "M", _:
                 pass
             case _, _:
-                encoding[var].update(dict(dtype=dataset[var].values.dtype))
+                encoding[var].update(dict(dtype=var_dtype))
     return encoding
 
 
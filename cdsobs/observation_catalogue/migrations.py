@@ -0,0 +1,85 @@
+"""Upgrade the schema of an existing catalogue database."""
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from cdsobs.observation_catalogue.models import Base, Catalogue
+from cdsobs.observation_catalogue.schemas.constraints import ConstraintsSchema
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+
+def upgrade_catalogue(session: Session):
+    """
+    Add the columns and indexes that are missing in an existing catalogue database.
+
+    New tables are created by get_session, but create_all does not modify the tables
+    that already exist. This only adds columns and indexes, it never drops or alters
+    them, so it is safe to run it several times. Generated columns are computed for
+    the existing rows when added.
+    """
+    connection = session.connection()
+    inspector = sa.inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            logger.info(f"Adding column {column.name} to {table.name}")
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(
+                sa.text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+            )
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}")
+            connection.execute(CreateIndex(index, if_not_exists=True))
+    session.commit()
+
+
+def backfill_day_bitmaps(
+    session: Session, dataset: str | None = None, batch_size: int = 1000
+) -> int:
+    """
+    Compute the day_bitmap of the catalogue entries that do not have it.
+
+    The days with data are read from the constraints stored in the catalogue, so the
+    files are not downloaded. The entries are updated in batches of batch_size, each
+    one in its own transaction, so it can be interrupted and run again. Returns the
+    number of entries updated.
+    """
+    filters: list[sa.ColumnElement] = [Catalogue.day_bitmap.is_(None)]
+    if dataset is not None:
+        filters.append(Catalogue.dataset == dataset)
+    num_updated = 0
+    last_id = -1
+    while True:
+        rows = session.execute(
+            sa.select(
+                Catalogue.id, Catalogue.time_coverage_start, Catalogue.constraints
+            )
+            .filter(*filters, Catalogue.id > last_id)
+            .order_by(Catalogue.id)
+            .limit(batch_size)
+        ).all()
+        if len(rows) == 0:
+            break
+        updates = [
+            dict(
+                id=row.id,
+                day_bitmap=ConstraintsSchema(**row.constraints).get_day_bitmap(
+                    row.time_coverage_start
+                ),
+            )
+            for row in rows
+        ]
+        session.execute(sa.update(Catalogue), updates)
+        session.commit()
+        num_updated += len(updates)
+        last_id = rows[-1].id
+        logger.info(f"Computed the day_bitmap of {num_updated} entries")
+    return num_updated
@@ -1,18 +1,29 @@
 from datetime import datetime
+from decimal import Decimal
 from pprint import pformat
 from typing import List
 
 from sqlalchemy import (
     BigInteger,
     Boolean,
+    Computed,
     Float,
     ForeignKey,
     ForeignKeyConstraint,
+    Index,
     PrimaryKeyConstraint,
     String,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TIMESTAMP
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    BIT,
+    JSONB,
+    NUMRANGE,
+    TIMESTAMP,
+    TSRANGE,
+    Range,
+)
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -95,17 +106,139 @@ class Catalogue(Base):
     data_size: Mapped[int] = mapped_column(BigInteger)
     file_checksum: Mapped[str] = mapped_column(String)
     constraints: Mapped[JSONType] = deferred(mapped_column(JSONType))  # type: ignore
-    # Ensuring foreign keys reference both parts of the composite key
+    # Observations of each variable and first and last day of each station in the
+    # file (see PartitionSummary), NULL for the entries written before they existed.
+    variable_counts: Mapped[dict | None] = deferred(mapped_column(JSONB, nullable=True))
+    station_day_ranges: Mapped[dict | None] = deferred(
+        mapped_column(JSONB, nullable=True)
+    )
+    # Days with data in the file, bit i is the day time_coverage_start + i (see
+    # ConstraintsSchema.get_day_bitmap), NULL for the entries not backfilled yet.
+    day_bitmap: Mapped[str | None] = deferred(
+        mapped_column(BIT(varying=True), nullable=True)
+    )
+    # Columns the rows of the file are sorted by, NULL for the entries written before
+    # it was configurable, which are sorted by report_timestamp and coordinates.
+    sort_key: Mapped[List[str] | None] = mapped_column(ARRAY(String), nullable=True)
+    # Coverages as ranges, generated by the database so they can be indexed with GiST.
+    # They are only used for filtering, so they are not loaded with the entries.
+    time_coverage: Mapped[Range[datetime]] = deferred(
+        mapped_column(
+            TSRANGE,
+            Computed("tsrange(time_coverage_start, time_coverage_end)", persisted=True),
+        )
+    )
+    latitude_coverage: Mapped[Range[Decimal]] = deferred(
+        mapped_column(
+            NUMRANGE,
+            Computed(
+                "numrange(latitude_coverage_start::numeric, "
+                "latitude_coverage_end::numeric)",
+                persisted=True,
+            ),
+        )
+    )
+    longitude_coverage: Mapped[Range[Decimal]] = deferred(
+        mapped_column(
+            NUMRANGE,
+            Computed(
+                "numrange(longitude_coverage_start::numeric, "
+                "longitude_coverage_end::numeric)",
+                persisted=True,
+            ),
+        )
+    )
     __table_args__ = (
+        # Ensuring foreign keys reference both parts of the composite key
         ForeignKeyConstraint(
             ["dataset", "version"],
             ["cads_dataset_version.dataset", "cads_dataset_version.version"],
         ),
+        Index(
+            "ix_catalogue_dataset_dataset_source_version",
+            "dataset",
+            "dataset_source",
+            "version",
+        ),
+        Index("ix_catalogue_time_coverage", "time_coverage", postgresql_using="gist"),
+        Index(
+            "ix_catalogue_latitude_coverage",
+            "latitude_coverage",
+            postgresql_using="gist",
+        ),
+        Index(
+            "ix_catalogue_longitude_coverage",
+            "longitude_coverage",
+            postgresql_using="gist",
+        ),
+        Index("ix_catalogue_stations", "stations", postgresql_using="gin"),
+        Index("ix_catalogue_variables", "variables", postgresql_using="gin"),
+    )
+
+    def __str__(self) -> str:
+        return pformat({k: v for k, v in self.__dict__.items() if k[0] != "_"})
+
+
+class IngestionWatermark(Base):
+    """Schema for the ingestion_watermark table in the catalogue.
+
+    Each row stores the last report_timestamp ingested for a source of a dataset
+    version, so incremental runs only ingest the data that is newer.
+    """
+
+    __tablename__ = "ingestion_watermark"
+    dataset: Mapped[str] = mapped_column(String)
+    dataset_source: Mapped[str] = mapped_column(String)
+    version: Mapped[str] = mapped_column(String)
+    watermark: Mapped[datetime] = mapped_column(TIMESTAMP)
+    __table_args__ = (PrimaryKeyConstraint("dataset", "dataset_source", "version"),)
+
+    def __str__(self) -> str:
+        return pformat({k: v for k, v in self.__dict__.items() if k[0] != "_"})
+
+
+class IngestionJournalEntry(Base):
+    """Schema for the ingestion_journal table in the catalogue.
+
+    Each row stores the state of a partition of a batch being ingested, so an
+    interrupted make_production can be resumed. Once all the partitions of a batch are
+    committed they are replaced by a single row for the whole batch.
+    """
+
+    __tablename__ = "ingestion_journal"
+    dataset: Mapped[str] = mapped_column(String)
+    dataset_source: Mapped[str] = mapped_column(String)
+    version: Mapped[str] = mapped_column(String)
+    batch: Mapped[str] = mapped_column(String)
+    partition: Mapped[str] = mapped_column(String)
+    state: Mapped[str] = mapped_column(String)
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP)
+    __table_args__ = (
+        PrimaryKeyConstraint(
+            "dataset", "dataset_source", "version", "batch", "partition"
+        ),
     )
 
     def __str__(self) -> str:
         return pformat({k: v for k, v in self.__dict__.items() if k[0] != "_"})
 
 
+class CatalogueVersionStamp(Base):
+    """Schema for the catalogue_version_stamp table in the catalogue.
+
+    Each row holds a counter that is increased every time the catalogue entries, the
+    service definition or the forms of a dataset change. The HTTP API uses it to
+    invalidate its cache.
+    """
+
+    __tablename__ = "catalogue_version_stamp"
+    dataset: Mapped[str] = mapped_column(String, primary_key=True)
+    stamp: Mapped[int] = mapped_column(BigInteger)
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP)
+
+    def __str__(self) -> str:
+        return pformat({k: v for k, v in self.__dict__.items() if k[0] != "_"})
+
+
 def row_to_json(row: Base) -> dict:
     return {c.name: getattr(row, c.name) for c in row.__table__.columns}
@@ -0,0 +1,38 @@
+from typing import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cdsobs.observation_catalogue.repositories.catalogue import select_assets
+from cdsobs.observation_catalogue.repositories.version_stamp import select_stamp
+from cdsobs.utils.exceptions import CatalogueException
+
+
+class AsyncCatalogueRepository:
+    """
+    Read only interface to the catalogue for the async endpoints of the HTTP API.
+
+    The queries are the same as the ones of CatalogueRepository and
+    VersionStampRepository, but they are run with an AsyncSession (asyncpg driver), so
+    the event loop is not blocked while waiting for the database.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_assets_by_filters(
+        self,
+        filter_args: list[sa.sql.elements.BinaryExpression | sa.ColumnElement],
+        sort: bool = False,
+    ) -> Sequence[sa.Row[tuple[str, int]]]:
+        """Return the asset and file_size of the entries matching the filters."""
+        try:
+            result = await self.session.execute(select_assets(filter_args, sort))
+        except Exception as e:
+            raise CatalogueException(f"Invalid query parameters: \n {e}")
+        return result.all()
+
+    async def get_stamp(self, dataset: str) -> int:
+        """Return the version stamp of a dataset, 0 if it has never changed."""
+        stamp = await self.session.scalar(select_stamp(dataset))
+        return 0 if stamp is None else stamp
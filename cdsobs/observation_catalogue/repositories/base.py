@@ -37,6 +37,13 @@ class BaseRepository:
         self.session.bulk_save_objects(db_objs)
         self.session.commit()
 
+    def update(self, db_obj: Base, obj_in: BaseModel) -> Base:
+        for field, value in obj_in.model_dump(mode="json").items():
+            setattr(db_obj, field, value)
+        self.session.commit()
+        self.session.refresh(db_obj)
+        return db_obj
+
     def remove(self, record_id: int) -> Base | None:
         obj = self.session.get(self.model, record_id)
         self.session.delete(obj)
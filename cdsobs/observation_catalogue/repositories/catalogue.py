@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Sequence
+from typing import Iterator, Sequence
 
 import sqlalchemy as sa
 from sqlalchemy.orm import Session
@@ -9,6 +9,22 @@ from cdsobs.observation_catalogue.repositories.base import BaseRepository
 from cdsobs.utils.exceptions import CatalogueException
 
 
+def select_assets(
+    filter_args: list[sa.sql.elements.BinaryExpression | sa.ColumnElement],
+    sort: bool = False,
+) -> sa.Select:
+    """Query for the asset and file_size of the entries matching the filters."""
+    query = sa.select(Catalogue.asset, Catalogue.file_size).filter(*filter_args)
+    if sort:
+        keys = [
+            Catalogue.time_coverage_start,
+            Catalogue.latitude_coverage_start,
+            Catalogue.longitude_coverage_end,
+        ]
+        query = query.order_by(*keys)  # type: ignore[arg-type]
+    return query
+
+
 class CatalogueRepository(BaseRepository):
     """Interface to interact with the catalogue table in the catalogue."""
 
@@ -86,6 +102,26 @@ class CatalogueRepository(BaseRepository):
         except Exception as e:
             raise CatalogueException(f"Invalid query parameters: \n {e}")
 
+    def get_assets_by_filters(
+        self,
+        filter_args: list[sa.sql.elements.BinaryExpression | sa.ColumnElement],
+        sort: bool = False,
+        yield_per: int = 1000,
+    ) -> Iterator[sa.Row[tuple[str, int]]]:
+        """
+        Return the asset and file_size of the entries matching the filters.
+
+        Only these two columns are read, and the rows are fetched from the database in
+        batches of yield_per, so memory does not depend on the size of the stations
+        or constraints of the entries.
+        """
+        try:
+            query = select_assets(filter_args, sort)
+            query = query.execution_options(yield_per=yield_per)
+            return iter(self.session.execute(query))
+        except Exception as e:
+            raise CatalogueException(f"Invalid query parameters: \n {e}")
+
     def get_all_assets(self, skip: int = 0, limit: int = 100) -> Sequence[str]:
         results = self.session.scalars(
             sa.select(Catalogue.asset).offset(skip).limit(limit)
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from cdsobs.observation_catalogue.models import IngestionJournalEntry
+from cdsobs.observation_catalogue.repositories.base import BaseRepository
+
+
+class IngestionJournalRepository(BaseRepository):
+    """Interface to interact with the ingestion_journal table in the catalogue."""
+
+    def __init__(self, session: Session):
+        super().__init__(session, model=IngestionJournalEntry)
+
+    def get_states(
+        self, dataset: str, dataset_source: str, version: str, batch: str
+    ) -> dict[str, str]:
+        """Return the state of each partition of a batch."""
+        results = self.session.execute(
+            sa.select(
+                IngestionJournalEntry.partition, IngestionJournalEntry.state
+            ).filter(
+                IngestionJournalEntry.dataset == dataset,
+                IngestionJournalEntry.dataset_source == dataset_source,
+                IngestionJournalEntry.version == version,
+                IngestionJournalEntry.batch == batch,
+            )
+        ).all()
+        return {partition: state for partition, state in results}
+
+    def set_state(
+        self,
+        dataset: str,
+        dataset_source: str,
+        version: str,
+        batch: str,
+        partition: str,
+        state: str,
+    ):
+        statement = insert(IngestionJournalEntry).values(
+            dataset=dataset,
+            dataset_source=dataset_source,
+            version=version,
+            batch=batch,
+            partition=partition,
+            state=state,
+            updated_at=datetime.now(),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[
+                "dataset",
+                "dataset_source",
+                "version",
+                "batch",
+                "partition",
+            ],
+            set_=dict(
+                state=statement.excluded.state,
+                updated_at=statement.excluded.updated_at,
+            ),
+        )
+        self.session.execute(statement)
+        self.session.commit()
+
+    def delete_batch(self, dataset: str, dataset_source: str, version: str, batch: str):
+        self.session.execute(
+            sa.delete(IngestionJournalEntry).filter(
+                IngestionJournalEntry.dataset == dataset,
+                IngestionJournalEntry.dataset_source == dataset_source,
+                IngestionJournalEntry.version == version,
+                IngestionJournalEntry.batch == batch,
+            )
+        )
+        self.session.commit()
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from cdsobs.observation_catalogue.models import IngestionWatermark
+from cdsobs.observation_catalogue.repositories.base import BaseRepository
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+
+class IngestionWatermarkRepository(BaseRepository):
+    """Interface to interact with the ingestion_watermark table in the catalogue."""
+
+    def __init__(self, session: Session):
+        super().__init__(session, model=IngestionWatermark)
+
+    def get_watermark(
+        self, dataset: str, dataset_source: str, version: str
+    ) -> datetime | None:
+        return self.session.scalar(
+            sa.select(IngestionWatermark.watermark).filter(
+                IngestionWatermark.dataset == dataset,
+                IngestionWatermark.dataset_source == dataset_source,
+                IngestionWatermark.version == version,
+            )
+        )
+
+    def update_watermark(
+        self, dataset: str, dataset_source: str, version: str, watermark: datetime
+    ):
+        """Move the watermark forward, it is never moved backwards."""
+        logger.info(
+            f"Setting the watermark of {dataset} {dataset_source} to {watermark}"
+        )
+        statement = insert(IngestionWatermark).values(
+            dataset=dataset,
+            dataset_source=dataset_source,
+            version=version,
+            watermark=watermark,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["dataset", "dataset_source", "version"],
+            set_=dict(
+                watermark=sa.func.greatest(
+                    IngestionWatermark.watermark, statement.excluded.watermark
+                )
+            ),
+        )
+        self.session.execute(statement)
+        self.session.commit()
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from cdsobs.observation_catalogue.models import CatalogueVersionStamp
+from cdsobs.observation_catalogue.repositories.base import BaseRepository
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+# Stamp increased when any dataset changes, for the responses listing all of them.
+ALL_DATASETS = "__all__"
+
+
+def select_stamp(dataset: str) -> sa.Select:
+    return sa.select(CatalogueVersionStamp.stamp).filter(
+        CatalogueVersionStamp.dataset == dataset
+    )
+
+
+class VersionStampRepository(BaseRepository):
+    """Interface to interact with the catalogue_version_stamp table in the catalogue."""
+
+    def __init__(self, session: Session):
+        super().__init__(session, model=CatalogueVersionStamp)
+
+    def get_stamp(self, dataset: str) -> int:
+        """Return the stamp of a dataset, 0 if it has never changed."""
+        stamp = self.session.scalar(select_stamp(dataset))
+        return 0 if stamp is None else stamp
+
+    def bump(self, dataset: str):
+        """Increase the stamp of a dataset, and the one of all the datasets."""
+        logger.debug(f"Increasing the version stamp of {dataset}")
+        now = datetime.now()
+        statement = insert(CatalogueVersionStamp).values(
+            [
+                dict(dataset=dataset, stamp=1, updated_at=now),
+                dict(dataset=ALL_DATASETS, stamp=1, updated_at=now),
+            ]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["dataset"],
+            set_=dict(
+                stamp=CatalogueVersionStamp.stamp + 1,
+                updated_at=statement.excluded.updated_at,
+            ),
+        )
+        self.session.execute(statement)
+        self.session.commit()
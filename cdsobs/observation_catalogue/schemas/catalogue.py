@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from operator import and_
 from typing import Literal
 
@@ -32,6 +32,10 @@ class CatalogueSchema(pydantic.BaseModel):
     data_size: ByteSize
     file_checksum: str
     constraints: ConstraintsSchema
+    sort_key: list[str] | None = None
+    variable_counts: dict[str, int] | None = None
+    station_day_ranges: dict[str, tuple[date, date]] | None = None
+    day_bitmap: str | None = None
 
     @classmethod
     @pydantic.field_validator("dataset")
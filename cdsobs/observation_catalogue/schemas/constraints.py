@@ -1,7 +1,8 @@
-from datetime import datetime
+from datetime import date, datetime
 from itertools import product
 from typing import List, cast
 
+import numpy
 import pandas
 import pandas as pd
 from pydantic import BaseModel, Field, field_validator
@@ -56,6 +57,23 @@ class ConstraintsSchema(BaseModel):
             variable_constraints=variable_constraints,
         )
 
+    def get_day_bitmap(self, start: datetime) -> str:
+        """
+        Return the days with data as a string of bits, to be stored as BIT VARYING.
+
+        Bit i is 1 if there is data in the day start + i days. The string ends at the
+        last day with data, so it is empty if there are no days.
+        """
+        # time can be strings when read from the catalogue
+        days = pandas.to_datetime(pandas.Series(self.time)).dt.tz_localize(None)
+        offsets = (days.dt.floor("D") - pandas.Timestamp(start).floor("D")).dt.days
+        offsets = offsets.loc[offsets >= 0].to_numpy()
+        if len(offsets) == 0:
+            return ""
+        bits = numpy.zeros(offsets.max() + 1, dtype=bool)
+        bits[offsets] = True
+        return "".join(numpy.where(bits, "1", "0"))
+
     def get_num_obs(self) -> int:
         obs = set()
         for v in self.variable_constraints.values():
@@ -80,21 +98,70 @@ def get_partition_constraints(
     -------
 
     """
-    partition_data = partition_data[["observed_variable", STATION_COLUMN, time_column]]
+    # Work with the codes of the variables and stations, they are usually
+    # categoricals and grouping the labels is much slower.
+    variable_codes, variables = pandas.factorize(
+        partition_data["observed_variable"], sort=True
+    )
+    station_codes, stations = pandas.factorize(
+        partition_data[STATION_COLUMN], sort=True
+    )
     # We only take into account daily granularity
-    grouper = [
-        "observed_variable",
-        STATION_COLUMN,
-        pandas.Grouper(key=time_column, freq="D"),
-    ]
-    df_constraints = partition_data.groupby(grouper, as_index=False).count()
+    days = partition_data[time_column].dt.floor("D")
+    df_constraints = pandas.DataFrame(
+        {
+            "observed_variable": variable_codes,
+            STATION_COLUMN: station_codes,
+            time_column: days.to_numpy(),
+        }
+    )
+    # Missing values are not constraints
+    is_valid = (variable_codes >= 0) & (station_codes >= 0) & days.notnull().to_numpy()
+    df_constraints = df_constraints.loc[is_valid].drop_duplicates()
     df_constraints["values"] = True
     df = df_constraints.pivot(
         columns="observed_variable",
         index=[time_column, STATION_COLUMN],
         values="values",
     )
+    df.columns = pandas.Index(numpy.asarray(variables)[df.columns], dtype=object)
     df.fillna(False, inplace=True)
     df.reset_index(inplace=True)
+    df[STATION_COLUMN] = numpy.asarray(stations)[df[STATION_COLUMN].to_numpy()]
     df = df.rename({STATION_COLUMN: "stations", time_column: "time"}, axis=1)
     return ConstraintsSchema.from_table(df)
+
+
+class PartitionSummary(BaseModel):
+    """
+    What a partition actually contains, used to prune the catalogue entries.
+
+    variable_counts are the number of observations of each variable and
+    station_day_ranges the first and last day with data of each station.
+    """
+
+    variable_counts: dict[str, int]
+    station_day_ranges: dict[str, tuple[date, date]]
+
+    @property
+    def variables(self) -> list[str]:
+        return sorted(self.variable_counts)
+
+
+def get_partition_summary(
+    partition_data: pd.DataFrame, time_column: str = "report_timestamp"
+) -> PartitionSummary:
+    """Compute the variables, observation counts and station days of a partition."""
+    variable_counts = partition_data["observed_variable"].value_counts(sort=False)
+    variable_counts = variable_counts.loc[variable_counts > 0]
+    days = partition_data[time_column].dt.floor("D")
+    station_days = days.groupby(
+        partition_data[STATION_COLUMN].astype(str).to_numpy()
+    ).agg(["min", "max"])
+    return PartitionSummary(
+        variable_counts={str(v): int(c) for v, c in variable_counts.items()},
+        station_day_ranges={
+            station: (first.date(), last.date())
+            for station, first, last in station_days.dropna().itertuples()
+        },
+    )
@@ -1,5 +1,4 @@
 """Retrieve pipeline."""
-import itertools
 from pathlib import Path
 
 from cads_adaptors.adaptors.cadsobs.retrieve import retrieve_data
@@ -9,7 +8,8 @@ from cdsobs.config import CDSObsConfig
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.retrieve.models import RetrieveArgs
 from cdsobs.retrieve.retrieve_services import (
-    get_catalogue_entries,
+    get_catalogue_assets,
+    get_retrieve_variables,
     get_urls,
 )
 from cdsobs.service_definition.api import get_service_definition
@@ -48,21 +48,14 @@ def retrieve_observations(
     # Query the storage to get the URLS of the files that contain the data requested
     with get_database_session(config.catalogue_db.get_url()) as session:
         catalogue_repository = CatalogueRepository(session)
-        entries = get_catalogue_entries(catalogue_repository, retrieve_args)
-        object_urls = get_urls(entries, storage_url)
+        assets = get_catalogue_assets(catalogue_repository, retrieve_args)
+        object_urls = get_urls(assets, storage_url)
         service_definition = get_service_definition(config, retrieve_args.dataset)
         global_attributes = service_definition.global_attributes
     field_attributes = cdm_lite_variables["attributes"]
-    cdm_lite_vars = list(
-        set(itertools.chain.from_iterable(cdm_lite_variables.values()))
+    cdm_lite_vars = get_retrieve_variables(
+        service_definition, retrieve_args.params.dataset_source
     )
-    disabled_fields_config = service_definition.disabled_fields
-    source = retrieve_args.params.dataset_source
-    if isinstance(disabled_fields_config, dict):
-        disabled_fields = disabled_fields_config.get(source, [])
-    else:
-        disabled_fields = disabled_fields_config
-    cdm_lite_vars = [v for v in cdm_lite_vars if v not in disabled_fields]
     context = Context()
     output_path = retrieve_data(
         retrieve_args.dataset,
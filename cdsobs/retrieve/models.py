@@ -1,4 +1,5 @@
-from datetime import datetime
+import calendar
+from datetime import date, datetime
 from itertools import product
 from typing import Any, List, Literal
 
@@ -6,6 +7,7 @@ import sqlalchemy
 from pydantic import BaseModel, field_validator, model_validator
 from pydantic_extra_types.semantic_version import SemanticVersion
 from sqlalchemy import BinaryExpression, ColumnElement, any_
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from cdsobs.observation_catalogue.models import Catalogue
 from cdsobs.utils.types import BoundedLat, BoundedLon
@@ -79,6 +81,16 @@ class RetrieveParams(BaseModel, extra="ignore"):
                     # If is a single value check for equality
                     filter_arg = getattr(Catalogue, param) == value
             filter_arguments.append(filter_arg)
+        # Prune the entries without data in any of the requested days
+        if self.year is not None and self.day is not None:
+            filter_arguments.append(self._get_day_argument(self._get_requested_days()))
+        # Prune the entries without data for the stations in the requested days
+        if self.stations is not None:
+            time_bounds = self._get_time_bounds()
+            if time_bounds is not None:
+                filter_arguments.append(
+                    self._get_station_day_argument(self.stations, *time_bounds)
+                )
         # Add dataset name too
         if dataset is not None:
             filter_arguments.append(Catalogue.dataset == dataset)
@@ -95,30 +107,115 @@ class RetrieveParams(BaseModel, extra="ignore"):
         datelist = [
             datetime(yy, mm, 1) for yy, mm in product(retrieve_params["year"], month)
         ]
-        filter_arg: BinaryExpression = sqlalchemy.func.tsrange(
-            Catalogue.time_coverage_start, Catalogue.time_coverage_end
-        ).op("@>")(
+        # time_coverage is tsrange(time_coverage_start, time_coverage_end), generated
+        # by the database and indexed.
+        filter_arg: BinaryExpression = Catalogue.time_coverage.op("@>")(
             any_(datelist)  # type: ignore[arg-type]
         )
         return filter_arg
 
+    def _get_requested_days(self) -> list[date]:
+        """All the days of the year, month and day combinations that exist."""
+        months = self.month if self.month is not None else range(1, 13)
+        days = self.day if self.day is not None else range(1, 32)
+        return [
+            date(yy, mm, dd)
+            for yy, mm, dd in product(self.year or [], months, days)
+            if dd <= calendar.monthrange(yy, mm)[1]
+        ]
+
+    def _get_day_argument(self, days: list[date]) -> ColumnElement:
+        # day_bitmap has bit i set if there is data in time_coverage_start + i days,
+        # look for a requested day whose bit is set. Days out of the bitmap are
+        # checked first, as get_bit fails for them.
+        requested_days = (
+            sqlalchemy.func.unnest(sqlalchemy.literal(days, ARRAY(sqlalchemy.Date)))
+            .table_valued(sqlalchemy.column("day", sqlalchemy.Date))
+            .render_derived()
+        )
+        offset = requested_days.c.day - sqlalchemy.cast(
+            Catalogue.time_coverage_start, sqlalchemy.Date
+        )
+        in_bitmap = sqlalchemy.and_(
+            offset >= 0, offset < sqlalchemy.func.bit_length(Catalogue.day_bitmap)
+        )
+        has_day = (
+            sqlalchemy.select(sqlalchemy.literal(1))
+            .select_from(requested_days)
+            .where(
+                sqlalchemy.case(
+                    (in_bitmap, sqlalchemy.func.get_bit(Catalogue.day_bitmap, offset)),
+                    else_=0,
+                )
+                == 1
+            )
+            .exists()
+        )
+        # Entries written before day_bitmap existed can not be pruned
+        return sqlalchemy.or_(Catalogue.day_bitmap.is_(None), has_day)
+
+    def _get_time_bounds(self) -> tuple[date, date] | None:
+        """First and last day that can be requested, None if time is not filtered."""
+        if self.time_coverage is not None:
+            return self.time_coverage[0].date(), self.time_coverage[1].date()
+        if self.year is None:
+            return None
+        months = self.month if self.month is not None else [1, 12]
+        days = self.day if self.day is not None else [1, 31]
+        first_year, first_month = min(self.year), min(months)
+        last_year, last_month = max(self.year), max(months)
+        # Days that do not exist in the month (as 31 in April) are moved to its end
+        first_day = min(min(days), calendar.monthrange(first_year, first_month)[1])
+        last_day = min(max(days), calendar.monthrange(last_year, last_month)[1])
+        return (
+            date(first_year, first_month, first_day),
+            date(last_year, last_month, last_day),
+        )
+
+    def _get_station_day_argument(
+        self, stations: list[str], start: date, end: date
+    ) -> ColumnElement:
+        # station_day_ranges is {station: [first_day, last_day]}, look for a station
+        # requested whose range of days overlaps the requested one.
+        station_ranges = (
+            sqlalchemy.func.jsonb_each(Catalogue.station_day_ranges)
+            .table_valued("key", "value")
+            .render_derived()
+        )
+        first_day = station_ranges.c.value.op("->>")(0)
+        last_day = station_ranges.c.value.op("->>")(1)
+        station_days = sqlalchemy.func.daterange(
+            sqlalchemy.cast(first_day, sqlalchemy.Date),
+            sqlalchemy.cast(last_day, sqlalchemy.Date),
+            "[]",
+        )
+        has_station_days = (
+            sqlalchemy.select(sqlalchemy.literal(1))
+            .select_from(station_ranges)
+            .where(
+                station_ranges.c.key.in_(stations),
+                station_days.op("&&")(sqlalchemy.func.daterange(start, end, "[]")),
+            )
+            .exists()
+        )
+        # Entries written before station_day_ranges existed can not be pruned
+        return sqlalchemy.or_(Catalogue.station_day_ranges.is_(None), has_station_days)
+
     def _get_coverage_argument(self, param: str, value: Any) -> BinaryExpression:
-        start_column = getattr(Catalogue, param + "_start")
-        end_column = getattr(Catalogue, param + "_end")
+        # The range columns are generated by the database from the start and end
+        # columns, and indexed with GiST.
+        range_column = getattr(Catalogue, param)
         if "time" in param:
             # For time we use tsrange
             range_func = sqlalchemy.func.tsrange
         else:
-            # For lat and lon we use numrange, it requires to cast to numeric
-            # or it won't work
+            # For lat and lon we use numrange
             range_func = sqlalchemy.func.numrange
-            start_column = sqlalchemy.cast(start_column, sqlalchemy.Numeric)
-            end_column = sqlalchemy.cast(end_column, sqlalchemy.Numeric)
         # Get the start and end values to query for
         start_param_val = value[0]
         end_param_val = value[1]
         # Filter the catalogue entries. && operator checks if two ranges overlap
-        filter_arg: BinaryExpression = range_func(start_column, end_column).op("&&")(
+        filter_arg: BinaryExpression = range_column.op("&&")(
             range_func(start_param_val, end_param_val)
         )
         return filter_arg
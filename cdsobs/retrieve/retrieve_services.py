@@ -1,13 +1,21 @@
-from typing import Iterable, Sequence
+import itertools
+from typing import Iterable, Iterator, Sequence
 
 import pandas
 import pandas as pd
 import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from cdsobs.cdm.lite import cdm_lite_variables
 from cdsobs.observation_catalogue.models import CadsDatasetVersion, Catalogue
+from cdsobs.observation_catalogue.repositories.async_catalogue import (
+    AsyncCatalogueRepository,
+)
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.observation_catalogue.schemas.constraints import ConstraintsSchema
 from cdsobs.retrieve.models import RetrieveArgs
+from cdsobs.service_definition.service_definition_models import ServiceDefinition
 from cdsobs.utils.exceptions import DataNotFoundException
 from cdsobs.utils.logutils import get_logger
 
@@ -53,16 +61,19 @@ def merged_constraints_table(entries: Iterable[Catalogue]) -> pd.DataFrame:
 
 
 def get_urls(
-    entries: Sequence[Catalogue],
+    entries: Iterable[Catalogue | sa.Row],
     storage_url: str,
 ) -> list[str]:
     """
-    Get the catalogue entries to get the urls of the assets. Check the size too.
+    Get the urls of the assets of the catalogue entries.
 
-    We group this is this function to ensure that entries, that can be a bit big,
-    are garbage collected.
+    The entries can be Catalogue objects or the rows returned by get_catalogue_assets.
     """
     object_urls = [f"{storage_url}/{e.asset}" for e in entries]
+    if len(object_urls) == 0:
+        raise DataNotFoundException(
+            "No entries found in catalogue for this parameter combination."
+        )
     return object_urls
 
 
@@ -70,16 +81,7 @@ def get_catalogue_entries(
     catalogue_repository: CatalogueRepository, retrieve_args: RetrieveArgs
 ) -> Sequence[Catalogue]:
     """Return the entries of the catalogue that contain the requested data."""
-    if retrieve_args.params.version == "last":
-        last_version = catalogue_repository.session.scalar(
-            sa.select(sa.func.max(CadsDatasetVersion.version)).filter(
-                CadsDatasetVersion.dataset == retrieve_args.dataset,
-                CadsDatasetVersion.deprecated == False,  # noqa
-            )
-        )
-        if last_version is None:
-            raise RuntimeError("Failure determining the last version.")
-        retrieve_args.params.version = last_version
+    _set_last_version(catalogue_repository, retrieve_args)
     entries = catalogue_repository.get_by_filters(
         retrieve_args.params.get_filter_arguments(dataset=retrieve_args.dataset),
         sort=True,
@@ -91,3 +93,81 @@ def get_catalogue_entries(
         )
     logger.info("Retrieved list of required partitions from the catalogue.")
     return entries
+
+
+def get_catalogue_assets(
+    catalogue_repository: CatalogueRepository, retrieve_args: RetrieveArgs
+) -> Iterator[sa.Row[tuple[str, int]]]:
+    """
+    Return the asset and file_size of the entries that contain the requested data.
+
+    This is lighter than get_catalogue_entries, as the other columns (stations,
+    constraints...) are not read, and the rows are streamed.
+    """
+    _set_last_version(catalogue_repository, retrieve_args)
+    return catalogue_repository.get_assets_by_filters(
+        retrieve_args.params.get_filter_arguments(dataset=retrieve_args.dataset),
+        sort=True,
+    )
+
+
+async def aget_catalogue_assets(
+    catalogue_repository: AsyncCatalogueRepository, retrieve_args: RetrieveArgs
+) -> Sequence[sa.Row[tuple[str, int]]]:
+    """Return the asset and file_size of the entries, with an async session."""
+    if retrieve_args.params.version == "last":
+        retrieve_args.params.version = await aget_last_version(
+            catalogue_repository.session, retrieve_args.dataset
+        )
+    return await catalogue_repository.get_assets_by_filters(
+        retrieve_args.params.get_filter_arguments(dataset=retrieve_args.dataset),
+        sort=True,
+    )
+
+
+def _set_last_version(
+    catalogue_repository: CatalogueRepository, retrieve_args: RetrieveArgs
+):
+    """Replace the "last" version by the last one that is not deprecated."""
+    if retrieve_args.params.version == "last":
+        retrieve_args.params.version = get_last_version(
+            catalogue_repository.session, retrieve_args.dataset
+        )
+
+
+def get_last_version(session: Session, dataset: str) -> str:
+    """Return the last version of a dataset that is not deprecated."""
+    return _check_last_version(session.scalar(select_last_version(dataset)))
+
+
+async def aget_last_version(session: AsyncSession, dataset: str) -> str:
+    """Return the last version of a dataset, with an async session."""
+    return _check_last_version(await session.scalar(select_last_version(dataset)))
+
+
+def select_last_version(dataset: str) -> sa.Select:
+    return sa.select(sa.func.max(CadsDatasetVersion.version)).filter(
+        CadsDatasetVersion.dataset == dataset,
+        CadsDatasetVersion.deprecated == False,  # noqa
+    )
+
+
+def _check_last_version(last_version: str | None) -> str:
+    if last_version is None:
+        raise RuntimeError("Failure determining the last version.")
+    return last_version
+
+
+def get_retrieve_variables(
+    service_definition: ServiceDefinition, dataset_source: str
+) -> list[str]:
+    """Return the CDM lite variables of a source, without its disabled fields."""
+    cdm_lite_vars = list(
+        set(itertools.chain.from_iterable(cdm_lite_variables.values()))
+    )
+    disabled_fields_config = service_definition.disabled_fields
+    if isinstance(disabled_fields_config, dict):
+        disabled_fields = disabled_fields_config.get(dataset_source, [])
+    else:
+        disabled_fields = disabled_fields_config
+    return [v for v in cdm_lite_vars if v not in disabled_fields]
@@ -0,0 +1,252 @@
+"""
+Server side retrieve, streaming only the rows requested.
+
+The partitions are opened remotely with fsspec, so h5netcdf only reads the byte
+ranges of the chunks it needs. The partition_index group narrows the rows to the
+hyperslab of the days and stations requested, then the variables used by the filters
+are read there and combined into a mask, and the output variables are only read for
+the rows between the first and the last row selected. Each partition is then sent as
+a chunk of CSV or of an Arrow IPC stream, so the memory used does not depend on the
+size of the request.
+"""
+
+import io
+from typing import Iterator, Literal
+
+import fsspec
+import h5netcdf
+import numpy
+import pandas
+import pyarrow
+
+from cdsobs.cdm.tables import STATION_COLUMN
+from cdsobs.ingestion.partition_index import read_partition_index
+from cdsobs.ingestion.serialize import read_partition_variables
+from cdsobs.retrieve.models import RetrieveParams
+from cdsobs.service_definition.service_definition_models import (
+    ServiceDefinition,
+    SpaceColumns,
+)
+from cdsobs.utils.logutils import get_logger
+from cdsobs.utils.utils import get_code_mapping
+
+logger = get_logger(__name__)
+
+StreamFormat = Literal["csv", "arrow"]
+TIME_COLUMN = "report_timestamp"
+# Size of the byte ranges requested to the storage
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def get_space_columns(
+    service_definition: ServiceDefinition, dataset_source: str
+) -> SpaceColumns:
+    """Return the names of the latitude and longitude columns of a source."""
+    if service_definition.space_columns is not None:
+        return service_definition.space_columns
+    space_columns = service_definition.sources[dataset_source].space_columns
+    if space_columns is None:
+        return SpaceColumns(x="longitude", y="latitude")
+    return space_columns
+
+
+def get_partition_mask(
+    incobj: h5netcdf.File,
+    params: RetrieveParams,
+    space_columns: SpaceColumns,
+    rows: slice = slice(None),
+) -> numpy.ndarray:
+    """
+    Return a boolean mask of the rows of a partition matching the retrieve params.
+
+    Only the variables used by the filters that are set are read, and only in the
+    rows slice.
+    """
+    num_rows = len(range(*rows.indices(incobj.dimensions["observation_id"].size)))
+    mask = numpy.ones(num_rows, dtype=bool)
+    if _has_time_filters(params):
+        times = pandas.DatetimeIndex(
+            read_partition_variables(incobj, [TIME_COLUMN], rows)[TIME_COLUMN]
+        )
+        mask &= _get_time_mask(times, params)
+    for coverage, column in [
+        (params.latitude_coverage, space_columns.y),
+        (params.longitude_coverage, space_columns.x),
+    ]:
+        if coverage is not None:
+            values = incobj.variables[column][rows]
+            mask &= (values >= coverage[0]) & (values <= coverage[1])
+    if params.stations is not None:
+        stations = read_partition_variables(incobj, [STATION_COLUMN], rows)
+        mask &= numpy.isin(stations[STATION_COLUMN].to_numpy(), params.stations)
+    if params.variables is not None:
+        codes = _get_variable_codes(incobj, params.variables)
+        mask &= numpy.isin(incobj.variables["observed_variable"][rows], codes)
+    return mask
+
+
+def _has_time_filters(params: RetrieveParams) -> bool:
+    time_params = [params.time_coverage, params.year, params.month, params.day]
+    return any(p is not None for p in time_params)
+
+
+def _get_variable_codes(incobj: h5netcdf.File, variables: list[str]) -> list[int]:
+    # Compare the codes, so the variable names are not decoded for each row
+    var2code = get_code_mapping(incobj)
+    return [var2code[v] for v in variables if v in var2code]
+
+
+def _get_time_mask(
+    times: pandas.DatetimeIndex, params: RetrieveParams
+) -> numpy.ndarray:
+    mask = _get_date_mask(times, params)
+    if params.time_coverage is not None:
+        start, end = params.time_coverage
+        mask &= (times >= start) & (times <= end)
+    return mask
+
+
+def _get_day_mask(days: pandas.DatetimeIndex, params: RetrieveParams) -> numpy.ndarray:
+    mask = _get_date_mask(days, params)
+    if params.time_coverage is not None:
+        # Days that overlap the time coverage
+        start, end = params.time_coverage
+        mask &= (days + pandas.Timedelta(days=1) > start) & (days <= end)
+    return mask
+
+
+def _get_date_mask(
+    times: pandas.DatetimeIndex, params: RetrieveParams
+) -> numpy.ndarray:
+    mask = numpy.ones(len(times), dtype=bool)
+    for values, component in [
+        (params.year, times.year),
+        (params.month, times.month),
+        (params.day, times.day),
+    ]:
+        if values is not None:
+            mask &= numpy.isin(component, values)
+    return mask
+
+
+def get_index_rows(incobj: h5netcdf.File, params: RetrieveParams) -> slice:
+    """
+    Return the rows of a partition that can match the retrieve params.
+
+    They are computed with the partition_index group, all the rows are returned for
+    partitions written without it.
+    """
+    index = read_partition_index(incobj)
+    if index is None:
+        return slice(None)
+    day_mask = _get_day_mask(index.days, params) if _has_time_filters(params) else None
+    variable_codes = None
+    if params.variables is not None:
+        variable_codes = _get_variable_codes(incobj, params.variables)
+    return index.get_rows(day_mask, params.stations, variable_codes)
+
+
+def read_partition_subset(
+    incobj: h5netcdf.File,
+    params: RetrieveParams,
+    space_columns: SpaceColumns,
+    variables: list[str],
+) -> pandas.DataFrame:
+    """Read the rows of a partition matching the retrieve params."""
+    variables = [v for v in variables if v in incobj.variables]
+    index_rows = get_index_rows(incobj, params)
+    mask = get_partition_mask(incobj, params, space_columns, index_rows)
+    (selected,) = numpy.nonzero(mask)
+    if len(selected) == 0:
+        return pandas.DataFrame(columns=variables)
+    # Partitions are sorted by time or station (see sort_key), so the selected rows
+    # are usually close together
+    offset = index_rows.start or 0
+    rows = slice(offset + selected[0], offset + selected[-1] + 1)
+    data = read_partition_variables(incobj, variables, rows)
+    return data.loc[mask[selected[0] : selected[-1] + 1]].reset_index(drop=True)
+
+
+def iter_partition_subsets(
+    object_urls: list[str],
+    params: RetrieveParams,
+    space_columns: SpaceColumns,
+    variables: list[str],
+) -> Iterator[pandas.DataFrame]:
+    """Yield the rows matching the retrieve params of each partition."""
+    for url in object_urls:
+        logger.debug(f"Reading {url}")
+        with fsspec.open(url, "rb", block_size=BLOCK_SIZE) as f:
+            with h5netcdf.File(f, "r") as incobj:
+                data = read_partition_subset(incobj, params, space_columns, variables)
+        if len(data) > 0:
+            yield data
+
+
+def stream_retrieve(
+    object_urls: list[str],
+    params: RetrieveParams,
+    space_columns: SpaceColumns,
+    variables: list[str],
+    stream_format: StreamFormat = "csv",
+) -> Iterator[bytes]:
+    """
+    Encode the rows matching the retrieve params as CSV or Arrow IPC stream chunks.
+
+    Parameters
+    ----------
+    object_urls:
+      URLs of the partitions, as returned by get_urls.
+    params:
+      Retrieve parameters used to filter the rows.
+    space_columns:
+      Names of the latitude and longitude columns in the partitions.
+    variables:
+      Variables (columns) to include in the output, the ones missing in a partition
+      are ignored.
+    stream_format:
+      "csv" or "arrow".
+    """
+    subsets = iter_partition_subsets(object_urls, params, space_columns, variables)
+    if stream_format == "csv":
+        yield from _stream_csv(subsets)
+    else:
+        yield from _stream_arrow(subsets)
+
+
+def _stream_csv(subsets: Iterator[pandas.DataFrame]) -> Iterator[bytes]:
+    columns: list[str] | None = None
+    for data in subsets:
+        header = columns is None
+        if columns is None:
+            columns = list(data.columns)
+        # Partitions of the same source can have different optional variables
+        data = data.reindex(columns=columns)
+        yield data.to_csv(index=False, header=header).encode("UTF-8")
+
+
+def _stream_arrow(subsets: Iterator[pandas.DataFrame]) -> Iterator[bytes]:
+    sink = io.BytesIO()
+    writer: pyarrow.ipc.RecordBatchStreamWriter | None = None
+    schema: pyarrow.Schema | None = None
+    for data in subsets:
+        # Categories change between partitions, so they are written as strings
+        categoricals = data.select_dtypes("category").columns
+        data = data.astype({c: str for c in categoricals})
+        if schema is None:
+            schema = pyarrow.Schema.from_pandas(data, preserve_index=False)
+            writer = pyarrow.ipc.new_stream(sink, schema)
+        data = data.reindex(columns=schema.names)
+        table = pyarrow.Table.from_pandas(data, schema=schema, preserve_index=False)
+        writer.write_table(table)  # type: ignore[union-attr]
+        yield _pop_buffer(sink)
+    if writer is not None:
+        writer.close()
+        yield _pop_buffer(sink)
+
+
+def _pop_buffer(sink: io.BytesIO) -> bytes:
+    value = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return value
@@ -201,11 +201,15 @@ class ServiceDefinition(BaseModel, extra="forbid"):
         str, AvailableReaders
     ] = "cdsobs.ingestion.readers.sql.read_header_and_data_tables"
     available_cdm_tables: list[str] = DEFAULT_CDM_TABLES_TO_USE
-    reader_extra_args: dict[str, str] | None = None
+    reader_extra_args: dict[str, str | int | bool] | None = None
     ingestion_db: str = "main"
     read_with_spatial_batches: bool = False
     disabled_fields: list[str] | dict[str, list[str]] = Field(default_factory=list)
     space_columns: SpaceColumns | None = None
+    # Physical order of the rows in the partitions, for example
+    # [primary_station_id, report_timestamp] for station time series requests.
+    # By default they are sorted by report_timestamp and then the space columns.
+    sort_key: list[StrNotBlank] | None = None
     sources: dict[str, SourceDefinition]
     path: Path | None = None
 
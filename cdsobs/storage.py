@@ -55,6 +55,10 @@ class StorageClient(ABC):
     ):
         pass
 
+    @abstractmethod
+    def download_file(self, bucket_name: str, object_name: str, ofile: str | Path):
+        pass
+
     @abstractmethod
     def delete_file(self, destination_bucket: str, object_name: str):
         pass
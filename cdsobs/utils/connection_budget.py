@@ -0,0 +1,111 @@
+"""Limit the number of concurrent connections to the ingestion databases."""
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator
+
+from cdsobs.config import DBConfig
+from cdsobs.utils.logutils import get_logger
+
+logger = get_logger(__name__)
+
+_budgets: dict[tuple[str, int, str], "ConnectionBudget"] = {}
+_budgets_lock = threading.Lock()
+
+
+class ConnectionBudget:
+    """
+    Counting semaphore for the connections to one database.
+
+    The permits are shared by all the threads of the process. If the
+    CADSOBS_CONNECTION_LOCKS_DIR environment variable is set, each permit is a lock
+    file in that directory instead, so the budget is shared with all the processes
+    (for example, several ingestion workers) running in the same host.
+
+    Parameters
+    ----------
+    name:
+      Name of the database, used to name the lock files.
+    max_connections:
+      Maximum number of connections open at the same time.
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, name: str, max_connections: int):
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self.name = name
+        self.max_connections = max_connections
+        self._available = max_connections
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, num_connections: int = 1) -> Iterator[int]:
+        """
+        Acquire up to num_connections permits and yield how many were acquired.
+
+        This blocks until at least one permit is free. Only the free permits are
+        taken, so large requests do not wait for the whole budget to be released.
+        """
+        num_connections = min(num_connections, self.max_connections)
+        locks_dir = os.environ.get("CADSOBS_CONNECTION_LOCKS_DIR")
+        if locks_dir is None:
+            acquired = self._acquire_permits(num_connections)
+            try:
+                yield acquired
+            finally:
+                self._release_permits(acquired)
+        else:
+            lock_files = self._acquire_lock_files(Path(locks_dir), num_connections)
+            try:
+                yield len(lock_files)
+            finally:
+                for lock_file in lock_files:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def _acquire_permits(self, num_connections: int) -> int:
+        with self._condition:
+            self._condition.wait_for(lambda: self._available > 0)
+            acquired = min(num_connections, self._available)
+            self._available -= acquired
+        return acquired
+
+    def _release_permits(self, num_connections: int):
+        with self._condition:
+            self._available += num_connections
+            self._condition.notify_all()
+
+    def _acquire_lock_files(self, locks_dir: Path, num_connections: int) -> list[IO]:
+        locks_dir.mkdir(parents=True, exist_ok=True)
+        while True:
+            lock_files: list[IO] = []
+            for slot in range(self.max_connections):
+                lock_file = Path(locks_dir, f"{self.name}.{slot}.lock").open("a")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+                lock_files.append(lock_file)
+                if len(lock_files) == num_connections:
+                    break
+            if len(lock_files) > 0:
+                return lock_files
+            logger.debug(f"Waiting for a free connection to {self.name}")
+            time.sleep(self.poll_interval)
+
+
+def get_connection_budget(config: DBConfig) -> ConnectionBudget:
+    """Return the connection budget of a database, the same for the whole process."""
+    key = (config.host, config.port, config.db_name)
+    with _budgets_lock:
+        if key not in _budgets:
+            name = f"{config.host}_{config.port}_{config.db_name}"
+            _budgets[key] = ConnectionBudget(name, config.max_connections)
+        return _budgets[key]
@@ -1,4 +1,5 @@
 import hashlib
+from functools import lru_cache
 from pathlib import Path
 from typing import Sequence, cast
 
@@ -6,7 +7,7 @@ import h5netcdf
 import numpy
 import pandas
 import xarray
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from cdsobs import constants
@@ -74,6 +75,61 @@ def datetime_to_seconds(dates: pandas.Series) -> numpy.ndarray:
     )
 
 
+def seconds_to_datetime(seconds: pandas.Series | numpy.ndarray) -> pandas.DatetimeIndex:
+    """From seconds since a reference time to datetime64, inverse of the above."""
+    ref = pandas.Timestamp(constants.TIME_UNITS_REFERENCE_DATE)
+    return ref + pandas.to_timedelta(numpy.asarray(seconds), unit="s")
+
+
+def gather_categorical(
+    values: numpy.ndarray | pandas.Index,
+    codes: numpy.ndarray,
+    categories: Sequence | None = None,
+) -> pandas.Categorical:
+    """
+    Build a categorical equivalent to values[codes], without the gather.
+
+    Codes equal to -1 and null values are missing values in the output. If categories
+    are not given, the sorted unique values are used.
+    """
+    category_index: pandas.Index
+    if categories is None:
+        value_codes, category_index = pandas.factorize(values, sort=True)
+    else:
+        category_index = pandas.Index(categories)
+        value_codes = category_index.get_indexer(values)
+    # So code -1 is mapped to -1
+    value_codes = numpy.append(value_codes, -1)
+    return pandas.Categorical.from_codes(value_codes[codes], categories=category_index)
+
+
+def map_to_categorical(
+    values: pandas.Series, mapping: dict, categories: Sequence | None = None
+) -> pandas.Series:
+    """
+    Equivalent to values.map(mapping), but returning a categorical.
+
+    The mapping is only applied to the unique values. Passing the categories makes
+    the output of different calls concatenable without losing the categorical dtype.
+    """
+    codes, uniques = pandas.factorize(values)
+    mapped = pandas.Index(uniques).map(mapping)
+    categorical = gather_categorical(mapped, codes, categories)
+    return pandas.Series(categorical, index=values.index, name=values.name)
+
+
+@lru_cache
+def get_engine(url: str, pool_size: int = 5, max_overflow: int = 10) -> Engine:
+    """
+    Return an engine for a database URL, created once per process.
+
+    The engine keeps a pool of connections, so they are reused between queries.
+    """
+    return create_engine(
+        url, pool_pre_ping=True, pool_size=pool_size, max_overflow=max_overflow
+    )  # echo=True for more descriptive logs
+
+
 def get_database_session(url: str) -> Session:
-    engine = create_engine(url)  # echo=True for more descriptive logs
+    engine = get_engine(url)
     return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
@@ -0,0 +1,2 @@
+# Do not change! Do not track in version control!
+__version__ = "0.1.dev1+gbb6a9c00c"
@@ -1,14 +1,19 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
+import pytest
+import sqlalchemy as sa
 from pydantic_extra_types.semantic_version import SemanticVersion
 
 from cdsobs.constants import DEFAULT_VERSION
+from cdsobs.observation_catalogue.migrations import backfill_day_bitmaps
+from cdsobs.observation_catalogue.models import Catalogue
 from cdsobs.observation_catalogue.repositories.catalogue import CatalogueRepository
 from cdsobs.observation_catalogue.repositories.dataset import CadsDatasetRepository
 from cdsobs.observation_catalogue.repositories.dataset_version import (
     CadsDatasetVersionRepository,
 )
 from cdsobs.observation_catalogue.schemas.catalogue import CatalogueSchema
+from cdsobs.retrieve.models import RetrieveParams
 
 test_catalogue_record = CatalogueSchema(
     dataset="test_dataset",
@@ -89,3 +94,113 @@ def test_repos(test_session_pertest):
         "3.0.0",
     )
     assert not entry_not_exists
+
+
+@pytest.mark.parametrize(
+    "param,value,index",
+    [
+        (
+            "time_coverage",
+            (datetime(2022, 1, 1), datetime(2022, 2, 1)),
+            "ix_catalogue_time_coverage",
+        ),
+        ("year", [2022], "ix_catalogue_time_coverage"),
+        ("latitude_coverage", (0, 30), "ix_catalogue_latitude_coverage"),
+        ("longitude_coverage", (0, 30), "ix_catalogue_longitude_coverage"),
+        ("stations", ["test_station"], "ix_catalogue_stations"),
+        ("variables", ["tas"], "ix_catalogue_variables"),
+    ],
+)
+def test_retrieve_filters_use_indexes(test_session_pertest, param, value, index):
+    retrieve_params = RetrieveParams(dataset_source="test_source", **{param: value})
+    # Keep only the filter being tested, the first one is the dataset_source
+    filter_argument = retrieve_params.get_filter_arguments()[1]
+    query = sa.select(Catalogue.asset).filter(filter_argument)
+    connection = test_session_pertest.connection()
+    # The table is empty, so the planner would choose a sequential scan otherwise.
+    connection.exec_driver_sql("SET enable_seqscan = off")
+    compiled = query.compile(dialect=connection.dialect)
+    plan = connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+    assert index in "\n".join(plan.scalars())
+
+
+def test_get_assets_by_filters(test_session_pertest):
+    CadsDatasetRepository(test_session_pertest).create_dataset(
+        test_catalogue_record.dataset
+    )
+    CadsDatasetVersionRepository(test_session_pertest).create_dataset_version(
+        test_catalogue_record.dataset, version=str(test_catalogue_record.version)
+    )
+    catalogue_repo = CatalogueRepository(session=test_session_pertest)
+    catalogue_repo.create(test_catalogue_record)
+    actual = catalogue_repo.get_assets_by_filters(
+        [Catalogue.dataset == test_catalogue_record.dataset], sort=True
+    )
+    assert [tuple(row) for row in actual] == [("path_to_asset", 1)]
+
+
+@pytest.mark.parametrize(
+    "day,expected",
+    [(10, ["path_to_asset"]), (20, []), (None, ["path_to_asset"])],
+)
+def test_station_day_pruning(test_session_pertest, day, expected):
+    CadsDatasetRepository(test_session_pertest).create_dataset(
+        test_catalogue_record.dataset
+    )
+    CadsDatasetVersionRepository(test_session_pertest).create_dataset_version(
+        test_catalogue_record.dataset, version=str(test_catalogue_record.version)
+    )
+    catalogue_repo = CatalogueRepository(session=test_session_pertest)
+    # test_station only has data from the 5th to the 15th
+    station_day_ranges = {"test_station": (date(2022, 1, 5), date(2022, 1, 15))}
+    catalogue_repo.create(
+        test_catalogue_record.model_copy(
+            update=dict(station_day_ranges=station_day_ranges)
+        )
+    )
+    retrieve_params = RetrieveParams(
+        dataset_source=test_catalogue_record.dataset_source,
+        stations=["test_station"],
+        year=[2022],
+        month=[1],
+        day=None if day is None else [day],
+        version=DEFAULT_VERSION,
+    )
+    actual = catalogue_repo.get_assets_by_filters(
+        retrieve_params.get_filter_arguments(dataset=test_catalogue_record.dataset)
+    )
+    assert [row.asset for row in actual] == expected
+
+
+@pytest.mark.parametrize(
+    "day,expected",
+    [([3], ["path_to_asset"]), ([1, 2], []), ([31], []), (None, ["path_to_asset"])],
+)
+def test_day_bitmap_pruning(test_session_pertest, day, expected):
+    CadsDatasetRepository(test_session_pertest).create_dataset(
+        test_catalogue_record.dataset
+    )
+    CadsDatasetVersionRepository(test_session_pertest).create_dataset_version(
+        test_catalogue_record.dataset, version=str(test_catalogue_record.version)
+    )
+    catalogue_repo = CatalogueRepository(session=test_session_pertest)
+    # The entry only has data on the 3rd and the 5th
+    constraints = test_catalogue_record.constraints.model_copy(
+        update=dict(time=[datetime(2022, 1, 3), datetime(2022, 1, 5)])
+    )
+    catalogue_repo.create(
+        test_catalogue_record.model_copy(update=dict(constraints=constraints))
+    )
+    assert backfill_day_bitmaps(test_session_pertest) == 1
+    assert backfill_day_bitmaps(test_session_pertest) == 0
+    retrieve_params = RetrieveParams(
+        dataset_source=test_catalogue_record.dataset_source,
+        year=[2022],
+        month=[1],
+        day=day,
+        version=DEFAULT_VERSION,
+    )
+    actual = catalogue_repo.get_assets_by_filters(
+        retrieve_params.get_filter_arguments(dataset=test_catalogue_record.dataset)
+    )
+    assert [row.asset for row in actual] == expected
@@ -1,8 +1,12 @@
-from datetime import datetime
+from datetime import date, datetime
 
 import pandas as pd
 
-from cdsobs.observation_catalogue.schemas.constraints import ConstraintsSchema
+from cdsobs.observation_catalogue.schemas.constraints import (
+    ConstraintsSchema,
+    get_partition_constraints,
+    get_partition_summary,
+)
 
 
 def test_to_table():
@@ -27,3 +31,60 @@ def from_table():
     assert len(constraints.time) == 1
     assert "tas" in constraints.variable_constraints.keys()
     assert [1] == constraints.variable_constraints["tas"]
+
+
+def test_get_partition_constraints_categorical():
+    data = pd.DataFrame(
+        {
+            "observed_variable": ["tas", "ps", "tas", "tas", None],
+            "primary_station_id": ["8", "7", "7", "8", "7"],
+            "report_timestamp": pd.to_datetime(
+                [
+                    "2022-01-01 10:00",
+                    "2022-01-01 11:00",
+                    "2022-01-02 00:00",
+                    "2022-01-01 12:00",
+                    "2022-01-03 00:00",
+                ]
+            ),
+        }
+    )
+    constraints = get_partition_constraints(data)
+    assert constraints.variable_constraints == {"ps": [0], "tas": [2, 1]}
+    assert len(constraints.time) == 2
+    # Categorical columns are grouped by code and give the same result
+    categorical_data = data.astype(
+        {"observed_variable": "category", "primary_station_id": "category"}
+    )
+    assert get_partition_constraints(categorical_data) == constraints
+
+
+def test_get_partition_summary():
+    data = pd.DataFrame(
+        {
+            "observed_variable": pd.Categorical(
+                ["tas", "tas", "tas"], categories=["ps", "tas"]
+            ),
+            "primary_station_id": ["8", "7", "8"],
+            "report_timestamp": pd.to_datetime(
+                ["2022-01-03 10:00", "2022-01-01 11:00", "2022-01-01 12:00"]
+            ),
+        }
+    )
+    summary = get_partition_summary(data)
+    # ps is a category without observations
+    assert summary.variables == ["tas"]
+    assert summary.variable_counts == {"tas": 3}
+    assert summary.station_day_ranges == {
+        "7": (date(2022, 1, 1), date(2022, 1, 1)),
+        "8": (date(2022, 1, 1), date(2022, 1, 3)),
+    }
+
+
+def test_get_day_bitmap():
+    constraints = ConstraintsSchema(
+        time=["2022-01-04", "2022-01-01", "2021-12-31"], variable_constraints={}
+    )
+    # Days before the start are not in the partition
+    assert constraints.get_day_bitmap(datetime(2022, 1, 1)) == "1001"
+    assert constraints.get_day_bitmap(datetime(2022, 1, 5)) == ""
@@ -0,0 +1,104 @@
+import io
+from pathlib import Path
+
+import h5netcdf
+import numpy
+import pandas
+import pyarrow
+
+from cdsobs import constants
+from cdsobs.ingestion.partition_index import (
+    get_partition_index,
+    read_partition_index,
+    write_partition_index,
+)
+from cdsobs.ingestion.serialize import write_pandas_to_netcdf
+from cdsobs.retrieve.models import RetrieveParams
+from cdsobs.retrieve.stream import stream_retrieve
+from cdsobs.service_definition.service_definition_models import SpaceColumns
+from cdsobs.utils.utils import datetime_to_seconds
+
+
+def write_test_partition(
+    path: Path, stations: list[str], start: str, index: bool = True
+) -> Path:
+    size = len(stations)
+    data = pandas.DataFrame(
+        {
+            "primary_station_id": stations,
+            "observed_variable": numpy.array([85, 58] * (size // 2), dtype="uint8"),
+            "observation_value": numpy.arange(size, dtype="float32"),
+            "latitude": numpy.linspace(0, 10, size),
+            "longitude": numpy.linspace(20, 30, size),
+            "report_timestamp": datetime_to_seconds(
+                pandas.Series(pandas.date_range(start, periods=size, freq="D"))
+            ),
+        }
+    )
+    attrs = dict(
+        observed_variable=dict(labels=["air_temperature", "ozone"], codes=[85, 58]),
+        report_timestamp=dict(units=constants.TIME_UNITS),
+    )
+    write_pandas_to_netcdf(path, data, encoding={}, attrs=attrs)
+    if index:
+        write_partition_index(path, get_partition_index(data))
+    return path
+
+
+def test_stream_retrieve(tmp_path):
+    urls = [
+        str(
+            write_test_partition(Path(tmp_path, "p1.nc"), ["a", "b"] * 5, "2020-01-01")
+        ),
+        str(
+            write_test_partition(
+                Path(tmp_path, "p2.nc"), ["a", "c"] * 5, "2020-02-01", index=False
+            )
+        ),
+    ]
+    params = RetrieveParams(
+        dataset_source="test",
+        stations=["a"],
+        variables=["air_temperature"],
+        year=[2020],
+        day=[1, 3, 5, 7],
+        latitude_coverage=(0, 5),
+    )
+    space_columns = SpaceColumns(x="longitude", y="latitude")
+    variables = ["primary_station_id", "observed_variable", "report_timestamp"]
+    csv = b"".join(stream_retrieve(urls, params, space_columns, variables, "csv"))
+    actual = pandas.read_csv(io.BytesIO(csv))
+    assert actual.columns.tolist() == variables
+    assert actual["primary_station_id"].unique().tolist() == ["a"]
+    assert actual["observed_variable"].unique().tolist() == ["air_temperature"]
+    # Latitude is above 5 from the 6th day on, so day 7 is out of the box
+    assert actual["report_timestamp"].tolist() == [
+        "2020-01-01",
+        "2020-01-03",
+        "2020-01-05",
+        "2020-02-01",
+        "2020-02-03",
+        "2020-02-05",
+    ]
+    arrow = b"".join(stream_retrieve(urls, params, space_columns, variables, "arrow"))
+    table = pyarrow.ipc.open_stream(arrow).read_all()
+    assert table.num_rows == 6
+    assert table.column_names == variables
+
+
+def test_partition_index(tmp_path):
+    path = write_test_partition(
+        Path(tmp_path, "p.nc"), ["a", "b"] * 3 + ["c"] * 4, "2020-01-01"
+    )
+    with h5netcdf.File(path, "r") as incobj:
+        index = read_partition_index(incobj)
+    assert index is not None
+    assert index.stations.tolist() == ["a", "b", "c"]
+    assert index.station_rows.tolist() == [[0, 5], [1, 6], [6, 10]]
+    assert index.variable_counts.tolist() == [5, 5]
+    assert index.get_rows() == slice(0, 10)
+    # Days 3 to 5 of station b
+    day_mask = numpy.isin(index.days.day, [3, 4, 5])
+    assert index.get_rows(day_mask, stations=["b"]) == slice(2, 5)
+    assert index.get_rows(stations=["d"]) == slice(0, 0)
+    assert index.get_rows(variable_codes=[1]) == slice(0, 0)
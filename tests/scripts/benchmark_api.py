@@ -0,0 +1,83 @@
+"""
+Measure the latency of the HTTP API under concurrent load.
+
+Run it against a running app (python cdsobs/api_rest/main.py) before and after a
+change and compare the percentiles, for example:
+
+    python tests/scripts/benchmark_api.py http://localhost:8000 -n 2000 -c 32
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy
+
+DEFAULT_PAYLOAD = {
+    "dataset": "insitu-observations-gnss",
+    "params": {
+        "dataset_source": "IGS_R3",
+        "stations": ["AREQ00PER"],
+        "variables": ["precipitable_water_column"],
+        "year": ["2000"],
+        "month": ["10"],
+        "day": [f"{i:02d}" for i in range(1, 32)],
+        "version": "last",
+        "format": "netCDF",
+    },
+}
+
+
+def run_request(client: httpx.Client, endpoint: str, payload: dict | None) -> float:
+    start = time.perf_counter()
+    if payload is None:
+        response = client.get(endpoint)
+    else:
+        response = client.post(endpoint, json=payload)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("url", help="Base URL of the HTTP API")
+    parser.add_argument("--endpoint", default="/get_object_urls")
+    parser.add_argument(
+        "--payload", help="JSON file with the body, GET is used if 'none'"
+    )
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.payload is None:
+        payload: dict | None = DEFAULT_PAYLOAD
+    elif args.payload == "none":
+        payload = None
+    else:
+        with open(args.payload) as f:
+            payload = json.load(f)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    with httpx.Client(base_url=args.url, limits=limits, timeout=60) as client:
+        # Warm up, so the first connections are not measured
+        run_request(client, args.endpoint, payload)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [
+                executor.submit(run_request, client, args.endpoint, payload)
+                for _ in range(args.requests)
+            ]
+            latencies = numpy.array([f.result() for f in futures]) * 1000
+        elapsed = time.perf_counter() - start
+
+    p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99])
+    print(f"{args.requests} requests to {args.endpoint}, {args.concurrency} threads")
+    print(f"throughput: {args.requests / elapsed:.1f} requests/s")
+    print(f"p50: {p50:.1f} ms  p90: {p90:.1f} ms  p99: {p99:.1f} ms")
+    print(f"max: {latencies.max():.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
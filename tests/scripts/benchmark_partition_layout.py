@@ -0,0 +1,128 @@
+"""
+Compare the retrieval of one station and of one day with the two partition layouts.
+
+A synthetic partition (stations x hours x variables) is written sorted by time
+(the default sort_key) and sorted by station, each one with its partition_index, and
+then read with the streaming retrieve code. The rows in the hyperslab read and the
+time taken are printed for each layout and request.
+
+    python tests/scripts/benchmark_partition_layout.py --stations 300 --days 31
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import h5netcdf
+import numpy
+import pandas
+
+from cdsobs import constants
+from cdsobs.ingestion.partition_index import get_partition_index, write_partition_index
+from cdsobs.ingestion.serialize import write_pandas_to_netcdf
+from cdsobs.netcdf import get_encoding_with_compression
+from cdsobs.retrieve.models import RetrieveParams
+from cdsobs.retrieve.stream import get_index_rows, read_partition_subset
+from cdsobs.service_definition.service_definition_models import SpaceColumns
+from cdsobs.utils.utils import datetime_to_seconds
+
+LAYOUTS = {
+    "time": ["report_timestamp", "latitude", "longitude"],
+    "station": ["primary_station_id", "report_timestamp"],
+}
+VARIABLE_CODES = {"air_temperature": 85, "relative_humidity": 58, "wind_speed": 107}
+
+
+def make_data(num_stations: int, num_days: int) -> pandas.DataFrame:
+    rng = numpy.random.default_rng(0)
+    times = pandas.date_range("2020-01-01", periods=num_days * 24, freq="h")
+    stations = numpy.array([f"STATION{i:05d}" for i in range(num_stations)])
+    lats = rng.uniform(-90, 90, num_stations)
+    lons = rng.uniform(-180, 180, num_stations)
+    station_idx, time_idx, var_idx = numpy.meshgrid(
+        numpy.arange(num_stations),
+        numpy.arange(len(times)),
+        numpy.arange(len(VARIABLE_CODES)),
+        indexing="ij",
+    )
+    station_idx, time_idx, var_idx = (
+        station_idx.ravel(),
+        time_idx.ravel(),
+        var_idx.ravel(),
+    )
+    codes = numpy.array(list(VARIABLE_CODES.values()), dtype="uint8")
+    return pandas.DataFrame(
+        {
+            "primary_station_id": stations[station_idx],
+            "latitude": lats[station_idx],
+            "longitude": lons[station_idx],
+            "report_timestamp": datetime_to_seconds(pandas.Series(times[time_idx])),
+            "observed_variable": codes[var_idx],
+            "observation_value": rng.normal(size=len(station_idx)).astype("float32"),
+        }
+    )
+
+
+def write_layout(data: pandas.DataFrame, sort_key: list[str], path: Path) -> Path:
+    data = data.sort_values(sort_key, kind="mergesort").reset_index(drop=True)
+    attrs = dict(
+        observed_variable=dict(
+            labels=list(VARIABLE_CODES), codes=list(VARIABLE_CODES.values())
+        ),
+        report_timestamp=dict(units=constants.TIME_UNITS),
+    )
+    encoding = get_encoding_with_compression(data, string_transform="str_to_char")
+    write_pandas_to_netcdf(
+        path,
+        data,
+        encoding=encoding,
+        attrs=attrs,
+        global_attrs=dict(sort_key=",".join(sort_key)),
+    )
+    write_partition_index(path, get_partition_index(data))
+    return path
+
+
+def run(path: Path, params: RetrieveParams, repeat: int) -> tuple[int, int, float]:
+    space_columns = SpaceColumns(x="longitude", y="latitude")
+    variables = ["primary_station_id", "report_timestamp", "observation_value"]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with h5netcdf.File(path, "r") as incobj:
+            rows = get_index_rows(incobj, params)
+            data = read_partition_subset(incobj, params, space_columns, variables)
+        timings.append(time.perf_counter() - start)
+    return rows.stop - rows.start, len(data), float(numpy.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = make_data(args.stations, args.days)
+    requests = {
+        "one station": RetrieveParams(
+            dataset_source="benchmark", stations=["STATION00042"]
+        ),
+        "one day": RetrieveParams(dataset_source="benchmark", year=[2020], day=[15]),
+    }
+    print(f"{len(data)} rows, {args.stations} stations, {args.days} days")
+    print(f"{'layout':<10}{'request':<14}{'hyperslab':>12}{'rows':>10}{'ms':>10}")
+    with tempfile.TemporaryDirectory() as tempdir:
+        for layout, sort_key in LAYOUTS.items():
+            path = write_layout(data, sort_key, Path(tempdir, f"{layout}.nc"))
+            for request_name, params in requests.items():
+                hyperslab, num_rows, seconds = run(path, params, args.repeat)
+                print(
+                    f"{layout:<10}{request_name:<14}{hyperslab:>12}{num_rows:>10}"
+                    f"{seconds * 1000:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
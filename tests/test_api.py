@@ -1,11 +1,26 @@
 import os
+from datetime import datetime
 from pathlib import Path
 
+import pandas
 import pytest
 import sqlalchemy as sa
 
-from cdsobs.api import run_ingestion_pipeline, run_make_cdm, set_version_status
+from cdsobs.api import (
+    _filter_by_watermark,
+    _run_ingestion_pipeline_for_time_batch,
+    run_ingestion_pipeline,
+    run_make_cdm,
+    set_version_status,
+)
 from cdsobs.constants import DEFAULT_VERSION
+from cdsobs.ingestion.core import (
+    IngestionRunParams,
+    SpaceBatch,
+    TimeBatch,
+    TimeSpaceBatch,
+)
+from cdsobs.ingestion.partition import merge_partition_data
 from cdsobs.observation_catalogue.models import Catalogue
 from cdsobs.observation_catalogue.repositories.dataset_version import (
     CadsDatasetVersionRepository,
@@ -90,3 +105,63 @@ def test_set_version_status(test_repository):
         dataset_name, version
     )
     assert dataset_version.deprecated
+
+
+def test_watermark_spatial_tiles(mocker, test_config):
+    # Two spatial tiles of the same month, the first one ends later than the second
+    time_batch = TimeBatch(2020, 1)
+    time_space_batches = [
+        TimeSpaceBatch(time_batch, SpaceBatch(-180, 0, -90, 90)),
+        TimeSpaceBatch(time_batch, SpaceBatch(0, 180, -90, 90)),
+    ]
+    last_timestamps = iter([datetime(2020, 1, 31), datetime(2020, 1, 20)])
+    watermarks_used = []
+
+    def run_for_batch(run_params, session, time_space_batch, watermark, timestamps):
+        watermarks_used.append(watermark)
+        timestamps.append(next(last_timestamps))
+
+    mocker.patch("cdsobs.api._run_ingestion_pipeline_for_batch", run_for_batch)
+    watermark_repo = mocker.patch("cdsobs.api.IngestionWatermarkRepository")
+    watermark_repo.return_value.get_watermark.return_value = datetime(2019, 12, 31)
+    run_params = IngestionRunParams(
+        "dataset", "source", DEFAULT_VERSION, test_config, None, True  # type: ignore
+    )
+    session = mocker.Mock()
+    _run_ingestion_pipeline_for_time_batch(run_params, session, time_space_batches)
+    # Both tiles are ingested with the watermark read before the first one
+    assert watermarks_used == [datetime(2019, 12, 31)] * 2
+    watermark_repo.return_value.get_watermark.assert_called_once()
+    watermark_repo.return_value.update_watermark.assert_called_once_with(
+        "dataset", "source", DEFAULT_VERSION, datetime(2020, 1, 31)
+    )
+
+
+def test_watermark_boundary_rows():
+    def make_data(stations: list[str], times: list[str], ids: list[int]):
+        return pandas.DataFrame(
+            {
+                "observation_id": ids,
+                "primary_station_id": stations,
+                "report_timestamp": pandas.to_datetime(times),
+                "observation_value": [float(i) for i in ids],
+            }
+        )
+
+    # The first run stores the data of station a, the watermark is its last time
+    stored_data = make_data(
+        ["a", "a"], ["2020-01-01 00:00", "2020-01-01 12:00"], [1, 2]
+    )
+    watermark = stored_data["report_timestamp"].max().to_pydatetime()
+    # The second run reads the observation of station b at 12:00, which arrived late
+    read_data = make_data(
+        ["a", "a", "b"],
+        ["2020-01-01 00:00", "2020-01-01 12:00", "2020-01-01 12:00"],
+        [1, 2, 3],
+    )
+    new_data = _filter_by_watermark(read_data, watermark)
+    actual = merge_partition_data(stored_data, new_data)
+    assert sorted(actual["observation_id"].tolist()) == [1, 2, 3]
+    assert actual.loc[
+        actual["primary_station_id"] == "b", "report_timestamp"
+    ].tolist() == [pandas.Timestamp(watermark)]
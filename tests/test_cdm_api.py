@@ -8,7 +8,6 @@ from cdsobs.cdm.api import (
     check_cdm_compliance,
     define_units,
     get_cdm_repo_current_tag,
-    read_cdm_code_tables,
 )
 from cdsobs.cdm.tables import read_cdm_tables
 from cdsobs.constants import DEFAULT_VERSION
@@ -33,6 +32,8 @@ def test_check_cdm_compliance(test_config, test_sds, caplog):
     cdm_tables = read_cdm_tables(test_config.cdm_tables_location, available_cdm_tables)
     cdm_fields_mapping = check_cdm_compliance(homogenised_data, cdm_tables)
     assert len(cdm_fields_mapping) > 1
+    # The second time the cached plan is used
+    assert check_cdm_compliance(homogenised_data, cdm_tables) is cdm_fields_mapping
 
 
 def _get_homogenised_data(run_params: IngestionRunParams) -> pandas.DataFrame:
@@ -54,17 +55,12 @@ def test_apply_variable_unit_change(test_config, test_sds):
     )
     homogenised_data = _get_homogenised_data(run_params)
     source_definition = service_definition.sources[source]
-    cdm_code_tables = read_cdm_code_tables(test_config.cdm_tables_location)
-    actual = define_units(
-        homogenised_data, source_definition, cdm_code_tables["observed_variable"]
-    )
+    actual = define_units(homogenised_data, source_definition)
     assert "original_units" in actual and "units" in actual and len(actual) > 0
 
     with pytest.raises(RuntimeError):
         source_definition.descriptions["geopotential_height"].units = "wrong"
-        define_units(
-            homogenised_data, source_definition, cdm_code_tables["observed_variable"]
-        )
+        define_units(homogenised_data, source_definition)
 
 
 def test_cdm_is_tag(test_config):
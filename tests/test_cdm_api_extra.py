@@ -1,3 +1,4 @@
+import numpy
 import pandas as pd
 import pytest
 
@@ -9,7 +10,13 @@ from cdsobs.ingestion.core import (
     PartitionParams,
     TimeBatch,
 )
+from cdsobs.ingestion.serialize import _categorical_to_numpy
 from cdsobs.metadata import get_dataset_metadata
+from cdsobs.service_definition.service_definition_models import (
+    CdmMapping,
+    Description,
+    SourceDefinition,
+)
 
 
 def test_to_cdm_dataset_runtime_error(test_config, test_sds):
@@ -70,7 +77,6 @@ def test_define_units_runtime_error(test_config, test_sds):
     source = "OzoneSonde"
     service_definition = test_sds.get(dataset_name)
     source_definition = service_definition.sources[source]
-    cdm_code_tables = read_cdm_code_tables(test_config.cdm_tables_location)
 
     # Create a dataframe compatible with the function
     # It needs "observed_variable", "observation_value", "units", "original_units"
@@ -101,6 +107,32 @@ def test_define_units_runtime_error(test_config, test_sds):
         with pytest.raises(
             RuntimeError, match="New units set in CDM mapping section must agree"
         ):
-            define_units(data, source_definition, cdm_code_tables["observed_variable"])
+            define_units(data, source_definition)
     finally:
         source_definition.descriptions["geopotential_height"].units = original_units
+
+
+def test_define_units_bytes():
+    source_definition = SourceDefinition(
+        main_variables=["ta", "rh"],
+        cdm_mapping=CdmMapping(),
+        data_table="data",
+        descriptions={
+            "ta": Description(description="Temperature", dtype="float32", units="K"),
+            "rh": Description(description="Relative humidity", dtype="float32"),
+        },
+    )
+    data = pd.DataFrame(
+        {
+            "observed_variable": ["ta", "rh", None],
+            "observation_value": [280.0, 50.0, 1.0],
+        }
+    )
+    actual = define_units(data, source_definition)
+    # The same bytes written when the units columns were object: units not in the
+    # descriptions are "None" and the ones of rows without variable are empty.
+    expected = numpy.array([b"K", b"None", b""])
+    for units_field in ["units", "original_units"]:
+        numpy.testing.assert_array_equal(
+            _categorical_to_numpy(actual[units_field]), expected
+        )
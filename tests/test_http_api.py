@@ -1,7 +1,22 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.requests import Request
 from starlette.testclient import TestClient
 
 from cdsobs.api_rest.app import app
-from cdsobs.api_rest.endpoints import HttpAPISession, session_gen
+from cdsobs.api_rest.cache import TTLCache, cached_json_response, clear_response_cache
+from cdsobs.api_rest.endpoints import (
+    AppResources,
+    AsyncHttpAPISession,
+    HttpAPISession,
+    async_session_gen,
+    get_app_resources,
+    session_gen,
+)
 from cdsobs.cdm.lite import cdm_lite_variables
 from cdsobs.service_definition.api import get_service_definition
 from cdsobs.service_definition.service_definition_models import ServiceDefinition
@@ -9,13 +24,22 @@ from cdsobs.service_definition.service_definition_models import ServiceDefinitio
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+    # The catalogue is different for each test module
+    clear_response_cache()
+
+
 def test_read_main(test_repository, test_config, tmp_path):
-    # We define a test session callable and use it to override session_gen for the test
-    def test_session() -> HttpAPISession:
-        return HttpAPISession(test_config, test_repository.catalogue_repository.session)
+    # get_object_urls is async, so it needs an async session to the test catalogue
+    async def test_session() -> AsyncIterator[AsyncHttpAPISession]:
+        engine = create_async_engine(test_config.catalogue_db.get_async_url())
+        async with AsyncSession(engine) as session:
+            yield AsyncHttpAPISession(test_config, session, test_repository.s3_client)
+        await engine.dispose()
 
     # Note that the  key here is the callable itself, not the callable name.
-    app.dependency_overrides[session_gen] = test_session
+    app.dependency_overrides[async_session_gen] = test_session
 
     payload = {
         "dataset": "insitu-observations-gnss",
@@ -305,3 +329,73 @@ def test_get_form(test_config, test_repository):
     }
 
     assert actual == expected
+
+
+def test_ttl_cache():
+    cache = TTLCache(maxsize=1, ttl=60)
+    assert cache.get_or_set("a", lambda: 1) == 1
+    assert cache.get_or_set("a", lambda: 2) == 1
+    # Evicts "a"
+    assert cache.get_or_set("b", lambda: 3) == 3
+    assert cache.get_or_set("a", lambda: 4) == 4
+    # Nothing is cached if ttl is 0
+    cache = TTLCache(maxsize=1, ttl=0)
+    assert cache.get_or_set("a", lambda: 1) == 1
+    assert cache.get_or_set("a", lambda: 2) == 2
+    # Async values share the same entries
+    cache = TTLCache(maxsize=1, ttl=60)
+
+    async def compute() -> int:
+        return 5
+
+    assert asyncio.run(cache.aget_or_set("a", compute)) == 5
+    assert cache.get_or_set("a", lambda: 6) == 5
+
+
+def test_cached_json_response():
+    calls = []
+
+    def compute() -> list[str]:
+        calls.append(1)
+        return ["OzoneSonde", "TotalOzone"]
+
+    request = Request({"type": "http", "headers": []})
+    response = cached_json_response(request, ("test_sources",), compute)
+    assert response.status_code == 200
+    assert response.body == b'["OzoneSonde","TotalOzone"]'
+    etag = response.headers["etag"]
+    request = Request({"type": "http", "headers": [(b"if-none-match", etag.encode())]})
+    response = cached_json_response(request, ("test_sources",), compute)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert len(calls) == 1
+
+
+def test_get_app_resources(mocker):
+    make_app_resources = mocker.patch(
+        "cdsobs.api_rest.endpoints.make_app_resources", side_effect=lambda: object()
+    )
+    request = Request({"type": "http", "app": app})
+    app.state.resources = None
+    try:
+        resources = get_app_resources(request)
+        assert get_app_resources(request) is resources
+        make_app_resources.assert_called_once()
+    finally:
+        app.state.resources = None
+
+
+def test_http_api_session_s3_client(mocker, test_config):
+    mocker.patch(
+        "cdsobs.api_rest.endpoints.S3Client.from_config",
+        side_effect=lambda s3config: object(),
+    )
+    resources = AppResources(test_config, None, None, None, None)  # type: ignore
+    session = HttpAPISession(test_config, None, resources=resources)  # type: ignore
+    # The client is the one of the thread running the endpoint, not of the thread
+    # that created the session
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        thread_client = executor.submit(session.get_s3_client).result()
+        assert executor.submit(session.get_s3_client).result() is thread_client
+    assert session.get_s3_client() is not thread_client
+    assert session.get_s3_client() is resources.get_s3_client()
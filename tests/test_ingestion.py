@@ -1,8 +1,16 @@
+import dataclasses
+from datetime import datetime
+
+import pandas
 import pytest
 import pytest_mock.plugin
 
+from cdsobs.ingestion.api import sort
+from cdsobs.ingestion.core import SpaceBatch, TimeBatch, TimeSpaceBatch
+from cdsobs.ingestion.journal import get_batch_id
 from cdsobs.ingestion.partition import (
     get_partition_status,
+    merge_partition_data,
     save_partitions,
     upload_partition,
 )
@@ -41,7 +49,10 @@ def test_save_partitions(
         result[0].longitude_coverage_start
         == test_partition.partition_params.longitude_coverage_start
     )
-    assert result[0].variables == test_partition.dataset_metadata.variables
+    # Only the variables in the partition, not all the ones of the source
+    assert result[0].variables == sorted(
+        test_partition.constraints.variable_constraints
+    )
     assert "insitu-observations" in result[0].asset
 
 
@@ -126,3 +137,68 @@ def test_rollback(
     bucket_objects = list(test_s3_client.list_directory_objects(bucket_name))
     assert len(list(bucket_objects)) == 0
     assert len(CatalogueRepository(test_session_pertest).get_all()) == 0
+
+
+def test_merge_partition_data():
+    stored_data = pandas.DataFrame(
+        {"observation_id": [1, 2, 3], "observation_value": [1.0, 2.0, 3.0]}
+    )
+    new_data = pandas.DataFrame(
+        {"observation_id": [3, 4, 4], "observation_value": [30.0, 4.0, 40.0]}
+    )
+    actual = merge_partition_data(stored_data, new_data)
+    assert actual["observation_id"].tolist() == [1, 2, 3, 4]
+    assert actual["observation_value"].tolist() == [1.0, 2.0, 30.0, 40.0]
+
+
+def test_merge_partition_data_generated_observation_id():
+    # Melt numbers the observations of each batch from 0, so the ids of the stored
+    # and the new data overlap but they are different observations.
+    stored_data = pandas.DataFrame(
+        {
+            "observation_id": [0, 1],
+            "primary_station_id": ["a", "a"],
+            "report_timestamp": pandas.to_datetime(["2020-01-01", "2020-01-02"]),
+            "observed_variable": ["ozone", "ozone"],
+            "observation_value": [1.0, 2.0],
+        }
+    )
+    new_data = pandas.DataFrame(
+        {
+            "observation_id": [0, 1],
+            "primary_station_id": ["a", "a"],
+            "report_timestamp": pandas.to_datetime(["2020-01-02", "2020-01-03"]),
+            "observed_variable": ["ozone", "ozone"],
+            "observation_value": [20.0, 3.0],
+        }
+    )
+    actual = merge_partition_data(stored_data, new_data, generated_observation_id=True)
+    assert actual["observation_value"].tolist() == [1.0, 20.0, 3.0]
+    assert actual["observation_id"].tolist() == [0, 1, 2]
+
+
+def test_get_batch_id():
+    time_batch = TimeBatch(2020, 1)
+    assert get_batch_id(TimeSpaceBatch(time_batch)) == "2020-01_global"
+    space_batch = SpaceBatch(-180, -170, 0, 10)
+    watermark = datetime(2020, 1, 15, 12)
+    actual = get_batch_id(TimeSpaceBatch(time_batch, space_batch), watermark)
+    assert actual == "2020-01_-180_-170_0_10_since_20200115T120000"
+
+
+def test_sort_key(test_partition):
+    dataset_metadata = test_partition.dataset_metadata
+    space_columns = dataset_metadata.space_columns
+    assert dataset_metadata.get_sort_key() == [
+        "report_timestamp",
+        space_columns.y,
+        space_columns.x,
+    ]
+    station_layout = dataclasses.replace(
+        test_partition,
+        dataset_metadata=dataclasses.replace(
+            dataset_metadata, sort_key=["primary_station_id", "report_timestamp"]
+        ),
+    )
+    data = sort(station_layout).data
+    assert data["primary_station_id"].is_monotonic_increasing
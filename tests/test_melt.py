@@ -0,0 +1,53 @@
+import numpy
+import pandas
+
+from cdsobs.ingestion.melt import GENERATED_OBSERVATION_ID, melt_variables
+from cdsobs.service_definition.service_definition_models import MeltColumns
+
+
+def test_melt_variables():
+    data = pandas.DataFrame(
+        {
+            "primary_station_id": ["a", "b", "c"],
+            "ta": [280.0, 281.0, 282.0],
+            "rh": [50.0, 60.0, 70.0],
+            "ta_unc": [0.1, numpy.nan, 0.3],
+            "ta_qf": [0, numpy.nan, 1],
+            "rh_pl": [numpy.nan, 2, 2],
+        }
+    )
+    melt_columns = MeltColumns(
+        uncertainty={
+            "random_uncertainty": [
+                dict(name="ta_unc", main_variable="ta", units="K"),
+            ]
+        },
+        quality_flag={"quality_flag": [dict(name="ta_qf", main_variable="ta")]},
+        processing_level={"processing_level": [dict(name="rh_pl", main_variable="rh")]},
+    )
+    uncertainty_type_table = pandas.DataFrame({"name": ["random"]}, index=[1])
+    melted = melt_variables(data, ["ta", "rh"], melt_columns, uncertainty_type_table)
+    assert list(melted.columns) == [
+        "primary_station_id",
+        "observed_variable",
+        "observation_value",
+        "observation_id",
+        "uncertainty_value1",
+        "uncertainty_type1",
+        "uncertainty_units1",
+        "quality_flag",
+        "processing_level",
+    ]
+    assert melted["primary_station_id"].tolist() == ["a", "b", "c"] * 2
+    assert melted["observed_variable"].tolist() == ["ta"] * 3 + ["rh"] * 3
+    assert melted["observation_value"].tolist() == [280, 281, 282, 50, 60, 70]
+    assert melted["observation_id"].tolist() == list(range(6))
+    assert melted.attrs[GENERATED_OBSERVATION_ID]
+    numpy.testing.assert_array_equal(
+        melted["uncertainty_value1"],
+        numpy.array([0.1, numpy.nan, 0.3] + [numpy.nan] * 3, dtype="float32"),
+    )
+    assert melted["uncertainty_type1"].dtype == "uint8"
+    assert melted["uncertainty_units1"].tolist() == ["K"] * 3 + ["NA"] * 3
+    assert melted["quality_flag"].tolist() == [0, 3, 1, 3, 3, 3]
+    assert melted["processing_level"].tolist() == [6, 6, 6, 6, 2, 2]
@@ -1,4 +1,10 @@
-from cdsobs.cdm.api import read_cdm_code_tables
+import os
+import subprocess
+from itertools import chain
+from pathlib import Path
+
+from cdsobs.cdm.api import read_cdm_code_table, read_cdm_code_tables
+from cdsobs.cdm.cache import clear_cdm_cache, get_cdm_revision
 from cdsobs.cdm.tables import read_cdm_tables
 
 
@@ -10,3 +16,64 @@ def test_read_cdm_table(test_config):
 def test_read_cdm_code_tables(test_config):
     cdm_code_table = read_cdm_code_tables(test_config.cdm_tables_location)
     assert len(cdm_code_table) > 0
+
+
+def test_read_cdm_code_table_cached(tmp_path):
+    tables_dir = Path(tmp_path, "cdm-obs", "tables")
+    tables_dir.mkdir(parents=True)
+    table_path = Path(tables_dir, "units.csv")
+    table_path.write_text("unit,abbreviation\n1,m\n")
+    first = read_cdm_code_table(tmp_path, "units")
+    assert read_cdm_code_table(tmp_path, "units") is first
+    # Changes in the table invalidate the cache when the CDM is not in git
+    table_path.write_text("unit,abbreviation\n1,m\n2,s\n")
+    os.utime(table_path, ns=(0, 0))
+    second = read_cdm_code_table(tmp_path, "units")
+    assert second is not first
+    assert len(second.table) == 2
+    clear_cdm_cache()
+    assert read_cdm_code_table(tmp_path, "units") is not second
+
+
+def test_cdm_tables_index(test_config):
+    cdm_tables = read_cdm_tables(test_config.cdm_tables_location)
+    index = cdm_tables.index
+    assert cdm_tables.index is index
+    for fk in cdm_tables.get_foreign_keys_to("header_table"):
+        assert fk.external_table == "header_table"
+        assert fk.local_table in cdm_tables.get_children("header_table")
+    assert cdm_tables.all_foreign_keys == list(
+        chain.from_iterable(t.foreign_keys for t in cdm_tables.values())
+    )
+    # Modifying the tables rebuilds the index
+    del cdm_tables["header_table"]
+    assert cdm_tables.index is not index
+    assert cdm_tables.get_foreign_keys_to("header_table") == ()
+
+
+def test_get_cdm_revision(tmp_path):
+    repo_path = Path(tmp_path, "cdm-obs")
+    table_path = Path(repo_path, "tables", "units.csv")
+    table_path.parent.mkdir(parents=True)
+    table_path.write_text("unit,abbreviation\n1,m\n")
+
+    def git(*args: str):
+        subprocess.run(
+            ["git", "-C", str(repo_path), *args], check=True, capture_output=True
+        )
+
+    assert get_cdm_revision(tmp_path) is None
+    git("init", "-q", "-b", "main")
+    git("add", "-A")
+    git("-c", "user.name=test", "-c", "user.email=test", "commit", "-q", "-m", "1")
+    git("tag", "v1")
+    assert get_cdm_revision(tmp_path) == "v1"
+    # Local changes are detected after the first call
+    table_path.write_text("unit,abbreviation\n1,m\n2,s\n")
+    assert get_cdm_revision(tmp_path) is None
+    # And so are new commits on a branch whose ref is packed
+    git("pack-refs", "--all")
+    git("-c", "user.name=test", "-c", "user.email=test", "commit", "-qam", "2")
+    git("pack-refs", "--all")
+    revision = get_cdm_revision(tmp_path)
+    assert revision is not None and revision.startswith("v1-1-")
@@ -1,11 +1,21 @@
 import os
 from pathlib import Path
 
+import dask
+import numpy
+import pandas
+
 from cdsobs.ingestion.core import SpaceBatch, TimeBatch, TimeSpaceBatch
+from cdsobs.ingestion.readers import cuon
 from cdsobs.ingestion.readers.cuon import (
+    CUONFileandSlices,
+    _compute,
     filter_batch_stations,
+    fix_denormalized_table_file,
     get_cuon_stations,
+    get_worker_pool,
     read_cuon_netcdfs,
+    shutdown_worker_pool,
 )
 
 
@@ -25,6 +35,40 @@ def test_read_cuon(test_config, test_sds):
     assert len(cuon_data) > 1
 
 
+def _get_worker_cdm_keys(task_id: int) -> list:
+    return list(cuon._worker_cdm)
+
+
+def test_worker_pool(test_config, monkeypatch):
+    monkeypatch.delenv("CADSOBS_AVOID_MULTIPROCESS", raising=False)
+    monkeypatch.setenv("CADSOBS_NUM_WORKERS", "2")
+    tables_to_use = ["observations_table"]
+    pool = get_worker_pool(test_config.cdm_tables_location, tables_to_use)
+    try:
+        assert pool is not None
+        # The same pool is reused while the CDM tables do not change
+        assert get_worker_pool(test_config.cdm_tables_location, tables_to_use) is pool
+        tasks = [dask.delayed(_get_worker_cdm_keys)(i) for i in range(4)]
+        results = _compute(tasks, pool)
+        # The workers loaded the CDM tables when they started
+        expected_key = (str(test_config.cdm_tables_location), tuple(tables_to_use))
+        assert results == [[expected_key]] * 4
+        new_pool = get_worker_pool(
+            test_config.cdm_tables_location, ["observations_table", "header_table"]
+        )
+        assert new_pool is not pool
+        # The workers are restarted when the CDM repository changes revision
+        monkeypatch.setattr(cuon, "get_cdm_revision", lambda location: "v2")
+        assert (
+            get_worker_pool(
+                test_config.cdm_tables_location, ["observations_table", "header_table"]
+            )
+            is not new_pool
+        )
+    finally:
+        shutdown_worker_pool()
+
+
 def test_filter_batch_stations(test_config, test_sds):
     dataset_name = "insitu-comprehensive-upper-air-observation-network"
     service_definition = test_sds[dataset_name]
@@ -39,3 +83,37 @@ def test_filter_batch_stations(test_config, test_sds):
     files = [Path(f) for f in station_metadata["file path"].tolist()]
     files_filtered = filter_batch_stations(files, time_space_batch, active_json)
     assert len(files_filtered) == 411
+
+
+def test_fix_denormalized_table_file():
+    observed_variable = numpy.array([0, 117, 138, 34, 106, 85])
+    nrows = len(observed_variable)
+    ones = numpy.ones(nrows, dtype="float32")
+    data = pandas.DataFrame(
+        dict(
+            observed_variable=observed_variable,
+            report_id=numpy.arange(nrows),
+            observation_value=ones,
+            uncertainty_value1=ones,
+            RISE_bias_estimate=ones,
+            humidity_bias_estimate=ones * 2,
+            wind_bias_estimate=ones * 3,
+            units=numpy.zeros(nrows, dtype="int32"),
+            uncertainty_units1=numpy.zeros(nrows, dtype="int32"),
+            record_timestamp=numpy.full(nrows, 86400),
+            report_timestamp=numpy.full(nrows, 86400),
+            date_time=numpy.full(nrows, 86400),
+        )
+    )
+    file_and_slices = CUONFileandSlices(Path("test.nc"), {})
+    result = fix_denormalized_table_file(data, file_and_slices)
+    assert len(result) == nrows - 1
+    assert (result["report_timestamp"] == pandas.Timestamp("1900-01-02")).all()
+    numpy.testing.assert_allclose(
+        result["observation_value"], [1 / 9.80665, 100, 1, 1, 1], rtol=1e-6
+    )
+    numpy.testing.assert_allclose(
+        result["homogenisation_adjustment"], [1, 200, 2, 3, 1]
+    )
+    assert result["units"].tolist() == [631, 300, 0, 0, 0]
+    assert "humidity_bias_estimate" not in result
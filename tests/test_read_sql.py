@@ -0,0 +1,140 @@
+import threading
+from datetime import datetime
+
+import pandas
+import pyarrow
+import pytest
+
+from cdsobs.config import DBConfig
+from cdsobs.ingestion.api import concat_chunks
+from cdsobs.ingestion.readers.sql import (
+    SQLReadOptions,
+    TableSchema,
+    cast_to_right_types,
+    clear_schema_cache,
+    get_cast_plan,
+    get_joined_query,
+    record_batch_to_pandas,
+    split_time_range,
+)
+from cdsobs.service_definition.service_definition_models import SourceDefinition
+from cdsobs.utils.connection_budget import ConnectionBudget
+
+
+def test_record_batch_to_pandas():
+    record_batch = pyarrow.record_batch(
+        {
+            "id": pyarrow.array([1, 2, None], type=pyarrow.int32()),
+            "report_timestamp": pyarrow.array(
+                [0, 3600, 7200], type=pyarrow.timestamp("us", tz="UTC")
+            ),
+            "value": pyarrow.array([1.0, None, 3.0], type=pyarrow.float32()),
+        }
+    )
+    chunk = record_batch_to_pandas(record_batch)
+    assert str(chunk["id"].dtype) == "Int64"
+    assert chunk["report_timestamp"].dt.tz is None
+    cast_plan = {"id": "int64", "report_timestamp": "datetime64[ns]"}
+    chunk = cast_to_right_types(chunk.drop(columns="value"), cast_plan)
+    assert chunk["id"].tolist() == [1, 2, -9999]
+    assert str(chunk["report_timestamp"].dtype) == "datetime64[ns]"
+
+
+def test_concat_chunks():
+    chunks = [
+        pandas.DataFrame({"units": pandas.Categorical(["K", "K"]), "value": [1, 2]}),
+        pandas.DataFrame({"units": pandas.Categorical(["Pa"]), "value": [3]}),
+    ]
+    data = concat_chunks(iter(chunks))
+    assert isinstance(data["units"].dtype, pandas.CategoricalDtype)
+    assert data["units"].tolist() == ["K", "K", "Pa"]
+    assert data.index.tolist() == [0, 1, 2]
+
+
+def test_split_time_range():
+    start, end = datetime(2000, 2, 1), datetime(2000, 3, 1)
+    ranges = split_time_range(start, end, 3)
+    assert len(ranges) == 3
+    assert ranges[0][0] == start
+    assert ranges[-1][1] == end
+    for (_, range_end), (next_range_start, _) in zip(ranges[:-1], ranges[1:]):
+        assert range_end == next_range_start
+    assert split_time_range(start, end, 1) == [(start, end)]
+
+
+@pytest.mark.parametrize("use_lock_files", [False, True])
+def test_connection_budget(tmp_path, monkeypatch, use_lock_files):
+    if use_lock_files:
+        monkeypatch.setenv("CADSOBS_CONNECTION_LOCKS_DIR", str(tmp_path))
+    budget = ConnectionBudget("test", max_connections=3)
+    budget.poll_interval = 0.01
+    result = []
+
+    def take_one():
+        with budget.acquire(1) as acquired:
+            result.append(acquired)
+
+    with budget.acquire(2) as acquired:
+        assert acquired == 2
+        # Only the free permits are given
+        with budget.acquire(2) as acquired_after:
+            assert acquired_after == 1
+            # This waits until a permit is released
+            thread = threading.Thread(target=take_one)
+            thread.start()
+            thread.join(timeout=0.1)
+            assert thread.is_alive()
+        thread.join(timeout=5)
+        assert result == [1]
+
+
+def test_get_cast_plan(mocker):
+    schemas = {
+        "header": TableSchema(("report_id", "value"), ("integer", "real")),
+        "data": TableSchema(("id", "value"), ("bigint", "double precision")),
+    }
+    get_table_schema = mocker.patch(
+        "cdsobs.ingestion.readers.sql._get_table_schema",
+        side_effect=lambda db_url, table_name: schemas[table_name],
+    )
+    clear_schema_cache()
+    config = DBConfig(db_user="u", pwd="p", host="h", port=5432, db_name="db")
+    cast_plan = get_cast_plan(config, "data", "header")
+    # The header data type is used for columns in both tables
+    assert cast_plan == {"id": "int64", "report_id": "int64", "value": "float32"}
+    # Computed only once
+    assert get_cast_plan(config, "data", "header") is cast_plan
+    assert get_table_schema.call_count == 2
+    clear_schema_cache()
+
+
+def test_get_joined_query():
+    source_definition = SourceDefinition(
+        main_variables=["air_temperature"],
+        cdm_mapping=dict(
+            rename={"station": "primary_station_id", "t": "air_temperature"}
+        ),
+        header_columns=["primary_station_id"],
+        header_table="header",
+        data_table="data",
+        join_ids=dict(header="hid", data="report"),
+        descriptions={
+            "air_temperature": dict(description="Temperature", dtype="float32"),
+            "primary_station_id": dict(description="Station", dtype="object"),
+        },
+    )
+    read_options = SQLReadOptions(
+        header_fields=["hid", "station", "date_of_observation"],
+        data_fields=["id", "report", "date_of_observation", "t", "time"],
+        server_side_join=True,
+    )
+    start, end = datetime(2000, 1, 1), datetime(2000, 2, 1)
+    querystr, time_field = get_joined_query(
+        source_definition, read_options, "time", False, True, start, end
+    )
+    assert querystr == (
+        "SELECT h.hid AS report_id, h.station, h.date_of_observation, "
+        "d.id AS observation_id, d.t, d.time FROM data d "
+        "INNER JOIN header h ON d.report=h.hid"
+    )
+    assert time_field == "d.time"
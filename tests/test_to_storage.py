@@ -1,6 +1,18 @@
+from pathlib import Path
+
+import numpy
+import pandas
+
+from cdsobs import constants
 from cdsobs.cdm.api import to_cdm_dataset
 from cdsobs.cdm.tables import read_cdm_tables
-from cdsobs.ingestion.serialize import to_netcdf, to_storage
+from cdsobs.ingestion.serialize import (
+    read_partition_file,
+    to_netcdf,
+    to_storage,
+    write_pandas_to_netcdf,
+)
+from cdsobs.utils.utils import datetime_to_seconds
 
 
 def test_to_storage(tmp_path, test_partition, test_s3_client, test_config):
@@ -14,3 +26,38 @@ def test_to_storage(tmp_path, test_partition, test_s3_client, test_config):
         "insitu-observations-woudc-ozone-total-column-and-profiles_1.0.0_OzoneSonde_1969_0.0_0.0.nc"
     )
     assert actual == expected
+
+
+def test_read_partition_file(tmp_path):
+    data = pandas.DataFrame(
+        {
+            "observation_id": numpy.arange(3),
+            "primary_station_id": pandas.Categorical(["a", "bb", "a"]),
+            "station_name": ["Zürich", "Lund", "Lund"],
+            "observed_variable": numpy.array([85, 58, 85], dtype="uint8"),
+            "observation_value": [1.5, numpy.nan, 3.0],
+            "report_timestamp": datetime_to_seconds(
+                pandas.Series(pandas.date_range("2020-01-01", periods=3, freq="h"))
+            ),
+        }
+    )
+    attrs = dict(
+        observed_variable=dict(labels=["air_temperature", "ozone"], codes=[85, 58]),
+        report_timestamp=dict(units=constants.TIME_UNITS),
+    )
+    ofile = Path(tmp_path, "partition.nc")
+    write_pandas_to_netcdf(ofile, data, encoding={}, attrs=attrs)
+    actual = read_partition_file(ofile)
+    assert actual["primary_station_id"].tolist() == ["a", "bb", "a"]
+    assert actual["station_name"].tolist() == ["Zürich", "Lund", "Lund"]
+    assert actual["observed_variable"].tolist() == [
+        "air_temperature",
+        "ozone",
+        "air_temperature",
+    ]
+    assert actual["report_timestamp"].tolist() == list(
+        pandas.date_range("2020-01-01", periods=3, freq="h")
+    )
+    numpy.testing.assert_array_equal(
+        actual["observation_value"], data["observation_value"]
+    )